@@ -1,14 +1,28 @@
 import pygame
+import os
 import sys
 import random
 import math
+import time
+import heapq
+import itertools
+from collections import namedtuple
 
-# Initialize Pygame
-pygame.init()
+from events import DEATH, KILL, LEVEL_UP, MULTIPLIER, PICKUP, EventLog
+from governor import FULL_QUALITY, QualityGovernor
+from particles import ParticleSystem
+
+# Pygame subsystems are started in startup(), only the ones the window
+# needs; headless worlds (server, bots, tools) need none of them
 
 # Constants
 SCREEN_WIDTH = 800
 SCREEN_HEIGHT = 600
+WORLD_WIDTH = SCREEN_WIDTH * 4  # The arena scrolls; snapshots allow up to 8191
+WORLD_HEIGHT = SCREEN_HEIGHT
+WORLD_RECT = pygame.Rect(0, 0, WORLD_WIDTH, WORLD_HEIGHT)
+CHUNK_SIZE = 400  # Side of the square chunks the arena is divided into for culling
+FAR_UPDATE_INTERVAL = 4  # Ticks between updates of enemies well outside the view
 WHITE = (255, 255, 255)
 BLACK = (0, 0, 0)
 RED = (255, 0, 0)
@@ -18,6 +32,7 @@ GREEN = (0, 255, 0)
 GOLD = (255, 215, 0)
 PLAYER_WIDTH = 50
 PLAYER_HEIGHT = 50
+PARTNER_COLOR = PURPLE  # Every player but the first, in co-op
 PLAYER_SPEED = 6
 GRAVITY = 0.5
 MAX_JUMP = 2
@@ -28,22 +43,307 @@ ENEMY_SPEED = 3
 BULLET_WIDTH = 8
 BULLET_HEIGHT = 8
 BULLET_SPEED = 12
-MAX_ENEMIES = 5
+MAX_ENEMIES = 5  # Wave size at level 1
+ENEMIES_PER_LEVEL = 1  # Waves grow by these each level up to the knees,
+SPEED_PER_LEVEL = 0.5  # then ease towards the limits, starting at the same rate
+WAVE_SIZE_KNEE = 10
+WAVE_SPEED_KNEE = 7
+MAX_WAVE_SIZE = 30
+MAX_WAVE_SPEED = 10
+SPAWNS_PER_TICK = 2
+PREWARM_BUDGET = 1.0  # Milliseconds per quiet tick spent making enemies ahead of time
 POWERUP_SIZE = 20
+POWERUP_CHANCE = 0.02  # Chance of a power-up appearing each tick
 POWERUP_DURATION = 5000  # 5 seconds in milliseconds
+COMBO_WINDOW = 2000  # Milliseconds after a hit before the multiplier resets
+BEHAVIOR_PERIOD = 3000  # Milliseconds between enemy behavior changes
+BEHAVIORS = ["chase", "circle", "zigzag"]  # Saved files and snapshots store the index
+POWERUP_TYPES = ["rapid_fire", "shield", "multiplier"]
+SHOT_DELAY = 250  # Milliseconds between shots
+FPS = 60
+AUTOSAVE_INTERVAL = 10000  # Milliseconds between checkpoints
+
+# Files the game makes for itself go in the user's cache and data directories
+CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+                         "bulletstorm-blitz")
+DATA_DIR = os.path.join(os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share"),
+                        "bulletstorm-blitz")
+ASSET_BUNDLE = os.path.join(CACHE_DIR, "assets.bundle")
+HIGH_SCORES = os.path.join(DATA_DIR, "highscores.db")
+
+# One tick's worth of player input
+Controls = namedtuple("Controls", ["left", "right", "jump", "shoot"], defaults=[False] * 4)
+NO_INPUT = Controls()
+
+# Everything needed to recreate a World exactly, as plain data. net_ids
+# holds the snapshot.py ids of the enemies, bullets and powerups (None for
+# those never sent), so that a restore keeps them.
+WorldState = namedtuple("WorldState", ["time", "last_shot_time", "rng", "player",
+                                       "enemies", "bullets", "powerups", "platforms",
+                                       "pending_spawns", "partners", "net_ids"],
+                        defaults=[0, (), ()])
+# Everything one frame draws, already culled and in screen coordinates. It
+# shares nothing the simulation changes, so it can be drawn on another thread.
+RenderState = namedtuple("RenderState", ["time", "offset", "platforms", "powerups", "player",
+                                         "enemies", "bullets", "particles", "score", "level",
+                                         "high_score", "multiplier", "rapid_fire", "shield",
+                                         "partners"], defaults=[()])
+# Player attributes saved in WorldState.player, after its x and y. The
+# other players of a co-op world are saved in WorldState.partners, each
+# as x, y, last_shot_time and then these.
+PLAYER_FIELDS = ("vel_y", "on_ground", "jumps", "score", "high_score", "level",
+                 "rapid_fire", "rapid_fire_timer", "shield", "shield_timer",
+                 "multiplier", "combo_timer")
+
+# Timers: callbacks kept in a heap by deadline, in world milliseconds, so a
+# tick only does work for the timers that are due. They run on World.time,
+# which stands still while the game is paused, so pausing freezes them all.
+class Timers:
+    def __init__(self):
+        self.heap = []
+        self.counter = itertools.count()  # Keeps equal deadlines in schedule order
+
+    def __len__(self):
+        return len(self.heap)
+
+    def schedule(self, deadline, callback, *args):
+        """Call callback(*args) on the first run() after deadline. Returns a
+        handle for cancel()."""
+        entry = [deadline, next(self.counter), callback, args]
+        heapq.heappush(self.heap, entry)
+        return entry
+
+    def cancel(self, entry):
+        entry[2] = None  # Dropped when it reaches the top of the heap
+
+    def clear(self):
+        self.heap = []
+
+    def run(self, now):
+        heap = self.heap
+        while heap and heap[0][0] < now:
+            _, _, callback, args = heapq.heappop(heap)
+            if callback is not None:
+                callback(*args)
+
+# Sprite images are plain filled rectangles, so every sprite of a kind
+# shares one surface; assets.load_bundle can fill this cache ahead of time
+_images = {}
+
+def solid_image(width, height, color):
+    key = (width, height, color)
+    image = _images.get(key)
+    if image is None:
+        image = _images[key] = pygame.Surface((width, height))
+        image.fill(color)
+    return image
+
+# Sprite group kept as a plain list of its members, in the order they joined.
+# It takes the place of pygame.sprite.Group: sprites join it with add() and
+# leave it with kill() as usual, and spritecollideany() works on it.
+# kill() only marks the sprite (alive() is False straight away); the dead
+# are taken out together, keeping everyone else in order, the next time
+# the group is read. Until then nothing moves, so sprites can be killed
+# freely while the group is being iterated, without copying it first.
+# remove() takes a sprite out at once, moving the last one into its place.
+class ArrayGroup:
+    _spritegroup = True  # Lets Sprite.add() and Sprite.kill() use this as a group
+
+    def __init__(self, *sprites):
+        self._sprites = []
+        self._members = set()
+        self._dead = set()
+        self._index = None  # Sprite -> position in _sprites, made when remove() needs it
+        self.add(*sprites)
+
+    def flush(self):
+        """Take out the sprites killed since the last flush."""
+        dead = self._dead
+        if dead:
+            self._sprites = list(itertools.filterfalse(dead.__contains__, self._sprites))
+            self._members -= dead
+            self._dead = set()
+            self._index = None
+
+    def __iter__(self):
+        self.flush()
+        return iter(self._sprites)
+
+    def __len__(self):
+        return len(self._members) - len(self._dead)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __contains__(self, sprite):
+        return sprite in self._members and sprite not in self._dead
+
+    has_internal = __contains__
+
+    def sprites(self):
+        self.flush()
+        return list(self._sprites)
+
+    def add_internal(self, sprite):
+        if sprite in self._dead:
+            self._dead.discard(sprite)  # Killed and added back before a flush
+        elif sprite not in self._members:
+            self._members.add(sprite)
+            if self._index is not None:
+                self._index[sprite] = len(self._sprites)
+            self._sprites.append(sprite)
+
+    def remove_internal(self, sprite):
+        if sprite in self._members:
+            self._dead.add(sprite)
+
+    def add(self, *sprites):
+        for sprite in sprites:
+            if isinstance(sprite, pygame.sprite.Sprite):
+                if sprite not in self._members or sprite in self._dead:
+                    self.add_internal(sprite)
+                    sprite.add_internal(self)
+            else:
+                self.add(*sprite)
+
+    def remove(self, *sprites):
+        for sprite in sprites:
+            if not isinstance(sprite, pygame.sprite.Sprite):
+                self.remove(*sprite)
+            elif sprite in self:
+                sprite.remove_internal(self)
+                self._members.discard(sprite)
+                if self._index is None:
+                    self._index = {s: i for i, s in enumerate(self._sprites)}
+                position = self._index.pop(sprite)
+                last = self._sprites.pop()
+                if last is not sprite:
+                    self._sprites[position] = last
+                    self._index[last] = position
+
+    def empty(self):
+        for sprite in self._sprites:
+            if sprite not in self._dead:
+                sprite.remove_internal(self)
+        self._sprites = []
+        self._members = set()
+        self._dead = set()
+        self._index = None
+
+    def update(self, *args):
+        for sprite in self:
+            sprite.update(*args)
+
+    def draw(self, surface):
+        surface.blits([(s.image, s.rect) for s in self], doreturn=False)
+
+# The columns of chunks the left edge of a sprite up to reach wide must
+# lie in for it to overlap rect (the arena is one chunk row or two tall,
+# so columns are as fine as chunks need to be)
+def chunk_columns(rect, reach=0):
+    return range((rect.left - reach) // CHUNK_SIZE, (rect.right - 1) // CHUNK_SIZE + 1)
+
+# ArrayGroup that also buckets its sprites by the column of chunks their
+# rect's left edge is in, so what is near a view can be found without
+# looking at everything else. update() rebuckets the sprites it moves;
+# code that moves them any other way passes them to moved() after.
+class ChunkedGroup(ArrayGroup):
+    def __init__(self, *sprites):
+        self.columns = {}   # Column -> {sprite: None}, in the order they got there
+        self._column = {}   # Sprite -> its column
+        self._rank = {}     # Sprite -> a number that sorts in group order
+        self._next_rank = 0
+        super().__init__(*sprites)
+
+    def _place(self, sprite, column):
+        self._column[sprite] = column
+        self.columns.setdefault(column, {})[sprite] = None
+
+    def _unplace(self, sprite):
+        column = self._column.pop(sprite)
+        bucket = self.columns[column]
+        del bucket[sprite]
+        if not bucket:
+            del self.columns[column]
+
+    def flush(self):
+        for sprite in self._dead:
+            self._unplace(sprite)
+            del self._rank[sprite]
+        super().flush()
 
-# Create the game window
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-pygame.display.set_caption("Bulletstorm Blitz")
+    def add_internal(self, sprite):
+        joining = sprite not in self._members
+        super().add_internal(sprite)
+        if joining:
+            self._rank[sprite] = self._next_rank
+            self._next_rank += 1
+            self._place(sprite, sprite.rect.x // CHUNK_SIZE)
+
+    def remove(self, *sprites):
+        for sprite in sprites:
+            if not isinstance(sprite, pygame.sprite.Sprite):
+                self.remove(*sprite)
+            elif sprite in self:
+                # The last sprite takes this one's place, and with it its rank
+                last = self._sprites[-1]
+                rank = self._rank.pop(sprite)
+                super().remove(sprite)
+                self._unplace(sprite)
+                if last is not sprite:
+                    self._rank[last] = rank
+
+    def empty(self):
+        super().empty()
+        self.columns = {}
+        self._column = {}
+        self._rank = {}
+
+    def update(self, *args):
+        sprites = self.sprites()
+        for sprite in sprites:
+            sprite.update(*args)
+        self.moved(sprites)
+
+    def moved(self, sprites):
+        """Rebucket sprites whose rects may have moved."""
+        column = self._column
+        for sprite in sprites:
+            new = sprite.rect.x // CHUNK_SIZE
+            if new != column[sprite]:
+                self._unplace(sprite)
+                self._place(sprite, new)
+
+    def sprites_in(self, columns):
+        """Return the living sprites in the given columns, in group order."""
+        buckets = [bucket for bucket in map(self.columns.get, columns) if bucket]
+        count = sum(map(len, buckets))
+        if count * 2 > len(self._sprites):
+            # Most of the group: picking them out in order beats sorting
+            column = self._column
+            wanted = set(columns)
+            return [s for s in self if column[s] in wanted]
+        found = []
+        dead = self._dead
+        for bucket in buckets:
+            found.extend(bucket if not dead else [s for s in bucket if s not in dead])
+        found.sort(key=self._rank.__getitem__)
+        return found
+
+    def sprites_near(self, rect, reach):
+        """Return the living sprites up to reach wide that may overlap rect,
+        in group order."""
+        return self.sprites_in(chunk_columns(rect, reach))
 
 # Player class
 class Player(pygame.sprite.Sprite):
-    def __init__(self):
+    def __init__(self, color=RED):
         super().__init__()
-        self.image = pygame.Surface((PLAYER_WIDTH, PLAYER_HEIGHT))
-        self.image.fill(RED)
+        self.image = solid_image(PLAYER_WIDTH, PLAYER_HEIGHT, color)
         self.rect = self.image.get_rect()
-        self.rect.center = (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2)
+        self.rect.center = (WORLD_WIDTH // 2, WORLD_HEIGHT // 2)
+        # Position is kept in floats; the rect follows it, rounded to pixels
+        self.x, self.y = float(self.rect.x), float(self.rect.y)
         self.vel_y = 0
         self.on_ground = False
         self.jumps = 0
@@ -56,11 +356,13 @@ class Player(pygame.sprite.Sprite):
         self.shield_timer = 0
         self.multiplier = 1
         self.combo_timer = 0
+        self.last_shot_time = 0
 
-    def update(self, platforms):
+    def update(self, platforms, controls):
         # Apply gravity
         self.vel_y += GRAVITY
-        self.rect.y += self.vel_y
+        self.y += self.vel_y
+        self.rect.y = round(self.y)
 
         # Check for collisions with platforms
         self.on_ground = False
@@ -74,29 +376,25 @@ class Player(pygame.sprite.Sprite):
                 elif self.vel_y < 0:
                     self.rect.top = platform.rect.bottom
                     self.vel_y = 0
+                self.y = float(self.rect.y)
 
         # Handle player movement
-        keys = pygame.key.get_pressed()
-        if keys[pygame.K_LEFT] and self.rect.left > 0:
-            self.rect.x -= PLAYER_SPEED
-        if keys[pygame.K_RIGHT] and self.rect.right < SCREEN_WIDTH:
-            self.rect.x += PLAYER_SPEED
-        if keys[pygame.K_UP] and (self.on_ground or self.jumps < MAX_JUMP):
+        if controls.left and self.rect.left > 0:
+            self.x -= PLAYER_SPEED
+            self.rect.x = round(self.x)
+        if controls.right and self.rect.right < WORLD_WIDTH:
+            self.x += PLAYER_SPEED
+            self.rect.x = round(self.x)
+        if controls.jump and (self.on_ground or self.jumps < MAX_JUMP):
             self.vel_y = -12
             self.jumps += 1
+        # Power-ups and the combo multiplier run out on World.timers
 
-        # Update power-up timers
-        current_time = pygame.time.get_ticks()
-        if self.rapid_fire and current_time > self.rapid_fire_timer:
-            self.rapid_fire = False
-        if self.shield and current_time > self.shield_timer:
-            self.shield = False
-        
-        # Update combo multiplier
-        if current_time > self.combo_timer:
-            self.multiplier = 1
-
-    def shoot(self):
+    def move_to(self, x, y):
+        self.x, self.y = float(x), float(y)
+        self.rect.topleft = (round(x), round(y))
+
+    def shoot(self, enemies):
         if self.rapid_fire:
             bullet_count = 3
             spread = 15
@@ -107,95 +405,200 @@ class Player(pygame.sprite.Sprite):
         bullets = []
         for i in range(bullet_count):
             angle_offset = (i - (bullet_count-1)/2) * spread
-            bullet = Bullet(self.rect.centerx, self.rect.centery, angle_offset)
+            bullet = Bullet(self.x + PLAYER_WIDTH / 2, self.y + PLAYER_HEIGHT / 2, enemies, angle_offset)
             bullets.append(bullet)
-        
+
         return bullets
 
 # Enemy class with improved AI
 class Enemy(pygame.sprite.Sprite):
-    def __init__(self, player):
+    def __init__(self, player, rng, current_time, spawn=True, timers=None):
         super().__init__()
-        self.image = pygame.Surface((ENEMY_WIDTH, ENEMY_HEIGHT))
-        self.image.fill(BLACK)
+        self.image = solid_image(ENEMY_WIDTH, ENEMY_HEIGHT, BLACK)
         self.rect = self.image.get_rect()
-        self.spawn_position()
+        self.rng = rng
         self.player = player
+        # Behavior changes are driven by these Timers; without any, it never changes
+        self.timers = timers
+        self.timer = None
+        self.behavior_due = False
+        self.speed = ENEMY_INITIAL_SPEED
+        self.behavior_timer = current_time
+        self.behavior = "chase"
+        # Without spawn the enemy is only allocated, and reset() places it later
+        if spawn:
+            self.spawn_position()
+            self.schedule_behavior_change()
+        else:
+            self.x, self.y = 0.0, 0.0
+
+    def reset(self, current_time):
+        self.spawn_position()
         self.speed = ENEMY_INITIAL_SPEED
-        self.behavior_timer = pygame.time.get_ticks()
+        self.behavior_timer = current_time
         self.behavior = "chase"
+        self.schedule_behavior_change()
+
+    def schedule_behavior_change(self):
+        self.behavior_due = False
+        if self.timers is not None:
+            if self.timer is not None:
+                self.timers.cancel(self.timer)
+            self.timer = self.timers.schedule(self.behavior_timer + BEHAVIOR_PERIOD,
+                                              self.behavior_expired)
+
+    def behavior_expired(self):
+        # Only flag it: the new behavior is picked in update(), so enemies
+        # draw from the rng in group order whatever order their timers fire in
+        self.behavior_due = True
+        self.timer = None
 
     def spawn_position(self):
-        side = random.choice(["top", "right", "bottom", "left"])
+        # Just outside the part of the world the player can see
+        view = view_rect(self.player.rect.center)
+        side = self.rng.choice(["top", "right", "bottom", "left"])
         if side == "top":
-            self.rect.x = random.randint(0, SCREEN_WIDTH - ENEMY_WIDTH)
-            self.rect.y = -ENEMY_HEIGHT
+            self.rect.x = self.rng.randint(view.left, view.right - ENEMY_WIDTH)
+            self.rect.y = view.top - ENEMY_HEIGHT
         elif side == "right":
-            self.rect.x = SCREEN_WIDTH
-            self.rect.y = random.randint(0, SCREEN_HEIGHT - ENEMY_HEIGHT)
+            self.rect.x = view.right
+            self.rect.y = self.rng.randint(view.top, view.bottom - ENEMY_HEIGHT)
         elif side == "bottom":
-            self.rect.x = random.randint(0, SCREEN_WIDTH - ENEMY_WIDTH)
-            self.rect.y = SCREEN_HEIGHT
+            self.rect.x = self.rng.randint(view.left, view.right - ENEMY_WIDTH)
+            self.rect.y = view.bottom
         else:
-            self.rect.x = -ENEMY_WIDTH
-            self.rect.y = random.randint(0, SCREEN_HEIGHT - ENEMY_HEIGHT)
+            self.rect.x = view.left - ENEMY_WIDTH
+            self.rect.y = self.rng.randint(view.top, view.bottom - ENEMY_HEIGHT)
+        self.x, self.y = float(self.rect.x), float(self.rect.y)
 
-    def update(self):
-        current_time = pygame.time.get_ticks()
-        
+    def update(self, current_time, ticks=1):
+        # ticks > 1 moves the enemy as far as that many ticks would
         # Change behavior every 3 seconds
-        if current_time - self.behavior_timer > 3000:
-            self.behavior = random.choice(["chase", "circle", "zigzag"])
+        if self.behavior_due:
+            self.behavior = self.rng.choice(BEHAVIORS)
             self.behavior_timer = current_time
+            self.schedule_behavior_change()
 
         if self.behavior == "chase":
-            self.chase_player()
+            self.chase_player(ticks)
         elif self.behavior == "circle":
-            self.circle_player()
+            self.circle_player(current_time)
         elif self.behavior == "zigzag":
-            self.zigzag_movement()
+            self.zigzag_movement(current_time, ticks)
+        self.rect.topleft = (round(self.x), round(self.y))
 
-    def chase_player(self):
-        dx = self.player.rect.centerx - self.rect.centerx
-        dy = self.player.rect.centery - self.rect.centery
+    def chase_player(self, ticks=1):
+        dx = (self.player.x + PLAYER_WIDTH / 2) - (self.x + ENEMY_WIDTH / 2)
+        dy = (self.player.y + PLAYER_HEIGHT / 2) - (self.y + ENEMY_HEIGHT / 2)
         dist = math.sqrt(dx * dx + dy * dy)
         if dist != 0:
-            self.rect.x += (dx / dist) * self.speed
-            self.rect.y += (dy / dist) * self.speed
+            self.x += (dx / dist) * self.speed * ticks
+            self.y += (dy / dist) * self.speed * ticks
 
-    def circle_player(self):
-        angle = pygame.time.get_ticks() / 500  # Rotation speed
+    def circle_player(self, current_time):
+        angle = current_time / 500  # Rotation speed
         radius = 100  # Circle radius
-        self.rect.x = self.player.rect.centerx + math.cos(angle) * radius - ENEMY_WIDTH/2
-        self.rect.y = self.player.rect.centery + math.sin(angle) * radius - ENEMY_HEIGHT/2
+        self.x = self.player.x + PLAYER_WIDTH / 2 + math.cos(angle) * radius - ENEMY_WIDTH/2
+        self.y = self.player.y + PLAYER_HEIGHT / 2 + math.sin(angle) * radius - ENEMY_HEIGHT/2
+
+    def zigzag_movement(self, current_time, ticks=1):
+        self.chase_player(ticks)
+        self.x += math.sin(current_time / 200) * 5 * ticks
+
+# The screen-sized part of the world a camera centred on center would show
+def view_rect(center):
+    view = pygame.Rect(0, 0, SCREEN_WIDTH, SCREEN_HEIGHT)
+    view.center = center
+    return view.clamp(WORLD_RECT)
+
+# The player an enemy goes after in co-op: whoever is nearest, first on ties
+def nearest_player(players, enemy):
+    x, y = enemy.x - PLAYER_WIDTH / 2 + ENEMY_WIDTH / 2, enemy.y - PLAYER_HEIGHT / 2 + ENEMY_HEIGHT / 2
+    return min(players, key=lambda p: (p.x - x) ** 2 + (p.y - y) ** 2)
+
+# Camera: follows the player and maps world positions to the screen
+class Camera:
+    def __init__(self):
+        self.rect = pygame.Rect(0, 0, SCREEN_WIDTH, SCREEN_HEIGHT)
+
+    def follow(self, sprite):
+        self.rect = view_rect(sprite.rect.center)
+
+    def visible(self, sprites):
+        """Return (image, screen position) pairs for the sprites in view, for Surface.blits."""
+        view = self.rect
+        colliderect = view.colliderect
+        return [(s.image, s.rect.move(-view.x, -view.y)) for s in sprites if colliderect(s.rect)]
 
-    def zigzag_movement(self):
-        self.chase_player()
-        self.rect.x += math.sin(pygame.time.get_ticks() / 200) * 5
+# Sprites bucketed by the grid cells their rects touch: the broadphase for
+# swept collisions, and the arena's chunks for culling what gets drawn
+class CollisionGrid:
+    def __init__(self, sprites, cell_size=64):
+        self.cell_size = cell_size
+        self.cells = {}
+        for sprite in sprites:
+            for cell in self._cells(sprite.rect):
+                self.cells.setdefault(cell, []).append(sprite)
+
+    def _cells(self, rect):
+        size = self.cell_size
+        for cx in range(rect.left // size, (rect.right - 1) // size + 1):
+            for cy in range(rect.top // size, (rect.bottom - 1) // size + 1):
+                yield cx, cy
+
+    def query(self, rect):
+        # A dict rather than a set, so that the order, and with it which of
+        # two equally near sprites a bullet hits, is the same on every run
+        found = {}
+        for cell in self._cells(rect):
+            found.update(dict.fromkeys(self.cells.get(cell, ())))
+        return found
+
+def sweep_rect(x0, y0, x1, y1, half_w, half_h, rect):
+    """Return the fraction of the way from (x0, y0) to (x1, y1) at which a box
+    of the given half size centred on that path first overlaps rect, or None."""
+    t_enter, t_exit = 0.0, 1.0
+    for start, end, low, high in ((x0, x1, rect.left - half_w, rect.right + half_w),
+                                  (y0, y1, rect.top - half_h, rect.bottom + half_h)):
+        delta = end - start
+        if delta == 0:
+            if not low < start < high:
+                return None
+            continue
+        t_low = (low - start) / delta
+        t_high = (high - start) / delta
+        if t_low > t_high:
+            t_low, t_high = t_high, t_low
+        t_enter = max(t_enter, t_low)
+        t_exit = min(t_exit, t_high)
+        if t_enter >= t_exit:
+            return None
+    return t_enter
 
 # Bullet class
 class Bullet(pygame.sprite.Sprite):
-    def __init__(self, x, y, angle_offset=0):
+    def __init__(self, x, y, enemies, angle_offset=0):
         super().__init__()
-        self.image = pygame.Surface((BULLET_WIDTH, BULLET_HEIGHT))
-        self.image.fill(BLUE)
+        self.image = solid_image(BULLET_WIDTH, BULLET_HEIGHT, BLUE)
         self.rect = self.image.get_rect()
-        self.rect.center = (x, y)
-        
+        self.x, self.y = x - BULLET_WIDTH / 2, y - BULLET_HEIGHT / 2
+        self.rect.topleft = (round(self.x), round(self.y))
+        self.start = (x, y)  # Where this tick's movement began, as a centre
+
         # Find nearest enemy
         nearest_enemy = None
         min_distance = float('inf')
-        for enemy in enemies_group:
-            dx = enemy.rect.centerx - x
-            dy = enemy.rect.centery - y
+        for enemy in enemies:
+            dx = enemy.x + ENEMY_WIDTH / 2 - x
+            dy = enemy.y + ENEMY_HEIGHT / 2 - y
             distance = math.sqrt(dx ** 2 + dy ** 2)
             if distance < min_distance:
                 min_distance = distance
                 nearest_enemy = enemy
 
         if nearest_enemy:
-            dx = nearest_enemy.rect.centerx - x
-            dy = nearest_enemy.rect.centery - y
+            dx = nearest_enemy.x + ENEMY_WIDTH / 2 - x
+            dy = nearest_enemy.y + ENEMY_HEIGHT / 2 - y
             angle = math.atan2(dy, dx)
             angle += math.radians(angle_offset)  # Add spread angle
             self.velocity_x = math.cos(angle) * BULLET_SPEED
@@ -205,171 +608,637 @@ class Bullet(pygame.sprite.Sprite):
             self.velocity_y = -BULLET_SPEED
 
     def update(self):
-        self.rect.x += self.velocity_x
-        self.rect.y += self.velocity_y
-        
-        # Remove if off screen
-        if (self.rect.right < 0 or self.rect.left > SCREEN_WIDTH or
-            self.rect.bottom < 0 or self.rect.top > SCREEN_HEIGHT):
+        self.start = (self.x + BULLET_WIDTH / 2, self.y + BULLET_HEIGHT / 2)
+        self.x += self.velocity_x
+        self.y += self.velocity_y
+        self.rect.topleft = (round(self.x), round(self.y))
+
+        # Remove if it leaves the world
+        if (self.rect.right < 0 or self.rect.left > WORLD_WIDTH or
+            self.rect.bottom < 0 or self.rect.top > WORLD_HEIGHT):
             self.kill()
 
+    def first_hit(self, grid):
+        """Return the living sprite in grid that this tick's movement hits first,
+        so fast bullets cannot pass through enemies between ticks."""
+        x0, y0 = self.start
+        x1, y1 = self.x + BULLET_WIDTH / 2, self.y + BULLET_HEIGHT / 2
+        path = self.rect.union(self.rect.move(round(x0 - x1), round(y0 - y1)))
+        half_w, half_h = BULLET_WIDTH / 2, BULLET_HEIGHT / 2
+        hit, hit_t = None, None
+        for sprite in grid.query(path):
+            if not sprite.alive():
+                continue
+            t = sweep_rect(x0, y0, x1, y1, half_w, half_h, sprite.rect)
+            if t is not None and (hit_t is None or t < hit_t):
+                hit, hit_t = sprite, t
+        return hit
+
 # Platform class
 class Platform(pygame.sprite.Sprite):
     def __init__(self, x, y, width, height):
         super().__init__()
-        self.image = pygame.Surface((width, height))
-        self.image.fill(BLACK)
+        self.image = solid_image(width, height, BLACK)
         self.rect = self.image.get_rect(topleft=(x, y))
 
 # PowerUp class
 class PowerUp(pygame.sprite.Sprite):
-    def __init__(self):
+    def __init__(self, rng, powerup_type=None, area=WORLD_RECT):
         super().__init__()
-        self.type = random.choice(["rapid_fire", "shield", "multiplier"])
-        self.image = pygame.Surface((POWERUP_SIZE, POWERUP_SIZE))
+        self.type = powerup_type or rng.choice(POWERUP_TYPES)
         if self.type == "rapid_fire":
-            self.image.fill(GOLD)
+            color = GOLD
         elif self.type == "shield":
-            self.image.fill(BLUE)
+            color = BLUE
         else:
-            self.image.fill(GREEN)
+            color = GREEN
+        self.image = solid_image(POWERUP_SIZE, POWERUP_SIZE, color)
         self.rect = self.image.get_rect()
-        self.rect.x = random.randint(0, SCREEN_WIDTH - POWERUP_SIZE)
-        self.rect.y = random.randint(0, SCREEN_HEIGHT - POWERUP_SIZE)
-
-# Create sprite groups
-player = Player()
-enemies_group = pygame.sprite.Group()
-bullets_group = pygame.sprite.Group()
-platforms_group = pygame.sprite.Group()
-powerups_group = pygame.sprite.Group()
-
-# Create platforms
-platforms = [
-    Platform(0, SCREEN_HEIGHT - 50, SCREEN_WIDTH, 50),  # Ground
-    Platform(SCREEN_WIDTH // 4, SCREEN_HEIGHT // 2, 200, 20),  # Left platform
-    Platform(SCREEN_WIDTH * 3 // 4 - 200, SCREEN_HEIGHT // 2, 200, 20),  # Right platform
-    Platform(SCREEN_WIDTH // 2 - 100, SCREEN_HEIGHT * 3 // 4, 200, 20),  # Bottom middle platform
-]
-platforms_group.add(platforms)
-
-def spawn_powerup():
-    if random.random() < 0.02 and len(powerups_group) < 3:  # 2% chance per frame, max 3 powerups
-        powerups_group.add(PowerUp())
-
-def new_level():
-    bullets_group.empty()
-    powerups_group.empty()
-    player.level += 1
-    for _ in range(min(MAX_ENEMIES + player.level - 1, 10)):  # Increase enemies with level, max 10
-        enemy = Enemy(player)
-        enemy.speed = min(ENEMY_SPEED + (player.level - 1) * 0.5, 7)  # Increase speed with level, max 7
-        enemies_group.add(enemy)
-    player.rect.center = (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2)
+        self.rect.x = rng.randint(area.left, area.right - POWERUP_SIZE)
+        self.rect.y = rng.randint(area.top, area.bottom - POWERUP_SIZE)
 
-# Main game loop
-clock = pygame.time.Clock()
-last_shot_time = 0
-shot_delay = 250  # Milliseconds between shots
-running = True
-
-while running:
-    current_time = pygame.time.get_ticks()
-    
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
-        elif event.type == pygame.KEYDOWN:
-            if event.key == pygame.K_SPACE:
-                if current_time - last_shot_time > (shot_delay / 2 if player.rapid_fire else shot_delay):
-                    bullets = player.shoot()
-                    bullets_group.add(bullets)
-                    last_shot_time = current_time
-
-    # Update
-    player.update(platforms_group)
-    enemies_group.update()
-    bullets_group.update()
-
-    # Spawn power-ups
-    spawn_powerup()
-
-    # Check for collisions between bullets and enemies
-    for bullet in bullets_group:
-        enemy_hit = pygame.sprite.spritecollideany(bullet, enemies_group)
-        if enemy_hit:
-            bullet.kill()
-            enemy_hit.kill()
-            player.score += 100 * player.multiplier
-            player.combo_timer = current_time + 2000  # 2 second combo window
-            player.multiplier = min(player.multiplier + 0.5, 4)  # Max 4x multiplier
-
-    # Check for collisions between player and power-ups
-    powerup_hit = pygame.sprite.spritecollideany(player, powerups_group)
-    if powerup_hit:
-        if powerup_hit.type == "rapid_fire":
-            player.rapid_fire = True
-            player.rapid_fire_timer = current_time + POWERUP_DURATION
-        elif powerup_hit.type == "shield":
-            player.shield = True
-            player.shield_timer = current_time + POWERUP_DURATION
-        else:  # multiplier
-            player.multiplier *= 2
-        powerup_hit.kill()
-
-    # Check for collisions between player and enemies
-    if not player.shield and pygame.sprite.spritecollideany(player, enemies_group):
-        player.high_score = max(player.high_score, player.score)
-        player.score = 0
-        player.level = 1
-        player.multiplier = 1
-        enemies_group.empty()
-        new_level()
-
-    # Check if all enemies are defeated
-    if len(enemies_group) == 0:
-        new_level()
+# Difficulty curve: linear up to the knee, then easing towards the limit
+# instead of stopping there, so that early levels play as they always have
+def eased(level, start, per_level, knee, limit):
+    value = start + per_level * (level - 1)
+    if value <= knee:
+        return value
+    room = limit - knee
+    return knee + room * (1 - math.exp(-(value - knee) / room))
 
+def wave_size(level):
+    return round(eased(level, MAX_ENEMIES, ENEMIES_PER_LEVEL, WAVE_SIZE_KNEE, MAX_WAVE_SIZE))
+
+def wave_speed(level):
+    return eased(level, ENEMY_SPEED, SPEED_PER_LEVEL, WAVE_SPEED_KNEE, MAX_WAVE_SPEED)
+
+# Spawn director: streams each wave in a few enemies per tick
+class SpawnDirector:
+    def __init__(self, world, per_tick=SPAWNS_PER_TICK, prewarm_budget=PREWARM_BUDGET):
+        self.world = world
+        self.per_tick = per_tick
+        self.prewarm_budget = prewarm_budget
+        self.pending = 0  # Enemies of the current wave not spawned yet
+        self.pool = []    # Allocated but never spawned enemies
+
+    def start_wave(self):
+        self.pending = wave_size(self.world.player.level)
+
+    def update(self):
+        """Spawn up to per_tick enemies of the current wave, or, if none are
+        due, use the tick to allocate enemies for the next wave."""
+        if not self.pending:
+            self.prewarm()
+            return
+        world = self.world
+        speed = wave_speed(world.player.level)
+        players = world.players
+        for i in range(min(self.pending, self.per_tick)):
+            enemy = self.pool.pop() if self.pool else Enemy(world.player, world.rng, world.time,
+                                                            False, world.timers)
+            # In co-op, waves come in around each player in turn
+            enemy.player = players[(self.pending - i) % len(players)]
+            enemy.reset(world.time)
+            enemy.speed = speed
+            world.enemies_group.add(enemy)
+        self.pending -= min(self.pending, self.per_tick)
+
+    def prewarm(self):
+        # Allocation does not touch the world's rng, so spending wall-clock
+        # time on it here cannot change how the game plays out
+        world = self.world
+        target = wave_size(world.player.level + 1)
+        deadline = time.perf_counter() + self.prewarm_budget / 1000
+        while len(self.pool) < target and time.perf_counter() < deadline:
+            self.pool.append(Enemy(world.player, world.rng, world.time, False, world.timers))
+
+# World class: everything one game needs, so several can run side by side.
+# With players > 1 it is a co-op game: every player moves, shoots and
+# collects power-ups for themselves, while the score, multiplier, level
+# and lives are the team's, kept on the first player.
+class World:
+    def __init__(self, seed=None, scores=None, player_name="player", effects=True, players=1,
+                 events=None):
+        self.rng = random.Random(seed)
+        self.time = 0
+        self.deaths = 0  # Times a player has been caught, for bots and stats
+        self.timers = Timers()
+        # ("rapid_fire", "shield" or "combo", player index) -> Timers handle
+        self.player_timers = {}
+
+        # Optional highscores.HighScoreStore that finished games are recorded in
+        self.scores = scores
+        self.player_name = player_name
+        # Optional events.EventLog that kills, pickups, deaths and so on are recorded in
+        self.events = events
+
+        # Hit effects; purely visual, so not part of capture(). Headless
+        # worlds pass effects=False and skip the particle arrays entirely.
+        self.particles = ParticleSystem() if effects else None
+
+        # Work the quality governor can turn down; see set_quality()
+        self.far_update_interval = FAR_UPDATE_INTERVAL
+        self.powerup_interval = 1  # Ticks between power-up spawn rolls
+
+        # Create sprite groups
+        self.player = Player()
+        self.players = [self.player] + [Player(PARTNER_COLOR) for _ in range(players - 1)]
+        for index, partner in enumerate(self.players[1:], 1):
+            partner.move_to(*self.start_position(index))
+        self.camera = Camera()
+        self.spawner = SpawnDirector(self)
+        self.enemies_group = ChunkedGroup()
+        self.bullets_group = ChunkedGroup()
+        self.platforms_group = ArrayGroup()
+        self.powerups_group = ArrayGroup()
+
+        # Create platforms: ground along the arena, and the same three
+        # platforms repeated for every screen width of it
+        self.platforms_group.add(Platform(0, WORLD_HEIGHT - 50, WORLD_WIDTH, 50))  # Ground
+        for left in range(0, WORLD_WIDTH, SCREEN_WIDTH):
+            self.platforms_group.add([
+                Platform(left + SCREEN_WIDTH // 4, SCREEN_HEIGHT // 2, 200, 20),  # Left platform
+                Platform(left + SCREEN_WIDTH * 3 // 4 - 200, SCREEN_HEIGHT // 2, 200, 20),  # Right platform
+                Platform(left + SCREEN_WIDTH // 2 - 100, SCREEN_HEIGHT * 3 // 4, 200, 20),  # Bottom middle platform
+            ])
+        self.chunks = CollisionGrid(self.platforms_group, CHUNK_SIZE)
+
+    # The first player's last shot, kept on the player like everyone else's
+    @property
+    def last_shot_time(self):
+        return self.player.last_shot_time
+
+    @last_shot_time.setter
+    def last_shot_time(self, value):
+        self.player.last_shot_time = value
+
+    def start_position(self, index):
+        # Players start side by side, the first in the middle of the arena
+        return (WORLD_WIDTH // 2 - PLAYER_WIDTH // 2 + index * 2 * PLAYER_WIDTH,
+                WORLD_HEIGHT // 2 - PLAYER_HEIGHT // 2)
+
+    def spawn_powerup(self, chance=POWERUP_CHANCE):
+        if self.rng.random() < chance and len(self.powerups_group) < 3:  # Max 3 powerups
+            self.powerups_group.add(PowerUp(self.rng, area=view_rect(self.player.rect.center)))
+
+    def set_quality(self, quality):
+        """Apply the simulation side of a governor.Quality."""
+        self.far_update_interval = quality.far_update_interval or FAR_UPDATE_INTERVAL
+        self.powerup_interval = quality.powerup_interval
+
+    def new_level(self):
+        player = self.player
+        self.bullets_group.empty()
+        self.powerups_group.empty()
+        player.level += 1
+        if self.events is not None:
+            self.events.record(LEVEL_UP, self.time, value=player.level)
+        self.spawner.start_wave()  # Enemies stream in over the next ticks
+        for index, player in enumerate(self.players):
+            player.move_to(*self.start_position(index))
+
+    def start_player_timer(self, name, deadline, index=0):
+        """(Re)start the rapid_fire, shield or combo timer of the player at index."""
+        key = (name, index)
+        if key in self.player_timers:
+            self.timers.cancel(self.player_timers[key])
+        self.player_timers[key] = self.timers.schedule(deadline, self.player_timer_expired, name, index)
+
+    def player_timer_expired(self, name, index):
+        del self.player_timers[name, index]
+        player = self.players[index]
+        if name == "combo":
+            if player.multiplier != 1 and self.events is not None:
+                self.events.record(MULTIPLIER, self.time, index, value=1)
+            player.multiplier = 1
+        else:
+            setattr(player, name, False)
+
+    def capture(self):
+        """Return a WorldState holding everything needed to restore this world."""
+        player = self.player
+        return WorldState(
+            self.time, self.last_shot_time, self.rng.getstate(),
+            (player.x, player.y) + tuple(getattr(player, name) for name in PLAYER_FIELDS),
+            [(e.x, e.y, e.speed, e.behavior, e.behavior_timer) for e in self.enemies_group],
+            [(b.x, b.y, b.velocity_x, b.velocity_y) for b in self.bullets_group],
+            [(p.rect.x, p.rect.y, p.type) for p in self.powerups_group],
+            [tuple(p.rect) for p in self.platforms_group],
+            self.spawner.pending,
+            tuple((p.x, p.y, p.last_shot_time) + tuple(getattr(p, name) for name in PLAYER_FIELDS)
+                  for p in self.players[1:]),
+            tuple(tuple(getattr(sprite, "net_id", None) for sprite in group)
+                  for group in (self.enemies_group, self.bullets_group, self.powerups_group)),
+        )
+
+    def restore(self, state):
+        """Put the world back into a state returned by capture."""
+        self.time = state.time
+        self.last_shot_time = state.last_shot_time
+        player = self.player
+        player.move_to(*state.player[:2])
+        for name, value in zip(PLAYER_FIELDS, state.player[2:]):
+            setattr(player, name, value)
+        if len(state.partners) != len(self.players) - 1:
+            raise ValueError("state is for %d players, world has %d"
+                             % (len(state.partners) + 1, len(self.players)))
+        for partner, values in zip(self.players[1:], state.partners):
+            partner.move_to(*values[:2])
+            partner.last_shot_time = values[2]
+            for name, value in zip(PLAYER_FIELDS, values[3:]):
+                setattr(partner, name, value)
+
+        # Timers are rebuilt from the deadlines the sprites keep
+        self.timers.clear()
+        self.player_timers = {}
+        for index, p in enumerate(self.players):
+            if p.rapid_fire:
+                self.start_player_timer("rapid_fire", p.rapid_fire_timer, index)
+            if p.shield:
+                self.start_player_timer("shield", p.shield_timer, index)
+        if player.multiplier != 1:
+            self.start_player_timer("combo", player.combo_timer)
+
+        self.enemies_group.empty()
+        for x, y, speed, behavior, behavior_timer in state.enemies:
+            enemy = Enemy(player, self.rng, behavior_timer, False, self.timers)
+            enemy.x, enemy.y = x, y
+            enemy.rect.topleft = (round(x), round(y))
+            enemy.speed = speed
+            enemy.behavior = behavior
+            enemy.schedule_behavior_change()
+            self.enemies_group.add(enemy)
+        self.bullets_group.empty()
+        for x, y, velocity_x, velocity_y in state.bullets:
+            bullet = Bullet(0, 0, ())
+            bullet.x, bullet.y = x, y
+            bullet.rect.topleft = (round(x), round(y))
+            bullet.velocity_x, bullet.velocity_y = velocity_x, velocity_y
+            self.bullets_group.add(bullet)
+        self.powerups_group.empty()
+        for x, y, powerup_type in state.powerups:
+            powerup = PowerUp(self.rng, powerup_type)
+            powerup.rect.x, powerup.rect.y = x, y
+            self.powerups_group.add(powerup)
+        for group, net_ids in zip((self.enemies_group, self.bullets_group, self.powerups_group),
+                                  state.net_ids):
+            for sprite, net_id in zip(group, net_ids):
+                if net_id is not None:
+                    sprite.net_id = net_id
+        self.platforms_group.empty()
+        self.platforms_group.add([Platform(*rect) for rect in state.platforms])
+        self.chunks = CollisionGrid(self.platforms_group, CHUNK_SIZE)
+        self.spawner.pending = state.pending_spawns
+        if self.particles is not None:
+            self.particles.clear()
+
+        # Last, since making the sprites above draws on the generator
+        self.rng.setstate(state.rng)
+
+    def record_score(self):
+        """Send the current game's score to the high-score store, if any."""
+        if self.scores and self.player.score > 0:
+            self.scores.record(self.player_name, self.player.score, self.player.level)
+
+    def step(self, controls, current_time):
+        """Advance the game by one tick at current_time (in milliseconds).
+        controls is a Controls, or in co-op a sequence of one per player."""
+        previous_tick = int(self.time * FPS // 1000)
+        self.time = current_time
+        player = self.player
+        players = self.players
+        if isinstance(controls, Controls):
+            controls = (controls,)
+
+        for shooter, shooter_controls in zip(players, controls):
+            if shooter_controls.shoot and current_time - shooter.last_shot_time > (
+                    SHOT_DELAY / 2 if shooter.rapid_fire else SHOT_DELAY):
+                bullets = shooter.shoot(self.enemies_group)
+                self.bullets_group.add(bullets)
+                shooter.last_shot_time = current_time
+
+        # Bring in enemies still due from this wave
+        self.spawner.update()
+
+        # Update. Enemies well away from every view move every
+        # far_update_interval ticks, by that many ticks' worth, with a
+        # different tick for each column of chunks to spread the work out.
+        # Only the columns near a view, and the far ones due, are looked at.
+        for mover, mover_controls in zip(players, controls):
+            mover.update(self.platforms_group, mover_controls)
+        self.timers.run(current_time)
+        near = [view_rect(p.rect.center).inflate(2 * CHUNK_SIZE, 2 * CHUNK_SIZE) for p in players]
+        tick = int(current_time * FPS // 1000)
+        far_due = tick != previous_tick
+        far_interval = self.far_update_interval
+        enemies = self.enemies_group
+        columns = set()
+        for rect in near:
+            columns.update(chunk_columns(rect, ENEMY_WIDTH))
+        if far_due:
+            columns.update(column for column in enemies.columns if (tick + column) % far_interval == 0)
+        candidates = enemies.sprites_in(columns)
+        for enemy in candidates:
+            if enemy.rect.collidelist(near) != -1:
+                ticks = 1
+            elif far_due and (tick + enemy.rect.x // CHUNK_SIZE) % far_interval == 0:
+                ticks = far_interval
+            else:
+                continue
+            if len(players) > 1:
+                enemy.player = nearest_player(players, enemy)
+            enemy.update(current_time, ticks)
+        enemies.moved(candidates)
+        self.bullets_group.update()
+
+        # Spawn power-ups, rolling less often but with the odds to match
+        # when the governor asks for it
+        if self.powerup_interval == 1:
+            self.spawn_powerup()
+        elif far_due and tick % self.powerup_interval == 0:
+            self.spawn_powerup(1 - (1 - POWERUP_CHANCE) ** self.powerup_interval)
+
+        # Check for collisions between bullets and enemies along each bullet's
+        # path, against the enemies in the columns the bullets went through
+        events = self.events
+        grid = None
+        if self.bullets_group:
+            columns = set()
+            for bullet in self.bullets_group:
+                columns.update(chunk_columns(bullet.rect.inflate(2 * BULLET_SPEED, 0), ENEMY_WIDTH))
+            grid = CollisionGrid(enemies.sprites_in(columns))
+        for bullet in self.bullets_group:
+            enemy_hit = bullet.first_hit(grid)
+            if enemy_hit:
+                bullet.kill()
+                enemy_hit.kill()
+                if self.particles is not None:
+                    self.particles.emit(enemy_hit.x + ENEMY_WIDTH / 2, enemy_hit.y + ENEMY_HEIGHT / 2,
+                                        BLACK, current_time, 24)
+                    self.particles.emit(bullet.x + BULLET_WIDTH / 2, bullet.y + BULLET_HEIGHT / 2,
+                                        GOLD, current_time, 12, 0.4)
+                player.score += 100 * player.multiplier
+                player.combo_timer = current_time + COMBO_WINDOW
+                multiplier = min(player.multiplier + 0.5, 4)  # Max 4x multiplier
+                if events is not None:
+                    events.record(KILL, current_time, 0, enemy_hit.x, enemy_hit.y, 100 * player.multiplier)
+                    if multiplier != player.multiplier:
+                        events.record(MULTIPLIER, current_time, value=multiplier)
+                player.multiplier = multiplier
+                self.start_player_timer("combo", player.combo_timer)
+
+        # Check for collisions between players and power-ups
+        for index, collector in enumerate(players):
+            powerup_hit = pygame.sprite.spritecollideany(collector, self.powerups_group)
+            if powerup_hit:
+                if events is not None:
+                    events.record(PICKUP, current_time, index, powerup_hit.rect.x, powerup_hit.rect.y,
+                                  POWERUP_TYPES.index(powerup_hit.type))
+                if powerup_hit.type == "rapid_fire":
+                    collector.rapid_fire = True
+                    collector.rapid_fire_timer = current_time + POWERUP_DURATION
+                    self.start_player_timer("rapid_fire", collector.rapid_fire_timer, index)
+                elif powerup_hit.type == "shield":
+                    collector.shield = True
+                    collector.shield_timer = current_time + POWERUP_DURATION
+                    self.start_player_timer("shield", collector.shield_timer, index)
+                else:  # multiplier, the team's
+                    player.multiplier *= 2
+                    if events is not None:
+                        events.record(MULTIPLIER, current_time, value=player.multiplier)
+                    # Lasts only while a combo does, so it resets next tick if none is running
+                    if ("combo", 0) not in self.player_timers:
+                        self.start_player_timer("combo", player.combo_timer)
+                powerup_hit.kill()
+
+        # Check for collisions between players and enemies
+        caught = next((index for index, p in enumerate(players)
+                       if not p.shield and pygame.sprite.spritecollideany(p, self.enemies_group)), None)
+        if caught is not None:
+            self.deaths += 1
+            self.record_score()
+            if events is not None:
+                events.record(DEATH, current_time, caught, players[caught].x, players[caught].y, player.score)
+                if player.multiplier != 1:
+                    events.record(MULTIPLIER, current_time, value=1)
+            player.high_score = max(player.high_score, player.score)
+            player.score = 0
+            player.level = 1
+            player.multiplier = 1
+            self.enemies_group.empty()
+            self.new_level()
+
+        # Check if all enemies are defeated
+        if len(self.enemies_group) == 0 and not self.spawner.pending:
+            self.new_level()
+
+    def render_state(self, quality=FULL_QUALITY, view=0):
+        """Return a RenderState of the world as it is now, as seen by the
+        player at index view."""
+        player = self.players[view]
+        team = self.player
+        camera = self.camera
+        camera.follow(player)
+        offset = (-camera.rect.x, -camera.rect.y)
+        particles = self.particles if quality.effects else None
+        return RenderState(
+            self.time, offset,
+            # Platforms, looking only in the chunks the camera can see
+            camera.visible(self.chunks.query(camera.rect)),
+            camera.visible(self.powerups_group),
+            (player.image, player.rect.move(offset)),
+            camera.visible(self.enemies_group.sprites_near(camera.rect, ENEMY_WIDTH)),
+            camera.visible(self.bullets_group.sprites_near(camera.rect, BULLET_WIDTH)),
+            particles.snapshot(self.time) if particles is not None else None,
+            team.score, team.level, team.high_score, team.multiplier,
+            player.rapid_fire, player.shield,
+            camera.visible(p for p in self.players if p is not player),
+        )
+
+    def draw(self, screen, font):
+        render(screen, Hud(font), self.render_state())
+
+# HUD text, rendered again only when what it shows has changed, and then
+# no sooner than `interval` frames after the last time
+class Hud:
+    def __init__(self, font):
+        self.font = font
+        self.values = None
+        self.lines = []  # (text surface, position) pairs, for Surface.blits
+        self.age = 0     # Frames since the text was rendered
+
+    def draw(self, screen, state, interval=1):
+        values = (state.score, state.level, state.high_score, state.multiplier,
+                  state.rapid_fire, state.shield)
+        self.age += 1
+        if values != self.values and (self.age >= interval or self.values is None):
+            self.values = values
+            self.age = 0
+            font = self.font
+
+            # Score, level, and high score
+            self.lines = [
+                (font.render(f"Score: {state.score}", True, BLACK), (10, 10)),
+                (font.render(f"Level: {state.level}", True, BLACK), (10, 50)),
+                (font.render(f"High Score: {state.high_score}", True, BLACK), (10, 90)),
+                (font.render(f"Multiplier: {state.multiplier:.1f}x", True, BLACK), (10, 130)),
+            ]
+
+            # Active power-ups
+            if state.rapid_fire:
+                self.lines.append((font.render("Rapid Fire!", True, GOLD), (SCREEN_WIDTH - 150, 10)))
+            if state.shield:
+                self.lines.append((font.render("Shield!", True, BLUE), (SCREEN_WIDTH - 150, 50)))
+        screen.blits(self.lines, doreturn=False)
+
+# Draw a RenderState, leaving out what quality turns off
+def render(screen, hud, state, quality=FULL_QUALITY):
     # Draw
     screen.fill(WHITE)
-    
+
     # Draw platforms
-    platforms_group.draw(screen)
-    
+    screen.blits(state.platforms, doreturn=False)
+
     # Draw power-ups
-    powerups_group.draw(screen)
-    
+    screen.blits(state.powerups, doreturn=False)
+
     # Draw player with shield effect
-    if player.shield:
-        pygame.draw.circle(screen, BLUE, player.rect.center, max(PLAYER_WIDTH, PLAYER_HEIGHT) // 2 + 5, 2)
-    screen.blit(player.image, player.rect)
-    
+    player_image, player_rect = state.player
+    if state.shield and quality.shield_ring:
+        pygame.draw.circle(screen, BLUE, player_rect.center, max(PLAYER_WIDTH, PLAYER_HEIGHT) // 2 + 5, 2)
+    screen.blit(player_image, player_rect)
+    screen.blits(state.partners, doreturn=False)
+
     # Draw enemies and bullets
-    enemies_group.draw(screen)
-    bullets_group.draw(screen)
-
-    # Display score, level, and high score
-    font = pygame.font.Font(None, 36)
-    score_text = font.render(f"Score: {player.score}", True, BLACK)
-    level_text = font.render(f"Level: {player.level}", True, BLACK)
-    high_score_text = font.render(f"High Score: {player.high_score}", True, BLACK)
-    multiplier_text = font.render(f"Multiplier: {player.multiplier:.1f}x", True, BLACK)
-    
-    screen.blit(score_text, (10, 10))
-    screen.blit(level_text, (10, 50))
-    screen.blit(high_score_text, (10, 90))
-    screen.blit(multiplier_text, (10, 130))
-
-    # Display active power-ups
-    if player.rapid_fire:
-        rapid_fire_text = font.render("Rapid Fire!", True, GOLD)
-        screen.blit(rapid_fire_text, (SCREEN_WIDTH - 150, 10))
-    if player.shield:
-        shield_text = font.render("Shield!", True, BLUE)
-        screen.blit(shield_text, (SCREEN_WIDTH - 150, 50))
-
-    pygame.display.flip()
-    clock.tick(60)
-
-pygame.quit()
-sys.exit()
\ No newline at end of file
+    screen.blits(state.enemies, doreturn=False)
+    screen.blits(state.bullets, doreturn=False)
+    if state.particles is not None:
+        state.particles.draw(screen, state.time, state.offset)
+
+    # Display score, level, high score and active power-ups
+    hud.draw(screen, state, quality.hud_interval)
+
+# Open the window with just the display and font subsystems, taking fonts
+# and sprite images from the asset bundle (built on the first run)
+def startup(bundle_path=ASSET_BUNDLE):
+    pygame.display.init()
+    pygame.font.init()
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    pygame.display.set_caption("Bulletstorm Blitz")
+    if bundle_path is None:
+        return screen, pygame.font.Font(None, 36)
+    import assets
+    bundle = assets.load_or_build(bundle_path)
+    return screen, bundle.font("default", 36)
+
+# Main game loop
+def main(checkpoint_path=None, pipelined=False, adaptive=True, events_path=None):
+    import checkpoint
+    import getpass
+    from concurrent.futures import ThreadPoolExecutor
+    from highscores import HighScoreStore
+
+    # Create the game window
+    screen, font = startup()
+    hud = Hud(font)
+
+    os.makedirs(DATA_DIR, exist_ok=True)
+    scores = HighScoreStore(HIGH_SCORES)
+    events = EventLog(events_path) if events_path else None
+    world = World(scores=scores, player_name=getpass.getuser(), events=events)
+    # Resume from the checkpoint if there is one, keeping its clock running
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        checkpoint.load(world, checkpoint_path)
+    world.player.high_score = max(world.player.high_score, scores.best(world.player_name))
+    # The world clock runs on perf_counter: pygame.time.get_ticks() reads
+    # 0 until the first Clock.tick() without pygame.init()'s SDL timer
+    time_offset = world.time - time.perf_counter() * 1000
+    writer = checkpoint.CheckpointWriter() if checkpoint_path else None
+    last_save = world.time
+
+    clock = pygame.time.Clock()
+    running = True
+    paused = False
+
+    # Drops optional work while frames take longer than the clock allows
+    governor = QualityGovernor(1000 / FPS) if adaptive else None
+    quality = FULL_QUALITY
+
+    # Pipelined, the world belongs to a simulation thread: while it works
+    # out tick N+1, this thread draws the RenderState it made for tick N
+    simulation = ThreadPoolExecutor(1, thread_name_prefix="simulation") if pipelined else None
+    ticking = None  # Future for the tick being simulated
+    state = world.render_state()
+
+    def simulate(controls, current_time, quality):
+        world.set_quality(quality)
+        world.step(controls, current_time)
+        return world.render_state(quality)
+
+    while running:
+        frame_start = time.perf_counter()
+        shoot = False
+
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_SPACE:
+                    shoot = True
+                elif event.key == pygame.K_p:
+                    paused = not paused
+
+        if paused:
+            if ticking:
+                state, ticking = ticking.result(), None
+            # Hold the world clock, and with it every timer, where it is
+            time_offset = state.time - time.perf_counter() * 1000
+        current_time = time.perf_counter() * 1000 + time_offset
+
+        if not paused:
+            keys = pygame.key.get_pressed()
+            controls = Controls(keys[pygame.K_LEFT], keys[pygame.K_RIGHT], keys[pygame.K_UP], shoot)
+            if simulation:
+                if ticking:
+                    state = ticking.result()
+                ticking = simulation.submit(simulate, controls, current_time, quality)
+            else:
+                state = simulate(controls, current_time, quality)
+        render(screen, hud, state, quality)
+        if paused:
+            paused_text = font.render("Paused - press P", True, BLACK)
+            screen.blit(paused_text, paused_text.get_rect(center=screen.get_rect().center))
+
+        # Autosave in the background, between ticks if they run on their own thread
+        if writer and current_time - last_save > AUTOSAVE_INTERVAL:
+            if simulation:
+                simulation.submit(writer.submit, world, checkpoint_path)
+            else:
+                writer.submit(world, checkpoint_path)
+            last_save = current_time
+
+        pygame.display.flip()
+        if governor and not paused:
+            quality = governor.record((time.perf_counter() - frame_start) * 1000)
+        clock.tick(FPS)
+
+    if simulation:
+        simulation.shutdown()  # Lets the last tick finish
+
+    # A checkpointed game carries on next time; otherwise this one is over
+    if writer:
+        writer.submit(world, checkpoint_path)
+        writer.close()
+    else:
+        world.record_score()
+    if events:
+        events.close()
+    scores.close()
+    pygame.quit()
+    sys.exit()
+
+if __name__ == "__main__":
+    # "python Game.py" still starts the game, through play.py, which runs
+    # it from the imported Game module rather than this __main__ copy
+    import play
+    play.main()
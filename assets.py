@@ -0,0 +1,197 @@
+"""Pre-decoded asset bundle for a fast start of Bulletstorm Blitz.
+
+The bundle is one file holding everything the first frame needs, ready to
+use: the sprite images as raw RGB pixels, which become surfaces without
+any decoding, and the font file's bytes, so the font is opened without
+pygame searching for its default font. Other images (such as the
+background picture) can be added with --image and read with
+Bundle.image().
+
+Layout (little-endian): MAGIC, VERSION (H), entry count (H), then per
+entry a kind (B), name length (H), width (H), height (H) and data length
+(I), followed by the name and the data.
+
+Game.startup() loads the bundle from Game.ASSET_BUNDLE, in the user's
+cache directory, building it first if it is missing or unreadable. Run
+"python assets.py" to rebuild it, or "python assets.py --bench" to time
+cold starts to the first frame with the bundle against the game's
+original start-up, pygame.init() and the default font.
+"""
+
+import argparse
+import io
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+import pygame
+
+MAGIC = b"BSAS"
+VERSION = 1
+HEADER_FORMAT = struct.Struct("<4sHH")
+ENTRY_FORMAT = struct.Struct("<BHHHI")
+
+IMAGE = 0
+FONT = 1
+
+
+def _sprite_name(key):
+    width, height, color = key
+    return "sprite:%dx%d:%s" % (width, height, ",".join(str(c) for c in color))
+
+
+class Bundle:
+    def __init__(self, data):
+        view = memoryview(data)
+        magic, version, count = HEADER_FORMAT.unpack_from(view, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not a version %d asset bundle" % VERSION)
+        offset = HEADER_FORMAT.size
+        self.images = {}
+        self.fonts = {}
+        for _ in range(count):
+            kind, name_length, width, height, length = ENTRY_FORMAT.unpack_from(view, offset)
+            offset += ENTRY_FORMAT.size
+            name = bytes(view[offset:offset + name_length]).decode()
+            offset += name_length
+            payload = view[offset:offset + length]
+            offset += length
+            if kind == IMAGE:
+                self.images[name] = pygame.image.frombuffer(payload, (width, height), "RGB")
+            elif kind == FONT:
+                self.fonts[name] = bytes(payload)
+            else:
+                raise ValueError("unknown asset kind %d" % kind)
+
+    def image(self, name):
+        return self.images[name]
+
+    def font(self, name, size):
+        return pygame.font.Font(io.BytesIO(self.fonts[name]), size)
+
+
+def _entry(kind, name, width, height, data):
+    name = name.encode()
+    return ENTRY_FORMAT.pack(kind, len(name), width, height, len(data)) + name + data
+
+
+def build(path, image_files=()):
+    """Write a bundle of the game's sprite images, its font and image_files."""
+    import Game
+
+    # Creating one of everything fills Game's image cache
+    world = Game.World(effects=False)
+    Game.Enemy(world.player, world.rng, 0)
+    Game.Bullet(0, 0, ())
+    for kind in Game.POWERUP_TYPES:
+        Game.PowerUp(world.rng, kind)
+
+    entries = []
+    for key, surface in Game._images.items():
+        entries.append(_entry(IMAGE, _sprite_name(key), surface.get_width(),
+                              surface.get_height(), pygame.image.tobytes(surface, "RGB")))
+    for filename in image_files:
+        surface = pygame.image.load(filename)
+        name = os.path.splitext(os.path.basename(filename))[0]
+        entries.append(_entry(IMAGE, name, surface.get_width(), surface.get_height(),
+                              pygame.image.tobytes(surface, "RGB")))
+    font_path = os.path.join(os.path.dirname(pygame.__file__), pygame.font.get_default_font())
+    with open(font_path, "rb") as f:
+        entries.append(_entry(FONT, "default", 0, 0, f.read()))
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER_FORMAT.pack(MAGIC, VERSION, len(entries)))
+        f.write(b"".join(entries))
+    os.replace(tmp, path)
+
+
+def load_bundle(path):
+    """Read the bundle at path and hand its sprite images to Game."""
+    import Game
+
+    with open(path, "rb") as f:
+        bundle = Bundle(f.read())
+    display = pygame.display.get_surface() is not None
+    for name, surface in bundle.images.items():
+        if not name.startswith("sprite:"):
+            continue
+        size, color = name[len("sprite:"):].split(":")
+        width, height = (int(v) for v in size.split("x"))
+        color = tuple(int(c) for c in color.split(","))
+        # Match the window's pixel format so blits need no conversion
+        Game._images[width, height, color] = surface.convert() if display else surface
+    return bundle
+
+
+def load_or_build(path):
+    try:
+        return load_bundle(path)
+    except (OSError, ValueError, struct.error):
+        build(path)
+        return load_bundle(path)
+
+
+_FIRST_FRAME = """
+import sys
+sys.path.insert(0, %r)
+import pygame, Game
+%s
+world = Game.World()
+world.step(Game.NO_INPUT, 1000 / Game.FPS)
+world.draw(screen, font)
+pygame.display.flip()
+"""
+
+# How the game started before the bundle: every pygame module, and the
+# default font found by pygame
+_ORIGINAL_START = """
+pygame.init()
+screen = pygame.display.set_mode((Game.SCREEN_WIDTH, Game.SCREEN_HEIGHT))
+pygame.display.set_caption("Bulletstorm Blitz")
+font = pygame.font.Font(None, 36)
+"""
+
+
+def benchmark(runs=5):
+    """Time fresh interpreters from launch to the first frame on screen,
+    starting as the game used to and with Game.startup() and a bundle."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYGAME_HIDE_SUPPORT_PROMPT="1")
+    if not env.get("DISPLAY"):
+        env.setdefault("SDL_VIDEODRIVER", "dummy")
+    with tempfile.TemporaryDirectory() as scratch:
+        bundle_path = os.path.join(scratch, "assets.bundle")
+        build(bundle_path)
+        for label, start_code in (("original start", _ORIGINAL_START),
+                                  ("with bundle", "screen, font = Game.startup(%r)" % bundle_path)):
+            times = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                subprocess.run([sys.executable, "-c", _FIRST_FRAME % (here, start_code)],
+                               env=env, check=True)
+                times.append(time.perf_counter() - start)
+            print(f"{label}: first frame after {min(times) * 1e3:.0f} ms best, "
+                  f"{sum(times) / runs * 1e3:.0f} ms mean of {runs}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default=None,
+                        help="bundle to write (default: Game.ASSET_BUNDLE, in the user's cache)")
+    parser.add_argument("--image", action="append", default=[], help="extra image file to include")
+    parser.add_argument("--bench", action="store_true", help="time cold starts instead")
+    args = parser.parse_args()
+    if args.bench:
+        benchmark()
+    else:
+        import Game
+        build(args.output or Game.ASSET_BUNDLE, args.image)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""Checkpoints: save a running Game.World to disk and resume it later.
+
+A checkpoint holds the full WorldState from World.capture: clock, player
+(level, score, multiplier, power-up timers), the random generator's state,
+every enemy, bullet, powerup and platform, and how many enemies of the
+current wave are still to spawn. The file is a small little-endian header
+followed by one float64 column per entity field. Loading maps the file and
+casts each column to floats with one memoryview cast, then zips the
+columns into the per-entity rows World.restore() builds its sprites from;
+those rows are copies, as the sprites are.
+
+Checkpoints hold one-player worlds only: pack(), and so save(), raises
+ValueError for a co-op world, one with partners (CheckpointWriter puts the
+error in its errors list).
+
+CheckpointWriter takes the capture on the calling thread, which is cheap,
+and leaves packing and disk I/O to a background thread so autosaves do not
+stall the game loop.
+
+Run "python checkpoint.py" to time a save and resume of a large world.
+"""
+
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+
+import Game
+
+MAGIC = b"BSBK"
+VERSION = 2
+
+# magic, version, pending spawns, time, last shot time, and the entity counts
+HEADER_FORMAT = struct.Struct("<4sHHddIIII")
+PLAYER_FORMAT = struct.Struct("<%dd" % (2 + len(Game.PLAYER_FIELDS)))
+# Random.getstate(): version, whether a gauss value is cached, the value
+RNG_FORMAT = struct.Struct("<BB6xd")
+RNG_WORDS = 625
+
+_INT_FIELDS = {"jumps", "level"}
+_BOOL_FIELDS = {"on_ground", "rapid_fire", "shield"}
+
+_SWAP = sys.byteorder != "little"
+
+
+def _pad8(n):
+    return b"\0" * (-n % 8)
+
+
+def _number(value):
+    # Scores and multipliers are ints until a half multiplier makes them floats
+    return int(value) if value.is_integer() else value
+
+
+def pack(state):
+    """Serialize a WorldState to bytes. Raises ValueError if it has partners."""
+    if state.partners:
+        raise ValueError("checkpoints hold one-player worlds only")
+    out = [HEADER_FORMAT.pack(MAGIC, VERSION, state.pending_spawns,
+                              state.time, state.last_shot_time,
+                              len(state.enemies), len(state.bullets),
+                              len(state.powerups), len(state.platforms)),
+           PLAYER_FORMAT.pack(*state.player)]
+
+    rng_version, words, gauss = state.rng
+    out.append(RNG_FORMAT.pack(rng_version, gauss is not None, gauss or 0.0))
+    words = array("I", words)
+    if _SWAP:
+        words.byteswap()
+    out.append(words.tobytes())
+    out.append(_pad8(words.itemsize * len(words)))
+
+    enemies = [(x, y, speed, Game.BEHAVIORS.index(behavior), timer)
+               for x, y, speed, behavior, timer in state.enemies]
+    powerups = [(x, y, Game.POWERUP_TYPES.index(kind)) for x, y, kind in state.powerups]
+    for rows, width in ((enemies, 5), (state.bullets, 4), (powerups, 3),
+                        (state.platforms, 4)):
+        for i in range(width):
+            column = array("d", [row[i] for row in rows])
+            if _SWAP:
+                column.byteswap()
+            out.append(column.tobytes())
+    return b"".join(out)
+
+
+def unpack(buffer):
+    """Deserialize a WorldState from a bytes-like object (such as an mmap)."""
+    view = memoryview(buffer)
+    views = [view]
+
+    def columns(offset, count, width):
+        result = []
+        for i in range(width):
+            column = view[offset:offset + 8 * count]
+            if _SWAP:
+                column = array("d", column.tobytes())
+                column.byteswap()
+            else:
+                column = column.cast("d")
+                views.append(column)
+            result.append(column)
+            offset += 8 * count
+        return list(zip(*result)), offset
+
+    try:
+        (magic, version, pending, now, last_shot, n_enemies, n_bullets, n_powerups,
+         n_platforms) = HEADER_FORMAT.unpack_from(view, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not a version %d checkpoint" % VERSION)
+        offset = HEADER_FORMAT.size
+
+        values = PLAYER_FORMAT.unpack_from(view, offset)
+        offset += PLAYER_FORMAT.size
+        player = list(values[:2])
+        for name, value in zip(Game.PLAYER_FIELDS, values[2:]):
+            if name in _BOOL_FIELDS:
+                value = bool(value)
+            elif name in _INT_FIELDS:
+                value = int(value)
+            else:
+                value = _number(value)
+            player.append(value)
+
+        rng_version, has_gauss, gauss = RNG_FORMAT.unpack_from(view, offset)
+        offset += RNG_FORMAT.size
+        words = array("I", view[offset:offset + 4 * RNG_WORDS].tobytes())
+        if _SWAP:
+            words.byteswap()
+        offset += 4 * RNG_WORDS + len(_pad8(4 * RNG_WORDS))
+        rng = (rng_version, tuple(words), gauss if has_gauss else None)
+
+        enemies, offset = columns(offset, n_enemies, 5)
+        bullets, offset = columns(offset, n_bullets, 4)
+        powerups, offset = columns(offset, n_powerups, 3)
+        platforms, offset = columns(offset, n_platforms, 4)
+        return Game.WorldState(
+            _number(now), _number(last_shot), rng, tuple(player),
+            [(x, y, speed, Game.BEHAVIORS[int(b)], _number(timer))
+             for x, y, speed, b, timer in enemies],
+            bullets,
+            [(x, y, Game.POWERUP_TYPES[int(t)]) for x, y, t in powerups],
+            [tuple(int(v) for v in rect) for rect in platforms],
+            pending)
+    finally:
+        for v in reversed(views):
+            v.release()
+
+
+def write_state(state, path):
+    """Write a captured WorldState to path, atomically."""
+    data = pack(state)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def save(world, path):
+    """Write a checkpoint of world to path on the calling thread."""
+    write_state(world.capture(), path)
+
+
+def load(world, path):
+    """Restore world from the checkpoint at path."""
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            state = unpack(mapped)
+    world.restore(state)
+    return world
+
+
+class CheckpointWriter:
+    """Writes checkpoints from a background thread.
+
+    submit() captures the world on the caller's thread and returns at once.
+    If the same path is submitted again before the earlier checkpoint has
+    been written, only the newer one is written. Errors are collected in
+    the errors list rather than raised in the game thread.
+    """
+
+    def __init__(self):
+        self.errors = []
+        self._pending = {}
+        self._busy = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="checkpoint-writer",
+                                        daemon=True)
+        self._thread.start()
+
+    def submit(self, world, path):
+        state = world.capture()
+        with self._cond:
+            self._pending[path] = state
+            self._cond.notify_all()
+
+    def flush(self):
+        """Wait until every submitted checkpoint is on disk."""
+        with self._cond:
+            self._cond.wait_for(lambda: not self._pending and not self._busy)
+
+    def close(self):
+        self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    return
+                path = next(iter(self._pending))
+                state = self._pending.pop(path)
+                self._busy = True
+            try:
+                write_state(state, path)
+            except OSError as e:
+                self.errors.append(e)
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+
+def benchmark(enemies=5000, path="checkpoint_bench.bin"):
+    """Time capture, background write and resume of a crowded world."""
+    world = Game.World(seed=1)
+    world.new_level()
+    for _ in range(enemies):
+        world.enemies_group.add(Game.Enemy(world.player, world.rng, world.time,
+                                           timers=world.timers))
+    writer = CheckpointWriter()
+
+    start = time.perf_counter()
+    writer.submit(world, path)
+    submitted = time.perf_counter() - start
+    writer.close()
+    written = time.perf_counter() - start
+
+    resumed = Game.World()
+    start = time.perf_counter()
+    load(resumed, path)
+    loaded = time.perf_counter() - start
+    assert resumed.capture() == world.capture()
+
+    print(f"{enemies} enemies, {os.path.getsize(path)} bytes")
+    print(f"game thread blocked {submitted * 1e3:.2f} ms, written after {written * 1e3:.2f} ms")
+    print(f"resumed in {loaded * 1e3:.2f} ms")
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,258 @@
+"""Gym-style environments for training and testing bots on Bulletstorm Blitz.
+
+BlitzEnv wraps one headless Game.World. Actions are the server's input
+bitmask (server.INPUT_LEFT | INPUT_RIGHT | INPUT_JUMP | INPUT_SHOOT, so
+0-15), applied for one tick of 1000 / Game.FPS ms. reset() returns
+(observation, info) and step() returns (observation, reward, terminated,
+truncated, info), as in Gymnasium; nothing here depends on it.
+
+Observations are flat array("f") vectors of OBSERVATION_SIZE, built from
+the world state without rendering:
+    player    x and y in the arena, vertical speed, on ground, jumps used,
+              rapid fire, shield, multiplier and whether a shot is ready
+    enemies   the NEAREST_ENEMIES closest, nearest first: dx, dy from the
+              player in screens and 1, or zeros where there are fewer
+    powerups  the NEAREST_POWERUPS closest: dx, dy and a one-hot type
+
+The reward is the score gained in the step, in hundreds, or
+-DEATH_PENALTY when the player is caught, which also ends the episode.
+
+VectorEnv steps several environments in lockstep, in this process or
+split across worker processes, and resets each one when its episode ends.
+
+Run "python env.py" to measure steps per second.
+"""
+
+import argparse
+import heapq
+import multiprocessing
+import random
+import time
+from array import array
+
+import Game
+from server import controls_from_mask
+
+NEAREST_ENEMIES = 8
+NEAREST_POWERUPS = 3
+PLAYER_FEATURES = 9
+ENEMY_FEATURES = 3
+POWERUP_FEATURES = 5
+OBSERVATION_SIZE = (PLAYER_FEATURES + NEAREST_ENEMIES * ENEMY_FEATURES +
+                    NEAREST_POWERUPS * POWERUP_FEATURES)
+ACTIONS = 16
+DEATH_PENALTY = 10.0
+MAX_EPISODE_STEPS = 10000
+TICK_MS = 1000 / Game.FPS
+
+_POWERUP_ONE_HOT = {"rapid_fire": (1, 0, 0), "shield": (0, 1, 0), "multiplier": (0, 0, 1)}
+
+
+def observe(world):
+    """Return world's observation vector as a list of floats."""
+    player = world.player
+    px = player.x + Game.PLAYER_WIDTH / 2
+    py = player.y + Game.PLAYER_HEIGHT / 2
+    shot_delay = Game.SHOT_DELAY / 2 if player.rapid_fire else Game.SHOT_DELAY
+    values = [px / Game.WORLD_WIDTH, py / Game.WORLD_HEIGHT, player.vel_y / 12,
+              float(player.on_ground), player.jumps / Game.MAX_JUMP,
+              float(player.rapid_fire), float(player.shield), player.multiplier / 4,
+              float(world.time - world.last_shot_time > shot_delay)]
+
+    sw, sh = Game.SCREEN_WIDTH, Game.SCREEN_HEIGHT
+    ex, ey = Game.ENEMY_WIDTH / 2 - px, Game.ENEMY_HEIGHT / 2 - py
+    enemies = heapq.nsmallest(NEAREST_ENEMIES,
+                              ((e.x + ex, e.y + ey) for e in world.enemies_group),
+                              key=lambda d: d[0] * d[0] + d[1] * d[1])
+    for dx, dy in enemies:
+        values += (dx / sw, dy / sh, 1.0)
+    values += [0.0] * (ENEMY_FEATURES * (NEAREST_ENEMIES - len(enemies)))
+
+    half = Game.POWERUP_SIZE / 2
+    powerups = heapq.nsmallest(NEAREST_POWERUPS,
+                               ((p.rect.x + half - px, p.rect.y + half - py, p.type)
+                                for p in world.powerups_group),
+                               key=lambda d: d[0] * d[0] + d[1] * d[1])
+    for dx, dy, kind in powerups:
+        values += (dx / sw, dy / sh) + _POWERUP_ONE_HOT[kind]
+    values += [0.0] * (POWERUP_FEATURES * (NEAREST_POWERUPS - len(powerups)))
+    return values
+
+
+class BlitzEnv:
+    def __init__(self, seed=None, max_episode_steps=MAX_EPISODE_STEPS):
+        self.max_episode_steps = max_episode_steps
+        self.seed = seed
+        self.world = None
+        self.steps = 0
+
+    def reset(self, seed=None):
+        if seed is not None:
+            self.seed = seed
+        self.world = Game.World(self.seed, effects=False)
+        # Later episodes from the same env get different, still reproducible, worlds
+        if self.seed is not None:
+            self.seed += 1
+        self.steps = 0
+        return array("f", observe(self.world)), {}
+
+    def step(self, action):
+        world = self.world
+        player = world.player
+        score, deaths = player.score, world.deaths
+        world.step(controls_from_mask(action), world.time + TICK_MS)
+        self.steps += 1
+
+        terminated = world.deaths != deaths
+        reward = -DEATH_PENALTY if terminated else (player.score - score) / 100
+        truncated = not terminated and self.steps >= self.max_episode_steps
+        info = {"score": player.score, "level": player.level}
+        return array("f", observe(world)), reward, terminated, truncated, info
+
+
+def _step_all(envs, actions, observations):
+    # Step envs in lockstep, writing observations into one flat array
+    # and starting a new episode wherever one ended
+    rewards, terminated, truncated, infos = [], [], [], []
+    size = OBSERVATION_SIZE
+    for i, (env, action) in enumerate(zip(envs, actions)):
+        obs, reward, term, trunc, info = env.step(action)
+        if term or trunc:
+            info["final_observation"] = obs
+            obs, _ = env.reset()
+        start = i * size
+        observations[start:start + size] = obs
+        rewards.append(reward)
+        terminated.append(term)
+        truncated.append(trunc)
+        infos.append(info)
+    return rewards, terminated, truncated, infos
+
+
+def _worker(connection, seeds, max_episode_steps):
+    envs = [BlitzEnv(seed, max_episode_steps) for seed in seeds]
+    observations = array("f", bytes(4 * OBSERVATION_SIZE * len(envs)))
+    try:
+        while True:
+            command, actions = connection.recv()
+            if command == "reset":
+                for i, env in enumerate(envs):
+                    start = i * OBSERVATION_SIZE
+                    observations[start:start + OBSERVATION_SIZE] = env.reset()[0]
+                connection.send((observations.tobytes(), None))
+            elif command == "step":
+                results = _step_all(envs, actions, observations)
+                connection.send((observations.tobytes(), results))
+            else:
+                break
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        connection.close()
+
+
+class VectorEnv:
+    """num_envs BlitzEnvs stepped together.
+
+    Observations come back as one flat array("f") holding num_envs
+    consecutive OBSERVATION_SIZE vectors; rewards and flags are lists.
+    With workers > 0 the environments are split between that many
+    processes, which pays off once there are several cores to use.
+    """
+
+    def __init__(self, num_envs, seed=None, workers=0, max_episode_steps=MAX_EPISODE_STEPS):
+        self.num_envs = num_envs
+        seeds = [None if seed is None else seed + i * 1000003 for i in range(num_envs)]
+        self.observations = array("f", bytes(4 * OBSERVATION_SIZE * num_envs))
+        self.envs = []
+        self.workers = []  # (connection, process, first env index, env count)
+        if workers:
+            per_worker = -(-num_envs // workers)
+            for first in range(0, num_envs, per_worker):
+                chunk = seeds[first:first + per_worker]
+                parent, child = multiprocessing.Pipe()
+                process = multiprocessing.Process(target=_worker,
+                                                  args=(child, chunk, max_episode_steps),
+                                                  daemon=True)
+                process.start()
+                child.close()
+                self.workers.append((parent, process, first, len(chunk)))
+        else:
+            self.envs = [BlitzEnv(s, max_episode_steps) for s in seeds]
+
+    def reset(self):
+        size = OBSERVATION_SIZE
+        for i, env in enumerate(self.envs):
+            self.observations[i * size:(i + 1) * size] = env.reset()[0]
+        for connection, _, _, _ in self.workers:
+            connection.send(("reset", None))
+        self._gather()
+        return self.observations, [{} for _ in range(self.num_envs)]
+
+    def step(self, actions):
+        if len(actions) != self.num_envs:
+            raise ValueError("expected %d actions, got %d" % (self.num_envs, len(actions)))
+        # Start the workers first so they run while this process steps its own envs
+        for connection, _, first, count in self.workers:
+            connection.send(("step", actions[first:first + count]))
+        if self.envs:
+            rewards, terminated, truncated, infos = _step_all(self.envs, actions,
+                                                              self.observations)
+        else:
+            rewards, terminated, truncated, infos = [], [], [], []
+        for results in self._gather():
+            rewards += results[0]
+            terminated += results[1]
+            truncated += results[2]
+            infos += results[3]
+        return self.observations, rewards, terminated, truncated, infos
+
+    def _gather(self):
+        results = []
+        size = OBSERVATION_SIZE
+        for connection, _, first, count in self.workers:
+            data, result = connection.recv()
+            self.observations[first * size:(first + count) * size] = array("f", data)
+            results.append(result)
+        return results
+
+    def close(self):
+        for connection, process, _, _ in self.workers:
+            try:
+                connection.send(("close", None))
+            except OSError:
+                pass
+            connection.close()
+            process.join()
+        self.workers = []
+
+
+def benchmark(num_envs=64, workers=0, steps=200):
+    """Step num_envs environments with random actions; prints steps per second."""
+    env = VectorEnv(num_envs, seed=1, workers=workers)
+    env.reset()
+    rng = random.Random(1)
+    start = time.perf_counter()
+    episodes = 0
+    for _ in range(steps):
+        actions = [rng.randrange(ACTIONS) for _ in range(num_envs)]
+        _, _, terminated, truncated, _ = env.step(actions)
+        episodes += sum(terminated) + sum(truncated)
+    elapsed = time.perf_counter() - start
+    env.close()
+    rate = num_envs * steps / elapsed
+    print(f"{num_envs} envs, {workers} workers: {rate:.0f} steps/s, {episodes} episodes ended")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--envs", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=0, help="worker processes, 0 to step in-process")
+    parser.add_argument("--steps", type=int, default=200)
+    args = parser.parse_args()
+    benchmark(args.envs, args.workers, args.steps)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""Gameplay event log for Bulletstorm Blitz analytics.
+
+A World given an EventLog records what happens in the game as typed
+events: kills, power-up pickups, multiplier changes, deaths and new levels.
+Each event is a time, a kind, a player index and three numbers (x, y and
+a value whose meaning depends on the kind, see EVENT_TYPES).
+
+Recording writes the event into preallocated arrays used as a ring buffer,
+so nothing is allocated per event and the game thread never touches the
+disk. A background thread takes the recorded events out in batches, once
+BATCH have piled up or every INTERVAL seconds, and appends each batch to
+the log file as columns. If the game ever gets a whole ring ahead of the
+writer, new events are counted in dropped instead of waiting for room.
+Once a file reaches max_bytes it is renamed to path.1 (path.1 to path.2
+and so on, keeping backups of them) and a new one is started.
+
+File layout (little-endian):
+    header   magic (4s), version (H)
+    batches  count (I), then one column of count values per field, in
+             the order and with the typecodes of COLUMNS
+
+Run "python events.py" to measure what logging costs a busy game.
+"""
+
+import argparse
+import math
+import os
+import random
+import struct
+import sys
+import threading
+import time
+from array import array
+from collections import namedtuple
+
+MAGIC = b"BSEV"
+VERSION = 1
+
+CAPACITY = 65536    # events the ring holds
+BATCH = 4096        # events that wake the writer
+INTERVAL = 1.0      # s; the writer wakes at least this often
+MAX_BYTES = 16 * 1024 * 1024
+BACKUPS = 5
+
+# Kinds of event, and what x, y and value hold for each
+KILL = 0        # where the enemy was; points scored
+PICKUP = 1      # where the power-up was; its Game.POWERUP_TYPES index
+MULTIPLIER = 2  # unused; the new multiplier
+DEATH = 3       # where the player was caught; score lost
+LEVEL_UP = 4    # unused; the new level
+EVENT_TYPES = ["kill", "pickup", "multiplier", "death", "level_up"]
+
+COLUMNS = [("time", "d"), ("kind", "B"), ("player", "B"), ("x", "f"), ("y", "f"), ("value", "d")]
+FILE_HEADER = struct.Struct("<4sH")
+BATCH_HEADER = struct.Struct("<I")
+
+# An event as read back from a log, with kind as its EVENT_TYPES name
+Event = namedtuple("Event", [name for name, typecode in COLUMNS])
+
+_SWAP = sys.byteorder != "little"
+
+
+class EventLog:
+    """Records events on the game thread and writes them to path on its own."""
+
+    def __init__(self, path, capacity=CAPACITY, batch=BATCH, interval=INTERVAL,
+                 max_bytes=MAX_BYTES, backups=BACKUPS):
+        self.path = path
+        self.capacity = capacity
+        self.batch = batch
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.time = array("d", bytes(8 * capacity))
+        self.kind = array("B", bytes(capacity))
+        self.player = array("B", bytes(capacity))
+        self.x = array("f", bytes(4 * capacity))
+        self.y = array("f", bytes(4 * capacity))
+        self.value = array("d", bytes(8 * capacity))
+        # Both count up without wrapping; slot = count % capacity. Only
+        # record() moves recorded on, and only the writer moves taken on.
+        self.recorded = 0
+        self.taken = 0
+        self.dropped = 0
+        self.written = 0  # events on disk
+        self.busy = 0.0   # s the writer has spent taking events out and writing them
+        self.errors = []
+        self._file = None
+        self._drain_lock = threading.Lock()
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="event-writer", daemon=True)
+        self._thread.start()
+
+    def record(self, kind, now, player=0, x=0.0, y=0.0, value=0.0):
+        recorded = self.recorded
+        if recorded - self.taken >= self.capacity:
+            self.dropped += 1
+            return
+        i = recorded % self.capacity
+        self.time[i] = now
+        self.kind[i] = kind
+        self.player[i] = player
+        self.x[i] = x
+        self.y[i] = y
+        self.value[i] = value
+        self.recorded = recorded + 1
+        if recorded + 1 - self.taken == self.batch:
+            with self._cond:
+                self._cond.notify()
+
+    def flush(self):
+        """Write out every event recorded so far."""
+        self._drain()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._closed or self.recorded - self.taken >= self.batch,
+                                    self.interval)
+                closed = self._closed
+            self._drain()
+            if closed:
+                return
+
+    def _drain(self):
+        with self._drain_lock:
+            start, end = self.taken, self.recorded
+            if start == end:
+                return
+            started = time.perf_counter()
+            # Copy the events out, as one or two slices of the ring, and
+            # hand their slots back before the slow part
+            first = start % self.capacity
+            last = first + end - start
+            columns = []
+            for name, typecode in COLUMNS:
+                ring = getattr(self, name)
+                column = ring[first:last]
+                if last > self.capacity:
+                    column += ring[:last - self.capacity]
+                columns.append(column)
+            self.taken = end
+            try:
+                self._write(end - start, columns)
+            except OSError as e:
+                self.errors.append(e)
+            self.busy += time.perf_counter() - started
+
+    def _write(self, count, columns):
+        if self._file is None:
+            self._file = open(self.path, "ab")
+            if self._file.tell() == 0:
+                self._file.write(FILE_HEADER.pack(MAGIC, VERSION))
+        out = [BATCH_HEADER.pack(count)]
+        for column in columns:
+            if _SWAP:
+                column.byteswap()
+            out.append(column.tobytes())
+        self._file.write(b"".join(out))
+        self._file.flush()
+        self.written += count
+        if self._file.tell() >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        for n in range(self.backups - 1, 0, -1):
+            older = "%s.%d" % (self.path, n)
+            if os.path.exists(older):
+                os.replace(older, "%s.%d" % (self.path, n + 1))
+        if self.backups:
+            os.replace(self.path, self.path + ".1")
+        else:
+            os.remove(self.path)
+
+
+def read_events(path):
+    """Yield the Events in the log file at path, oldest first."""
+    with open(path, "rb") as f:
+        data = memoryview(f.read())
+    magic, version = FILE_HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("%s is not an event log" % path)
+    offset = FILE_HEADER.size
+    while offset < len(data):
+        (count,) = BATCH_HEADER.unpack_from(data, offset)
+        offset += BATCH_HEADER.size
+        columns = []
+        for name, typecode in COLUMNS:
+            column = array(typecode)
+            end = offset + count * column.itemsize
+            column.frombytes(data[offset:end])
+            if _SWAP:
+                column.byteswap()
+            columns.append(column)
+            offset = end
+        for now, kind, player, x, y, value in zip(*columns):
+            yield Event(now, EVENT_TYPES[kind], player, x, y, value)
+
+
+def _stress_world(Game, enemies):
+    # A shielded player firing rapid fire into a crowd round them
+    world = Game.World(seed=1, effects=False)
+    world.player.shield = world.player.rapid_fire = True  # Without timers, so they last
+    for _ in range(enemies):
+        enemy = Game.Enemy(world.player, world.rng, world.time, timers=world.timers)
+        enemy.x = world.player.x + world.rng.uniform(-Game.SCREEN_WIDTH, Game.SCREEN_WIDTH)
+        enemy.y = world.rng.uniform(0, Game.WORLD_HEIGHT - 100)
+        enemy.rect.topleft = (round(enemy.x), round(enemy.y))
+        world.enemies_group.add(enemy)
+    return world
+
+
+def run_stress(ticks, log, enemies=300, volley=20):
+    """Play ticks of a stress session, recording into log (or not, if
+    None), and return the ms the ticks took. Besides the player's own
+    shots, volley bullets a tick spray out into the crowd."""
+    import Game
+
+    world = _stress_world(Game, enemies)
+    world.events = log
+    controls = Game.Controls(shoot=True)
+    rng = random.Random(1)  # For the volleys, leaving the world's rng to the game
+    start = time.perf_counter()
+    for tick in range(ticks):
+        player = world.player
+        for _ in range(volley):
+            bullet = Game.Bullet(player.x + Game.PLAYER_WIDTH / 2, player.y + Game.PLAYER_HEIGHT / 2, ())
+            angle = rng.uniform(0, 2 * math.pi)
+            bullet.velocity_x = math.cos(angle) * Game.BULLET_SPEED
+            bullet.velocity_y = math.sin(angle) * Game.BULLET_SPEED
+            world.bullets_group.add(bullet)
+        world.step(controls, (tick + 1) * 1000 / Game.FPS)
+        if not world.enemies_group:
+            # Keep the crowd up rather than waiting for the next wave
+            world.enemies_group.add(_stress_world(Game, enemies).enemies_group.sprites())
+    return (time.perf_counter() - start) * 1000
+
+
+def _remove_logs(path):
+    for name in [path] + ["%s.%d" % (path, n) for n in range(1, BACKUPS + 1)]:
+        if os.path.exists(name):
+            os.remove(name)
+
+
+def benchmark(ticks=1200, events=1000000, path="events_bench.log"):
+    """Time record() on its own, rotating through small files, then work
+    out what logging costs a stress session."""
+    _remove_logs(path)
+    log = EventLog(path, max_bytes=MAX_BYTES // 4)
+    start = time.perf_counter()
+    for i in range(events):
+        log.record(KILL, i, 0, 1.0, 2.0, 100)
+    each = (time.perf_counter() - start) / events * 1000  # ms
+    log.close()
+    files = [name for name in [path] + ["%s.%d" % (path, n) for n in range(1, BACKUPS + 1)]
+             if os.path.exists(name)]
+    read = sum(1 for name in files for event in read_events(name))
+    size = sum(os.path.getsize(name) for name in files)
+    print(f"{events} events: record {each * 1e3:.2f} us each, {log.dropped} dropped, "
+          f"{read} read back from {len(files)} files, {size / read:.1f} bytes each")
+    _remove_logs(path)
+
+    # Timing the session with and without the log is lost in the noise
+    # of a few percent, so the cost is added up instead: record() calls
+    # at the rate above, plus the time the writer thread was busy
+    log = EventLog(path)
+    elapsed = run_stress(ticks, log)
+    log.close()
+    counts = {}
+    for event in read_events(path):
+        counts[event.kind] = counts.get(event.kind, 0) + 1
+    _remove_logs(path)
+    cost = log.written * each + log.busy * 1000
+    print(f"stress session, {ticks} ticks at {elapsed / ticks:.2f} ms: {log.written} events (" +
+          ", ".join(f"{count} {kind}" for kind, count in sorted(counts.items())) +
+          f"), recording and writing them took {cost:.2f} ms, {cost / elapsed:.2%} of the session")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ticks", type=int, default=1200)
+    parser.add_argument("--dump", metavar="LOG", help="print the events in a log file instead")
+    args = parser.parse_args()
+    if args.dump:
+        for event in read_events(args.dump):
+            print(f"{event.time:10.1f} {event.kind:10} player {event.player} "
+                  f"({event.x:.0f}, {event.y:.0f}) {event.value:g}")
+    else:
+        benchmark(args.ticks)
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    main()
@@ -0,0 +1,201 @@
+"""Adaptive quality for Bulletstorm Blitz: optional work traded for frame rate.
+
+A QualityGovernor is told how long each frame's own work took (simulating
+and drawing, not the wait in clock.tick()) and keeps a rolling window of
+those times. When the window's average goes over the frame budget it
+drops one quality level; once the average has stayed well under budget
+for a while it climbs back one level. Each level gives up one more piece
+of optional work, the one players miss least first:
+
+    level 1  HUD text redrawn every HUD_INTERVAL frames, not every frame
+    level 2  no ring round the shielded player
+    level 3  no particle effects drawn (hits still emit them)
+    level 4  distant enemies re-think half as often
+    level 5  power-up spawn rolls made every POWERUP_INTERVAL ticks, with
+             the odds raised to match, instead of every tick
+
+A level that gets dropped again soon after being restored waits twice as
+long before the next try, so the governor does not flicker between two
+levels that straddle the budget. Every change is logged to the
+"governor" logger at INFO, and kept in QualityGovernor.changes.
+
+Run "python governor.py" for the benchmark scenarios, which run crowded
+worlds with and without the governor and report how many frames go over
+budget.
+"""
+
+import argparse
+import logging
+import random
+import time
+from collections import deque, namedtuple
+
+WINDOW = 30          # frames averaged for each decision
+HEADROOM = 0.6       # restore only below this fraction of the budget
+COOLDOWN = 60        # frames at a level before trying the one above
+MAX_COOLDOWN = 1920
+HUD_INTERVAL = 6
+POWERUP_INTERVAL = 4
+
+log = logging.getLogger("governor")
+
+# What a quality level allows. far_update_interval is in ticks, as
+# Game.FAR_UPDATE_INTERVAL; None there means the game's own default.
+Quality = namedtuple("Quality", ["hud_interval", "shield_ring", "effects",
+                                 "far_update_interval", "powerup_interval"])
+
+QUALITY_LEVELS = [
+    Quality(1, True, True, None, 1),
+    Quality(HUD_INTERVAL, True, True, None, 1),
+    Quality(HUD_INTERVAL, False, True, None, 1),
+    Quality(HUD_INTERVAL, False, False, None, 1),
+    Quality(HUD_INTERVAL, False, False, 8, 1),
+    Quality(HUD_INTERVAL, False, False, 8, POWERUP_INTERVAL),
+]
+FULL_QUALITY = QUALITY_LEVELS[0]
+
+
+class QualityGovernor:
+    def __init__(self, budget, window=WINDOW, headroom=HEADROOM,
+                 cooldown=COOLDOWN, levels=QUALITY_LEVELS):
+        # budget is the frame time in ms, 1000 / Game.FPS for the game
+        self.budget = budget
+        self.headroom = headroom
+        self.base_cooldown = self.cooldown = cooldown
+        self.levels = levels
+        self.level = 0
+        self.times = deque(maxlen=window)
+        self.total = 0.0
+        self.frame = 0
+        self.changed_at = 0     # frame of the last change
+        self.restored_at = None  # frame of the last climb, if nothing has been dropped since
+        self.changes = []       # (frame, old level, new level, average ms)
+
+    @property
+    def quality(self):
+        return self.levels[self.level]
+
+    def record(self, frame_ms):
+        """Add one frame's work time and return the Quality for the next frame."""
+        times = self.times
+        if len(times) == times.maxlen:
+            self.total -= times[0]
+        times.append(frame_ms)
+        self.total += frame_ms
+        self.frame += 1
+        if len(times) < times.maxlen:
+            return self.quality
+
+        average = self.total / len(times)
+        if average > self.budget and self.level < len(self.levels) - 1:
+            if self.restored_at is not None and self.frame - self.restored_at <= 2 * times.maxlen:
+                # The level just restored does not fit after all
+                self.cooldown = min(self.cooldown * 2, MAX_COOLDOWN)
+            else:
+                self.cooldown = self.base_cooldown
+            self.restored_at = None
+            self._set_level(self.level + 1, average)
+        elif (average < self.budget * self.headroom and self.level > 0 and
+              self.frame - self.changed_at >= self.cooldown):
+            self.restored_at = self.frame
+            self._set_level(self.level - 1, average)
+        return self.quality
+
+    def _set_level(self, level, average):
+        log.info("quality level %d -> %d: %.1f ms average over the last %d frames, budget %.1f ms",
+                 self.level, level, average, len(self.times), self.budget)
+        self.changes.append((self.frame, self.level, level, average))
+        self.level = level
+        self.changed_at = self.frame
+        # Judge the new level on its own frames only
+        self.times.clear()
+        self.total = 0.0
+
+
+def _crowd(world, Game, enemies):
+    # Enemies spread over the whole arena, most of them far from the view
+    for _ in range(enemies):
+        enemy = Game.Enemy(world.player, world.rng, world.time, timers=world.timers)
+        enemy.x = world.rng.uniform(0, Game.WORLD_WIDTH - Game.ENEMY_WIDTH)
+        enemy.y = world.rng.uniform(0, Game.WORLD_HEIGHT - 100)
+        enemy.rect.topleft = (round(enemy.x), round(enemy.y))
+        world.enemies_group.add(enemy)
+
+
+def run_scenario(name, enemies, explosions, frames, governed, budget):
+    """Play frames ticks of a crowded world, drawing each one, and return
+    the work time of every frame in ms and the governor (or None)."""
+    import pygame
+    import Game
+
+    pygame.font.init()
+    screen = pygame.Surface((Game.SCREEN_WIDTH, Game.SCREEN_HEIGHT))
+    hud = Game.Hud(pygame.font.Font(None, 36))
+    world = Game.World(seed=1)
+    world.player.shield = True  # Without a timer, so it lasts the whole run
+    _crowd(world, Game, enemies)
+    governor = QualityGovernor(budget) if governed else None
+    quality = FULL_QUALITY
+    controls = Game.Controls(shoot=True)
+    rng = random.Random(1)  # For the explosions, leaving the world's rng to the game
+    times = []
+    for frame in range(frames):
+        start = time.perf_counter()
+        now = (frame + 1) * 1000 / Game.FPS
+        world.set_quality(quality)
+        world.step(controls, now)
+        for _ in range(explosions):
+            world.particles.emit(rng.uniform(0, Game.WORLD_WIDTH),
+                                 rng.uniform(0, Game.WORLD_HEIGHT), Game.RED, now, 40)
+        Game.render(screen, hud, world.render_state(quality), quality)
+        elapsed = (time.perf_counter() - start) * 1000
+        times.append(elapsed)
+        if governor:
+            quality = governor.record(elapsed)
+    return times, governor
+
+
+SCENARIOS = [
+    # name, enemies, explosions per frame
+    ("calm", 30, 0),
+    ("crowd", 3000, 0),
+    ("fireworks", 300, 40),
+    ("storm", 3000, 40),
+]
+
+
+def benchmark(frames=600, budget=None):
+    """Run each scenario at full quality and governed; print frame times.
+    budget defaults to one frame at Game.FPS."""
+    import Game
+
+    budget = budget or 1000 / Game.FPS
+    for name, enemies, explosions in SCENARIOS:
+        for governed in (False, True):
+            times, governor = run_scenario(name, enemies, explosions, frames, governed, budget)
+            # Skip the first second, while the governor finds its level
+            steady = sorted(times[Game.FPS:])
+            over = sum(t > budget for t in steady) / len(steady)
+            levels = f", level {governor.level}, {len(governor.changes)} changes" if governor else ""
+            print(f"{name:9} {'governed' if governed else 'full':8}: "
+                  f"mean {sum(steady) / len(steady):5.1f} ms, "
+                  f"p95 {steady[int(len(steady) * 0.95)]:5.1f} ms, "
+                  f"{over:4.0%} over {budget:.1f} ms{levels}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--budget", type=float, default=None,
+                        help="frame budget in ms (default: one frame at Game.FPS)")
+    parser.add_argument("--verbose", action="store_true", help="log each quality change")
+    args = parser.parse_args()
+    if args.verbose:
+        logging.basicConfig(level=logging.INFO, format="%(name)s: %(message)s")
+    benchmark(args.frames, args.budget)
+
+
+if __name__ == "__main__":
+    import os
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    main()
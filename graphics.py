@@ -55,12 +55,51 @@ manipulation, Pixmap. A pixmap can be loaded from a file and displayed
 using an Image object. Both getPixel and setPixel methods are provided
 for manipulating the image.
 
+For batch jobs on machines without a display, OffscreenGraphWin can be
+used in place of GraphWin. Objects are drawn into it in the usual way
+and the result is saved to a PNG or PPM file with its save method.
+
+Programs that redraw everything each frame can use a Scene instead of
+drawing objects directly: they pass it the complete set of shapes for
+the frame, and it changes only the canvas items that differ from the
+frame before.
+
+Images too large to decode at once, such as big maps, are first
+converted with buildTiles and then shown with a TiledImage, which
+decodes only the tiles in view.
+
 DOCUMENTATION: For complete documentation, see Chapter 4 of "Python
 Programming: An Introduction to Computer Science" by John Zelle,
 published by Franklin, Beedle & Associates.  Also see
 http://mcsp.wartburg.edu/zelle/python for a quick reference"""
 
-__version__ = "5.0"
+__version__ = "5.1"
+
+# Version 5.1
+#     * Tk root is created lazily, so importing the module no longer
+#       needs a display
+#     * Added OffscreenGraphWin, an in-memory raster that draws the same
+#       objects as GraphWin and can save the result as PNG or PPM
+#     * Polygon._draw calls create_polygon on the canvas it is given
+#     * redraw (and so setCoords) moves existing canvas items in place
+#       instead of deleting and recreating them
+#     * Added Image.setImage to change image contents in place, and
+#       Image.release to recycle photoimages of the same size
+#     * Image.imageCache evicts entries of images no longer drawn once it
+#       holds more than Image.cacheSize entries
+#     * Added GraphWin.post and postBatch, which may be called from any
+#       thread to queue drawing calls for the GUI thread
+#     * Added GraphWin.objectsAt and objectsIn, answered from a grid
+#       index of drawn objects' bounding boxes
+#     * Added opt-in GraphStats (GraphWin.startStats/stopStats and the
+#       profile context manager) counting and timing autoflush updates,
+#       item creation, deletion, moves, reconfigs and transforms
+#     * Added Scene, retained-mode drawing: each frame's shapes are
+#       compared with the last frame's and only the canvas calls for
+#       what changed are made, with one screen update per frame
+#     * Added TiledImage and buildTiles, for images too large to decode
+#       at once: only the tiles in view are decoded, from a mip level
+#       matching the zoom, and kept in a shared cache of bounded size
 
 # Version 5 8/26/2016
 #     * update at bottom to fix MacOS issue causing askopenfile() to hang
@@ -161,6 +200,10 @@ __version__ = "5.0"
 #     Added Entry boxes.
 
 import time, os, sys
+import math, struct, zlib, threading, weakref
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
 
 try:  # import as appropriate for 2.x vs. 3.x
    import tkinter as tk
@@ -182,11 +225,22 @@ BAD_OPTION = "Illegal option value"
 ##########################################################################
 # global variables and funtions
 
-_root = tk.Tk()
-_root.withdraw()
+# The Tk root is created the first time a window (or Tk-backed object)
+#   needs it, so that importing the module works without a display.
+_root = None
+
+def _get_root():
+    global _root
+    if _root is None:
+        _root = tk.Tk()
+        _root.withdraw()
+        _root.update()   # MacOS fix 1
+    return _root
 
 _update_lasttime = time.time()
 
+_windows = [] # open GraphWins, whose pending calls update applies
+
 def update(rate=None):
     global _update_lasttime
     if rate:
@@ -198,7 +252,239 @@ def update(rate=None):
         else:
             _update_lasttime = now
 
-    _root.update()
+    for win in _windows[:]:
+        win.applyPending()
+    _get_root().update()
+
+
+def _autoflush(win):
+    # Flush pending drawing to the screen if the window asks for it,
+    #   making any posted calls first as every other update does
+    if win.autoflush:
+        win._pending.run(win)
+        stats = win.stats
+        if stats:
+            start = time.perf_counter()
+            _get_root().update()
+            stats.record("update", start)
+        else:
+            _get_root().update()
+
+
+class GraphStats:
+
+    """Counts and times the work a window does: screen updates made by
+    autoflush, canvas item creation, deletion, moves and reconfigs, and
+    coordinate transforms. Attach one to a window with its startStats
+    method, or use the profile context manager."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Clear all counts and times"""
+        self.counts = {}
+        self.times = {}
+        self.started = time.perf_counter()
+
+    def record(self, operation, start):
+        """Count one operation that began at time.perf_counter() start"""
+        elapsed = time.perf_counter() - start
+        self.counts[operation] = self.counts.get(operation, 0) + 1
+        self.times[operation] = self.times.get(operation, 0.0) + elapsed
+
+    def summary(self):
+        """Return a printable table of the recorded operations"""
+        lines = ["{:<12}{:>10}{:>12}{:>12}".format("operation", "count",
+                                                    "total ms", "mean us")]
+        for op in sorted(self.times, key=self.times.get, reverse=True):
+            count, total = self.counts[op], self.times[op]
+            lines.append("{:<12}{:>10}{:>12.2f}{:>12.1f}".format(
+                op, count, total * 1e3, total / count * 1e6))
+        lines.append("over {:.3f} s".format(time.perf_counter() - self.started))
+        return "\n".join(lines)
+
+@contextmanager
+def profile(win, file=None):
+    """Collect GraphStats for win while the with block runs, then print
+    a summary to file (sys.stderr by default). The stats object is the
+    value of the with statement."""
+    stats = win.startStats()
+    try:
+        yield stats
+    finally:
+        win.stopStats()
+        print(stats.summary(), file=file or sys.stderr)
+
+
+class _CallQueue:
+
+    """Internal class: calls posted from any thread, waiting to be made
+    on the thread that owns the window"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = []
+        self.closed = False
+
+    def put(self, calls):
+        # Calls posted once the window is closed are cancelled straight
+        #   away, so nobody waits on them forever
+        entries = [(Future(), call[0], call[1:]) for call in calls]
+        with self.lock:
+            closed = self.closed
+            if not closed:
+                self.calls.extend(entries)
+        if closed:
+            for future, func, args in entries:
+                future.cancel()
+        return [entry[0] for entry in entries]
+
+    def take(self):
+        with self.lock:
+            calls, self.calls = self.calls, []
+        return calls
+
+    def run(self, win):
+        # Makes the queued calls with autoflush suspended, so a batch
+        #   costs a single screen update. Returns True if any were made.
+        calls = self.take()
+        if not calls:
+            return False
+        autoflush = win.autoflush
+        win.autoflush = False
+        try:
+            for future, func, args in calls:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(func(*args))
+                    except Exception as e:
+                        future.set_exception(e)
+        finally:
+            win.autoflush = autoflush
+        return True
+
+    def cancel(self):
+        # Closes the queue to new calls and cancels those waiting
+        with self.lock:
+            self.closed = True
+            calls, self.calls = self.calls, []
+        for future, func, args in calls:
+            future.cancel()
+
+
+class _SpatialGrid:
+
+    """Internal class: a uniform grid over the screen bounding boxes of
+    the objects drawn in a window, used for hit-testing"""
+
+    cellSize = 64
+    maxCells = 64 # objects spanning more cells than this are kept aside
+
+    def __init__(self):
+        self.bounds = {}  # object -> (x1, y1, x2, y2)
+        self.cells = {}   # (col, row) -> set of objects
+        self.large = set()
+        self.order = {}   # object -> draw sequence, for stacking order
+        self.seq = 0
+
+    def _cellRange(self, bounds):
+        s = self.cellSize
+        x1, y1, x2, y2 = bounds
+        return int(x1 // s), int(y1 // s), int(x2 // s), int(y2 // s)
+
+    def _place(self, obj, bounds):
+        self.bounds[obj] = bounds
+        c1, r1, c2, r2 = self._cellRange(bounds)
+        if (c2 - c1 + 1) * (r2 - r1 + 1) > self.maxCells:
+            self.large.add(obj)
+            return
+        for c in range(c1, c2 + 1):
+            for r in range(r1, r2 + 1):
+                self.cells.setdefault((c, r), set()).add(obj)
+
+    def _unplace(self, obj):
+        bounds = self.bounds.pop(obj, None)
+        if bounds is None:
+            return
+        if obj in self.large:
+            self.large.discard(obj)
+            return
+        c1, r1, c2, r2 = self._cellRange(bounds)
+        for c in range(c1, c2 + 1):
+            for r in range(r1, r2 + 1):
+                cell = self.cells[(c, r)]
+                cell.discard(obj)
+                if not cell:
+                    del self.cells[(c, r)]
+
+    def insert(self, obj, bounds):
+        if bounds is None:
+            return
+        self.seq += 1
+        self.order[obj] = self.seq
+        self._place(obj, bounds)
+
+    def remove(self, obj):
+        self._unplace(obj)
+        self.order.pop(obj, None)
+
+    def update(self, obj, bounds):
+        if obj not in self.order:
+            return
+        old = self.bounds[obj]
+        if (bounds is not None and obj not in self.large and
+                self._cellRange(old) == self._cellRange(bounds)):
+            self.bounds[obj] = bounds
+            return
+        self._unplace(obj)
+        if bounds is None:
+            del self.order[obj]
+        else:
+            self._place(obj, bounds)
+
+    def shift(self, obj, dx, dy):
+        bounds = self.bounds.get(obj)
+        if bounds is not None:
+            x1, y1, x2, y2 = bounds
+            self.update(obj, (x1 + dx, y1 + dy, x2 + dx, y2 + dy))
+
+    def query(self, x1, y1, x2, y2, enclosed=False):
+        # Returns objects overlapping (or enclosed by) the box, topmost first
+        candidates = set(self.large)
+        c1, r1, c2, r2 = self._cellRange((x1, y1, x2, y2))
+        if (c2 - c1 + 1) * (r2 - r1 + 1) > len(self.cells):
+            for cell in self.cells.values():
+                candidates.update(cell)
+        else:
+            for c in range(c1, c2 + 1):
+                for r in range(r1, r2 + 1):
+                    cell = self.cells.get((c, r))
+                    if cell:
+                        candidates.update(cell)
+        found = []
+        for obj in candidates:
+            bx1, by1, bx2, by2 = self.bounds[obj]
+            if enclosed:
+                hit = x1 <= bx1 and bx2 <= x2 and y1 <= by1 and by2 <= y2
+            else:
+                hit = bx1 <= x2 and x1 <= bx2 and by1 <= y2 and y1 <= by2
+            if hit:
+                found.append(obj)
+        found.sort(key=self.order.get, reverse=True)
+        return found
+
+
+def _itemBounds(canvas, item):
+    # Screen bounding box of a drawn item, or None if it can't be found
+    bounds = canvas.bbox(item.id)
+    if bounds:
+        return tuple(bounds)
+    coords = item._coords(canvas)
+    if not coords:
+        return None
+    xs, ys = coords[0::2], coords[1::2]
+    return min(xs), min(ys), max(xs), max(ys)
 
 ############################################################################
 # Graphics classes start here
@@ -210,7 +496,7 @@ class GraphWin(tk.Canvas):
     def __init__(self, title="Graphics Window",
                  width=200, height=200, autoflush=True):
         assert type(title) == type(""), "Title must be a string"
-        master = tk.Toplevel(_root)
+        master = tk.Toplevel(_get_root())
         master.protocol("WM_DELETE_WINDOW", self.close)
         tk.Canvas.__init__(self, master, width=width, height=height,
                            highlightthickness=0, bd=0)
@@ -229,9 +515,13 @@ class GraphWin(tk.Canvas):
         self._mouseCallback = None
         self.trans = None
         self.closed = False
+        self._pending = _CallQueue()
+        self._index = _SpatialGrid()
+        self.stats = None
+        _windows.append(self)
         master.lift()
         self.lastKey = ""
-        if autoflush: _root.update()
+        if autoflush: _get_root().update()
 
     def __repr__(self):
         if self.isClosed():
@@ -269,6 +559,8 @@ class GraphWin(tk.Canvas):
 
         if self.closed: return
         self.closed = True
+        _windows.remove(self)
+        self._pending.cancel()
         self.master.destroy()
         self.__autoflush()
 
@@ -282,8 +574,18 @@ class GraphWin(tk.Canvas):
 
 
     def __autoflush(self):
-        if self.autoflush:
-            _root.update()
+        _autoflush(self)
+
+    def startStats(self):
+        """Start counting and timing the window's operations. Returns
+        the GraphStats object that accumulates them."""
+        self.stats = GraphStats()
+        return self.stats
+
+    def stopStats(self):
+        """Stop collecting stats and return what was collected"""
+        stats, self.stats = self.stats, None
+        return stats
 
     
     def plot(self, x, y, color="black"):
@@ -304,6 +606,32 @@ class GraphWin(tk.Canvas):
         """Update drawing to the window"""
         self.__checkOpen()
         self.update_idletasks()
+
+    def post(self, func, *args):
+        """Arrange for func(*args) to be called on the thread that owns
+        the window, the next time it updates. Unlike the other methods
+        this one may be called from any thread (or asyncio task).
+        Returns a concurrent.futures.Future for the result of the call.
+        Calls still waiting when the window closes, or posted after, are
+        cancelled."""
+        return self._pending.put([(func,) + args])[0]
+
+    def postBatch(self, calls):
+        """Like post, for a sequence of (func, arg, ...) tuples. The calls
+        are made in order during the same update. Returns a list of
+        futures, one per call."""
+        return self._pending.put(calls)
+
+    def applyPending(self):
+        """Make the calls queued by post and postBatch. This happens
+        automatically whenever the window updates (including inside
+        getMouse and friends) or the module level update is called."""
+        if self._pending.run(self):
+            self.__autoflush()
+
+    def update(self):
+        self.applyPending()
+        tk.Canvas.update(self)
         
     def getMouse(self):
         """Wait for mouse click and return Point object representing
@@ -366,6 +694,11 @@ class GraphWin(tk.Canvas):
     def toScreen(self, x, y):
         trans = self.trans
         if trans:
+            if self.stats:
+                start = time.perf_counter()
+                xy = trans.screen(x,y)
+                self.stats.record("transform", start)
+                return xy
             return self.trans.screen(x,y)
         else:
             return x,y
@@ -373,6 +706,11 @@ class GraphWin(tk.Canvas):
     def toWorld(self, x, y):
         trans = self.trans
         if trans:
+            if self.stats:
+                start = time.perf_counter()
+                xy = trans.world(x,y)
+                self.stats.record("transform", start)
+                return xy
             return self.trans.world(x,y)
         else:
             return x,y
@@ -388,14 +726,31 @@ class GraphWin(tk.Canvas):
 
     def addItem(self, item):
         self.items.append(item)
+        self._index.insert(item, _itemBounds(self, item))
 
     def delItem(self, item):
         self.items.remove(item)
+        self._index.remove(item)
+
+    def objectsAt(self, point):
+        """Return a list of the drawn objects whose bounding box contains
+        point, topmost first"""
+        x,y = self.toScreen(point.getX(), point.getY())
+        return self._index.query(x, y, x, y)
+
+    def objectsIn(self, rect):
+        """Return a list of the drawn objects lying entirely inside the
+        Rectangle rect, topmost first"""
+        x1,y1 = self.toScreen(rect.p1.x, rect.p1.y)
+        x2,y2 = self.toScreen(rect.p2.x, rect.p2.y)
+        return self._index.query(min(x1,x2), min(y1,y2),
+                                 max(x1,x2), max(y1,y2), enclosed=True)
 
     def redraw(self):
+        # Existing canvas items are moved in place rather than recreated,
+        #   except those of objects without a _coords method
         for item in self.items[:]:
-            item.undraw()
-            item.draw(self)
+            item._redraw(self)
         self.update()
         
                       
@@ -427,6 +782,474 @@ class Transform:
         return x,y
 
 
+##########################################################################
+# Offscreen rendering
+
+# Colors understood by OffscreenGraphWin. Tk knows many more names; these
+#   are the ones in common use, plus anything produced by color_rgb.
+_COLOR_NAMES = {
+    "black": (0, 0, 0), "white": (255, 255, 255),
+    "red": (255, 0, 0), "green": (0, 255, 0), "blue": (0, 0, 255),
+    "yellow": (255, 255, 0), "cyan": (0, 255, 255),
+    "magenta": (255, 0, 255), "gray": (190, 190, 190),
+    "grey": (190, 190, 190), "lightgray": (211, 211, 211),
+    "lightgrey": (211, 211, 211), "darkgray": (169, 169, 169),
+    "darkgrey": (169, 169, 169), "orange": (255, 165, 0),
+    "purple": (160, 32, 240), "brown": (165, 42, 42),
+    "pink": (255, 192, 203), "gold": (255, 215, 0),
+    "navy": (0, 0, 128), "maroon": (176, 48, 96),
+    "darkgreen": (0, 100, 0), "darkblue": (0, 0, 139),
+    "darkred": (139, 0, 0), "lightblue": (173, 216, 230),
+    "lightgreen": (144, 238, 144), "violet": (238, 130, 238),
+    "tan": (210, 180, 140), "salmon": (250, 128, 114),
+    "peachpuff": (255, 218, 185),
+}
+
+def _parse_color(color):
+    # Returns the color as 3 rgb bytes, or None for "" (transparent)
+    if color == "" or color is None:
+        return None
+    if color.startswith("#"):
+        digits = color[1:]
+        n = len(digits) // 3
+        if n in (1, 2, 4) and len(digits) == 3 * n:
+            try:
+                rgb = [int(digits[i*n:(i+1)*n], 16) for i in range(3)]
+            except ValueError:
+                raise GraphicsError(BAD_OPTION)
+            scale = 16 ** n - 1
+            return bytes(v * 255 // scale for v in rgb)
+        raise GraphicsError(BAD_OPTION)
+    try:
+        return bytes(_COLOR_NAMES[color.replace(" ", "").lower()])
+    except KeyError:
+        raise GraphicsError(BAD_OPTION)
+
+
+def _encodePNG(width, height, pixels):
+    # PNG file holding width x height RGB pixels, unfiltered
+    stride = width * 3
+    raw = bytearray()
+    for y in range(height):
+        raw.append(0)  # filter type None
+        raw += pixels[y*stride:(y+1)*stride]
+    def chunk(tag, data):
+        crc = zlib.crc32(tag + data) & 0xffffffff
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", crc)
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) +
+            chunk(b"IDAT", zlib.compress(bytes(raw))) + chunk(b"IEND", b""))
+
+
+class _Raster:
+
+    """Internal class: a width x height RGB pixel buffer with the
+    handful of scan-conversion routines needed by OffscreenGraphWin"""
+
+    def __init__(self, width, height, rgb):
+        self.width = width
+        self.height = height
+        self.pixels = bytearray(rgb * (width * height))
+
+    def span(self, y, x1, x2, rgb):
+        # Fill pixels x1 <= x < x2 on row y
+        if y < 0 or y >= self.height:
+            return
+        x1 = max(int(x1), 0)
+        x2 = min(int(x2), self.width)
+        if x1 >= x2:
+            return
+        i = (y * self.width + x1) * 3
+        self.pixels[i:i + (x2 - x1) * 3] = rgb * (x2 - x1)
+
+    def fillRect(self, x1, y1, x2, y2, rgb):
+        for y in range(max(int(y1), 0), min(int(y2), self.height)):
+            self.span(y, x1, x2, rgb)
+
+    def _ellipseHalfWidth(self, dy, rx, ry):
+        if rx <= 0 or ry <= 0 or abs(dy) >= ry:
+            return None
+        return rx * math.sqrt(1 - (dy / ry) ** 2)
+
+    def ellipse(self, x1, y1, x2, y2, rgb, width=0):
+        # Fills the ellipse inscribed in the box, or only a ring of the
+        #   given width inside its boundary when width > 0
+        cx, cy = (x1 + x2) / 2.0, (y1 + y2) / 2.0
+        rx, ry = abs(x2 - x1) / 2.0, abs(y2 - y1) / 2.0
+        top = max(int(math.floor(cy - ry)), 0)
+        bottom = min(int(math.ceil(cy + ry)), self.height)
+        for y in range(top, bottom):
+            dy = y + 0.5 - cy
+            outer = self._ellipseHalfWidth(dy, rx, ry)
+            if outer is None:
+                continue
+            left, right = round(cx - outer), round(cx + outer)
+            inner = None
+            if width > 0:
+                inner = self._ellipseHalfWidth(dy, rx - width, ry - width)
+            if inner is None:
+                self.span(y, left, right, rgb)
+            else:
+                self.span(y, left, round(cx - inner), rgb)
+                self.span(y, round(cx + inner), right, rgb)
+
+    def polygon(self, points, rgb):
+        # Even-odd scanline fill sampling pixel centers
+        if len(points) < 3:
+            return
+        ys = [p[1] for p in points]
+        top = max(int(math.floor(min(ys))), 0)
+        bottom = min(int(math.ceil(max(ys))), self.height)
+        edges = list(zip(points, points[1:] + points[:1]))
+        for y in range(top, bottom):
+            yc = y + 0.5
+            xs = []
+            for (xa, ya), (xb, yb) in edges:
+                if (ya <= yc < yb) or (yb <= yc < ya):
+                    xs.append(xa + (yc - ya) * (xb - xa) / (yb - ya))
+            xs.sort()
+            for i in range(0, len(xs) - 1, 2):
+                self.span(y, round(xs[i]), round(xs[i+1]), rgb)
+
+    def line(self, x1, y1, x2, y2, rgb, width=1):
+        if width > 1:
+            dx, dy = x2 - x1, y2 - y1
+            length = math.hypot(dx, dy)
+            if length == 0:
+                return
+            nx, ny = -dy / length * width / 2.0, dx / length * width / 2.0
+            self.polygon([(x1 + nx, y1 + ny), (x2 + nx, y2 + ny),
+                          (x2 - nx, y2 - ny), (x1 - nx, y1 - ny)], rgb)
+            return
+        # Tk lines do not include their final point
+        steps = int(max(abs(x2 - x1), abs(y2 - y1)))
+        for i in range(steps):
+            x = int(math.floor(x1 + (x2 - x1) * i / steps))
+            y = int(math.floor(y1 + (y2 - y1) * i / steps))
+            self.span(y, x, x + 1, rgb)
+
+    def toPNG(self):
+        return _encodePNG(self.width, self.height, self.pixels)
+
+    def toPPM(self):
+        return ("P6\n{} {}\n255\n".format(self.width, self.height).encode() +
+                bytes(self.pixels))
+
+
+class OffscreenGraphWin:
+
+    """An in-memory stand-in for GraphWin. GraphicsObjects draw into it
+    exactly as they do into a GraphWin, but no Tk window (and hence no
+    display) is involved. The drawing can be read back with getPixel or
+    written out with save. Text, Entry and Image objects are not
+    rasterized."""
+
+    def __init__(self, title="Graphics Window", width=200, height=200):
+        assert type(title) == type(""), "Title must be a string"
+        self.title = title
+        self.height = int(height)
+        self.width = int(width)
+        self.foreground = "black"
+        self.background = "#d9d9d9"  # Tk's default canvas color
+        self.items = []
+        self.autoflush = False
+        self.trans = None
+        self.closed = False
+        self._mouseCallback = None
+        self._pending = _CallQueue()
+        self._index = _SpatialGrid()
+        self.stats = None
+        self._shapes = {}  # Tk-style id -> [kind, coords, options]
+        self._nextId = 1
+        self._raster = None
+
+    def __repr__(self):
+        if self.isClosed():
+            return "<Closed OffscreenGraphWin>"
+        else:
+            return "OffscreenGraphWin('{}', {}, {})".format(self.title,
+                                                          self.getWidth(),
+                                                          self.getHeight())
+
+    def __str__(self):
+        return repr(self)
+
+    def _checkOpen(self):
+        if self.closed:
+            raise GraphicsError("window is closed")
+
+    def startStats(self):
+        """Start collecting GraphStats; see GraphWin.startStats"""
+        self.stats = GraphStats()
+        return self.stats
+
+    def stopStats(self):
+        """Stop collecting stats and return what was collected"""
+        stats, self.stats = self.stats, None
+        return stats
+
+    def setBackground(self, color):
+        """Set background color of the window"""
+        self._checkOpen()
+        _parse_color(color)
+        self.background = color
+        self._raster = None
+
+    def setCoords(self, x1, y1, x2, y2):
+        """Set coordinates of window to run from (x1,y1) in the
+        lower-left corner to (x2,y2) in the upper-right corner."""
+        self.trans = Transform(self.width, self.height, x1, y1, x2, y2)
+        self.redraw()
+
+    def close(self):
+        """Close the window"""
+        self.closed = True
+        self._pending.cancel()
+
+    def isClosed(self):
+        return self.closed
+
+    def isOpen(self):
+        return not self.closed
+
+    def plot(self, x, y, color="black"):
+        """Set pixel (x,y) to the given color"""
+        self._checkOpen()
+        xs,ys = self.toScreen(x,y)
+        self.create_line(xs,ys,xs+1,ys, fill=color)
+
+    def plotPixel(self, x, y, color="black"):
+        """Set pixel raw (independent of window coordinates) pixel
+        (x,y) to color"""
+        self._checkOpen()
+        self.create_line(x,y,x+1,y, fill=color)
+
+    def flush(self):
+        """Update drawing to the window"""
+        self._checkOpen()
+
+    def post(self, func, *args):
+        """Queue func(*args) to be called on the next update; see
+        GraphWin.post"""
+        return self._pending.put([(func,) + args])[0]
+
+    def postBatch(self, calls):
+        """Queue a sequence of (func, arg, ...) tuples; see
+        GraphWin.postBatch"""
+        return self._pending.put(calls)
+
+    def applyPending(self):
+        """Make the calls queued by post and postBatch"""
+        self._pending.run(self)
+
+    def getMouse(self):
+        raise GraphicsError("getMouse in offscreen window")
+
+    def checkMouse(self):
+        return None
+
+    def getKey(self):
+        raise GraphicsError("getKey in offscreen window")
+
+    def checkKey(self):
+        return ""
+
+    def getHeight(self):
+        """Return the height of the window"""
+        return self.height
+
+    def getWidth(self):
+        """Return the width of the window"""
+        return self.width
+
+    def toScreen(self, x, y):
+        trans = self.trans
+        if trans:
+            return self.trans.screen(x,y)
+        else:
+            return x,y
+
+    def toWorld(self, x, y):
+        trans = self.trans
+        if trans:
+            return self.trans.world(x,y)
+        else:
+            return x,y
+
+    def setMouseHandler(self, func):
+        self._mouseCallback = func
+
+    def addItem(self, item):
+        self.items.append(item)
+        self._index.insert(item, _itemBounds(self, item))
+
+    def delItem(self, item):
+        self.items.remove(item)
+        self._index.remove(item)
+
+    def objectsAt(self, point):
+        """Return a list of the drawn objects whose bounding box contains
+        point, topmost first"""
+        x,y = self.toScreen(point.getX(), point.getY())
+        return self._index.query(x, y, x, y)
+
+    def objectsIn(self, rect):
+        """Return a list of the drawn objects lying entirely inside the
+        Rectangle rect, topmost first"""
+        x1,y1 = self.toScreen(rect.p1.x, rect.p1.y)
+        x2,y2 = self.toScreen(rect.p2.x, rect.p2.y)
+        return self._index.query(min(x1,x2), min(y1,y2),
+                                 max(x1,x2), max(y1,y2), enclosed=True)
+
+    def redraw(self):
+        for item in self.items[:]:
+            item._redraw(self)
+
+    # The methods below mirror the subset of the Tk canvas interface
+    #   that the GraphicsObject _draw methods use.
+
+    def update(self):
+        self.applyPending()
+
+    def update_idletasks(self):
+        pass
+
+    def _create(self, kind, args, kw):
+        args = list(args)
+        options = {}
+        if args and isinstance(args[-1], dict):
+            options.update(args.pop())
+        options.update(kw)
+        for key in ("fill", "outline"):
+            if key in options:
+                _parse_color(options[key])
+        id = self._nextId
+        self._nextId = id + 1
+        self._shapes[id] = [kind, [float(v) for v in args], options]
+        self._raster = None
+        return id
+
+    def create_rectangle(self, *args, **kw):
+        return self._create("rectangle", args, kw)
+
+    def create_oval(self, *args, **kw):
+        return self._create("oval", args, kw)
+
+    def create_line(self, *args, **kw):
+        return self._create("line", args, kw)
+
+    def create_polygon(self, *args, **kw):
+        return self._create("polygon", args, kw)
+
+    def create_text(self, *args, **kw):
+        return self._create("text", args, kw)
+
+    def create_image(self, *args, **kw):
+        raise GraphicsError(UNSUPPORTED_METHOD)
+
+    def create_window(self, *args, **kw):
+        raise GraphicsError(UNSUPPORTED_METHOD)
+
+    def delete(self, id):
+        self._shapes.pop(id, None)
+        self._raster = None
+
+    def move(self, id, dx, dy):
+        coords = self._shapes[id][1]
+        for i in range(0, len(coords), 2):
+            coords[i] += dx
+            coords[i+1] += dy
+        self._raster = None
+
+    def bbox(self, id):
+        kind, coords, options = self._shapes[id]
+        xs, ys = coords[0::2], coords[1::2]
+        pad = 0
+        if kind != "text":
+            pad = int(float(options.get("width", 1))) / 2.0
+        return (min(xs) - pad, min(ys) - pad, max(xs) + pad, max(ys) + pad)
+
+    def coords(self, id, *coords):
+        self._shapes[id][1] = [float(v) for v in coords]
+        self._raster = None
+
+    def itemconfig(self, id, options=None, **kw):
+        shape = self._shapes[id]
+        if options:
+            shape[2].update(options)
+        shape[2].update(kw)
+        self._raster = None
+
+    def config(self, bg=None):
+        if bg is not None:
+            self.setBackground(bg)
+
+    def _render(self):
+        if self._raster is not None:
+            return self._raster
+        raster = _Raster(self.width, self.height, _parse_color(self.background))
+        for kind, coords, options in self._shapes.values():
+            fill = _parse_color(options.get("fill", ""))
+            outline = _parse_color(options.get("outline", ""))
+            width = int(float(options.get("width", 1)))
+            if kind == "rectangle":
+                x1, x2 = sorted(coords[0::2])
+                y1, y2 = sorted(coords[1::2])
+                if fill:
+                    raster.fillRect(x1, y1, x2, y2, fill)
+                if outline and width > 0:
+                    h = width // 2
+                    ox1, oy1, ox2, oy2 = x1-h, y1-h, x2-h+width, y2-h+width
+                    ix1, iy1, ix2, iy2 = ox1+width, oy1+width, ox2-width, oy2-width
+                    raster.fillRect(ox1, oy1, ox2, iy1, outline)
+                    raster.fillRect(ox1, iy2, ox2, oy2, outline)
+                    raster.fillRect(ox1, iy1, ix1, iy2, outline)
+                    raster.fillRect(ix2, iy1, ox2, iy2, outline)
+            elif kind == "oval":
+                if fill:
+                    raster.ellipse(coords[0], coords[1], coords[2], coords[3], fill)
+                if outline and width > 0:
+                    raster.ellipse(coords[0], coords[1], coords[2], coords[3],
+                                   outline, width)
+            elif kind == "line":
+                if fill:
+                    for i in range(0, len(coords) - 2, 2):
+                        raster.line(coords[i], coords[i+1],
+                                    coords[i+2], coords[i+3], fill, width)
+            elif kind == "polygon":
+                points = list(zip(coords[0::2], coords[1::2]))
+                if fill:
+                    raster.polygon(points, fill)
+                if outline and width > 0:
+                    for (xa, ya), (xb, yb) in zip(points, points[1:] + points[:1]):
+                        raster.line(xa, ya, xb, yb, outline, width)
+            # text has no font rasterizer and is skipped
+        self._raster = raster
+        return raster
+
+    def getPixel(self, x, y):
+        """Returns a list [r,g,b] with the RGB color values for raw
+        pixel (x,y), r,g,b are in range(256)"""
+        raster = self._render()
+        i = (int(y) * raster.width + int(x)) * 3
+        return list(raster.pixels[i:i+3])
+
+    def save(self, filename):
+        """Saves the contents of the window to filename. The format is
+        determined from the filename extension and may be png or ppm."""
+        path, name = os.path.split(filename)
+        ext = name.split(".")[-1].lower()
+        raster = self._render()
+        if ext == "png":
+            data = raster.toPNG()
+        elif ext == "ppm":
+            data = raster.toPPM()
+        else:
+            raise GraphicsError(BAD_OPTION)
+        with open(filename, "wb") as f:
+            f.write(data)
+
+
 # Default values for various item configuration options. Only a subset of
 #   keys may be present in the configuration dictionary for a given item
 DEFAULT_CONFIG = {"fill":"",
@@ -481,10 +1304,12 @@ class GraphicsObject:
         if self.canvas and not self.canvas.isClosed(): raise GraphicsError(OBJ_ALREADY_DRAWN)
         if graphwin.isClosed(): raise GraphicsError("Can't draw to closed window")
         self.canvas = graphwin
+        stats = graphwin.stats
+        if stats: start = time.perf_counter()
         self.id = self._draw(graphwin, self.config)
+        if stats: stats.record("create", start)
         graphwin.addItem(self)
-        if graphwin.autoflush:
-            _root.update()
+        _autoflush(graphwin)
         return self
 
             
@@ -495,10 +1320,12 @@ class GraphicsObject:
         
         if not self.canvas: return
         if not self.canvas.isClosed():
+            stats = self.canvas.stats
+            if stats: start = time.perf_counter()
             self.canvas.delete(self.id)
+            if stats: stats.record("delete", start)
             self.canvas.delItem(self)
-            if self.canvas.autoflush:
-                _root.update()
+            _autoflush(self.canvas)
         self.canvas = None
         self.id = None
 
@@ -518,9 +1345,12 @@ class GraphicsObject:
             else:
                 x = dx
                 y = dy
+            stats = canvas.stats
+            if stats: start = time.perf_counter()
             self.canvas.move(self.id, x, y)
-            if canvas.autoflush:
-                _root.update()
+            if stats: stats.record("move", start)
+            canvas._index.shift(self, x, y)
+            _autoflush(canvas)
            
     def _reconfig(self, option, setting):
         # Internal method for changing configuration of the object
@@ -531,9 +1361,13 @@ class GraphicsObject:
         options = self.config
         options[option] = setting
         if self.canvas and not self.canvas.isClosed():
+            stats = self.canvas.stats
+            if stats: start = time.perf_counter()
             self.canvas.itemconfig(self.id, options)
-            if self.canvas.autoflush:
-                _root.update()
+            if stats: stats.record("itemconfig", start)
+            if option in ("text", "font", "width"):
+                self.canvas._index.update(self, _itemBounds(self.canvas, self))
+            _autoflush(self.canvas)
 
 
     def _draw(self, canvas, options):
@@ -542,6 +1376,24 @@ class GraphicsObject:
         pass # must override in subclass
 
 
+    def _coords(self, canvas):
+        """Returns the list of screen coordinates of the figure, as
+        passed to the canvas when it was drawn. Subclasses that leave
+        this out are drawn again, rather than moved, by redraw"""
+        pass
+
+    def _redraw(self, canvas):
+        """Puts the drawn object where the window's current coordinates
+        place it, for the window's redraw"""
+        coords = self._coords(canvas)
+        if coords is None:
+            self.undraw()
+            self.draw(canvas)
+        else:
+            canvas.coords(self.id, *coords)
+            canvas._index.update(self, _itemBounds(canvas, self))
+
+
     def _move(self, dx, dy):
         """updates internal state of object to move it dx,dy units"""
         pass # must override in subclass
@@ -558,8 +1410,11 @@ class Point(GraphicsObject):
         return "Point({}, {})".format(self.x, self.y)
         
     def _draw(self, canvas, options):
+        return canvas.create_rectangle(*self._coords(canvas), options)
+
+    def _coords(self, canvas):
         x,y = canvas.toScreen(self.x,self.y)
-        return canvas.create_rectangle(x,y,x+1,y+1,options)
+        return [x,y,x+1,y+1]
         
     def _move(self, dx, dy):
         self.x = self.x + dx
@@ -588,6 +1443,11 @@ class _BBox(GraphicsObject):
         self.p2.x = self.p2.x + dx
         self.p2.y = self.p2.y  + dy
                 
+    def _coords(self, canvas):
+        x1,y1 = canvas.toScreen(self.p1.x,self.p1.y)
+        x2,y2 = canvas.toScreen(self.p2.x,self.p2.y)
+        return [x1,y1,x2,y2]
+
     def getP1(self): return self.p1.clone()
 
     def getP2(self): return self.p2.clone()
@@ -607,11 +1467,7 @@ class Rectangle(_BBox):
         return "Rectangle({}, {})".format(str(self.p1), str(self.p2))
     
     def _draw(self, canvas, options):
-        p1 = self.p1
-        p2 = self.p2
-        x1,y1 = canvas.toScreen(p1.x,p1.y)
-        x2,y2 = canvas.toScreen(p2.x,p2.y)
-        return canvas.create_rectangle(x1,y1,x2,y2,options)
+        return canvas.create_rectangle(*self._coords(canvas), options)
         
     def clone(self):
         other = Rectangle(self.p1, self.p2)
@@ -634,11 +1490,7 @@ class Oval(_BBox):
         return other
    
     def _draw(self, canvas, options):
-        p1 = self.p1
-        p2 = self.p2
-        x1,y1 = canvas.toScreen(p1.x,p1.y)
-        x2,y2 = canvas.toScreen(p2.x,p2.y)
-        return canvas.create_oval(x1,y1,x2,y2,options)
+        return canvas.create_oval(*self._coords(canvas), options)
     
 class Circle(Oval):
     
@@ -676,11 +1528,7 @@ class Line(_BBox):
         return other
   
     def _draw(self, canvas, options):
-        p1 = self.p1
-        p2 = self.p2
-        x1,y1 = canvas.toScreen(p1.x,p1.y)
-        x2,y2 = canvas.toScreen(p2.x,p2.y)
-        return canvas.create_line(x1,y1,x2,y2,options)
+        return canvas.create_line(*self._coords(canvas), options)
         
     def setArrow(self, option):
         if not option in ["first","last","both","none"]:
@@ -713,13 +1561,15 @@ class Polygon(GraphicsObject):
             p.move(dx,dy)
    
     def _draw(self, canvas, options):
-        args = [canvas]
+        return canvas.create_polygon(*self._coords(canvas), options)
+
+    def _coords(self, canvas):
+        coords = []
         for p in self.points:
             x,y = canvas.toScreen(p.x,p.y)
-            args.append(x)
-            args.append(y)
-        args.append(options)
-        return GraphWin.create_polygon(*args) 
+            coords.append(x)
+            coords.append(y)
+        return coords
 
 class Text(GraphicsObject):
     
@@ -734,9 +1584,10 @@ class Text(GraphicsObject):
         return "Text({}, '{}')".format(self.anchor, self.getText())
     
     def _draw(self, canvas, options):
-        p = self.anchor
-        x,y = canvas.toScreen(p.x,p.y)
-        return canvas.create_text(x,y,options)
+        return canvas.create_text(*self._coords(canvas), options)
+
+    def _coords(self, canvas):
+        return list(canvas.toScreen(self.anchor.x,self.anchor.y))
         
     def _move(self, dx, dy):
         self.anchor.move(dx,dy)
@@ -787,7 +1638,7 @@ class Entry(GraphicsObject):
         self.anchor = p.clone()
         #print self.anchor
         self.width = width
-        self.text = tk.StringVar(_root)
+        self.text = tk.StringVar(_get_root())
         self.text.set("")
         self.fill = "gray"
         self.color = "black"
@@ -812,6 +1663,9 @@ class Entry(GraphicsObject):
         self.entry.focus_set()
         return canvas.create_window(x,y,window=frm)
 
+    def _coords(self, canvas):
+        return list(canvas.toScreen(self.anchor.x,self.anchor.y))
+
     def getText(self):
         return self.text.get()
 
@@ -874,7 +1728,15 @@ class Entry(GraphicsObject):
 class Image(GraphicsObject):
 
     idCount = 0
-    imageCache = {} # tk photoimages go here to avoid GC while drawn 
+    # tk photoimages go here to avoid GC while drawn, least recently drawn
+    #   first. Once there are more than cacheSize entries, the oldest ones
+    #   belonging to images that are no longer drawn are dropped.
+    imageCache = OrderedDict()
+    cacheSize = 256
+    # blank photoimages handed back by release, keyed by (width, height),
+    #   at most poolSize of each size
+    photoPool = {}
+    poolSize = 8
     
     def __init__(self, p, *pixmap):
         GraphicsObject.__init__(self, [])
@@ -882,19 +1744,36 @@ class Image(GraphicsObject):
         self.imageId = Image.idCount
         Image.idCount = Image.idCount + 1
         if len(pixmap) == 1: # file name provided
-            self.img = tk.PhotoImage(file=pixmap[0], master=_root)
+            self.img = tk.PhotoImage(file=pixmap[0], master=_get_root())
         else: # width and height provided
             width, height = pixmap
-            self.img = tk.PhotoImage(master=_root, width=width, height=height)
+            pool = Image.photoPool.get((width, height))
+            if pool:
+                self.img = pool.pop()
+            else:
+                self.img = tk.PhotoImage(master=_get_root(), width=width, height=height)
 
     def __repr__(self):
         return "Image({}, {}, {})".format(self.anchor, self.getWidth(), self.getHeight())
                 
     def _draw(self, canvas, options):
-        p = self.anchor
-        x,y = canvas.toScreen(p.x,p.y)
-        self.imageCache[self.imageId] = self.img # save a reference  
-        return canvas.create_image(x,y,image=self.img)
+        self._cache()
+        return canvas.create_image(*self._coords(canvas), image=self.img)
+
+    def _coords(self, canvas):
+        return list(canvas.toScreen(self.anchor.x,self.anchor.y))
+
+    def _cache(self):
+        # save a reference, evicting stale entries if the cache is full
+        cache = self.imageCache
+        cache[self.imageId] = self
+        cache.move_to_end(self.imageId)
+        if len(cache) > Image.cacheSize:
+            for imageId, image in list(cache.items()):
+                if len(cache) <= Image.cacheSize:
+                    break
+                if not image.canvas or image.canvas.isClosed():
+                    del cache[imageId]
     
     def _move(self, dx, dy):
         self.anchor.move(dx,dy)
@@ -906,6 +1785,30 @@ class Image(GraphicsObject):
             pass
         GraphicsObject.undraw(self)
 
+    def release(self):
+        """Undraw the image and hand its photoimage back to a pool, so
+        that the next Image created with the same width and height
+        reuses it. The image must not be used afterwards."""
+        self.undraw()
+        pool = Image.photoPool.setdefault((self.getWidth(), self.getHeight()), [])
+        if len(pool) < Image.poolSize:
+            self.img.blank()
+            pool.append(self.img)
+        self.img = None
+
+    def setImage(self, source):
+        """Replace the contents of the image with those of source, which
+        is either a file name or another Image. The change is made in
+        place, so a drawn image keeps its canvas item."""
+        self.img.blank()
+        if isinstance(source, Image):
+            self.img.configure(width=source.getWidth(), height=source.getHeight())
+            self.img.tk.call(self.img, "copy", source.img)
+        else:
+            self.img.configure(width=0, height=0, file=source)
+        if self.canvas and not self.canvas.isClosed():
+            _autoflush(self.canvas)
+
     def getAnchor(self):
         return self.anchor.clone()
         
@@ -955,7 +1858,477 @@ class Image(GraphicsObject):
         ext = name.split(".")[-1]
         self.img.write( filename, format=ext)
 
-        
+
+# Tiled image files, written by buildTiles: a header, then the offset
+#   and length of every tile, then the tiles themselves as PNG files.
+#   Tiles are ordered by mip level (full size first), row and column.
+_TILE_MAGIC = b"GTIL"
+_TILE_VERSION = 1
+_TILE_HEADER = struct.Struct("<4sHHIIH") # magic, version, tile size, width, height, levels
+_TILE_ENTRY = struct.Struct("<QI")
+
+def _tileLevels(width, height, tileSize):
+    # (width, height, columns, rows) of each mip level, halving the size
+    #   until the whole image fits in one tile
+    levels = []
+    while True:
+        levels.append((width, height, -(-width // tileSize), -(-height // tileSize)))
+        if width <= tileSize and height <= tileSize:
+            return levels
+        width, height = (width + 1) // 2, (height + 1) // 2
+
+def _readPPMHeader(f):
+    # Width and height of a binary PPM file, leaving f at its pixels
+    if f.read(2) != b"P6":
+        raise GraphicsError("not a binary PPM file")
+    fields = []
+    c = f.read(1)
+    while len(fields) < 3:
+        if c == b"#":
+            while c not in (b"\n", b""):
+                c = f.read(1)
+        elif c.isspace():
+            c = f.read(1)
+        elif c.isdigit():
+            digits = b""
+            while c.isdigit():
+                digits, c = digits + c, f.read(1)
+            fields.append(int(digits))
+        else:
+            raise GraphicsError("bad PPM header")
+    width, height, maxval = fields
+    if maxval != 255:
+        raise GraphicsError("only 8-bit PPM files are supported")
+    return width, height
+
+def _halfRow(row):
+    # Every other pixel of a row of RGB bytes
+    half = bytearray((len(row) // 3 + 1) // 2 * 3)
+    half[0::3] = row[0::6]
+    half[1::3] = row[1::6]
+    half[2::3] = row[2::6]
+    return half
+
+def buildTiles(source, path, tileSize=256):
+    """Write the image in file source to path as a tiled image for
+    TiledImage, with every mip level made ahead of time. A binary PPM
+    source is read a band of rows at a time, so images of any size can
+    be converted; other formats are decoded by Tk, so they must be ones
+    it reads (PNG, GIF) and fit in memory once, while converting."""
+    ppm, scratch = source, None
+    with open(source, "rb") as f:
+        isPPM = f.read(2) == b"P6"
+    if not isPPM:
+        try:
+            photo = tk.PhotoImage(file=source, master=_get_root())
+        except tk.TclError as e:
+            raise GraphicsError("can't read image {}: {}".format(source, e))
+        scratch = ppm = path + ".ppm"
+        photo.write(scratch, format="ppm")
+        del photo
+    try:
+        with open(ppm, "rb") as src, open(path + ".tmp", "wb") as out:
+            width, height = _readPPMHeader(src)
+            levels = _tileLevels(width, height, tileSize)
+            first = []  # index of each level's first tile
+            count = 0
+            for w, h, cols, rows in levels:
+                first.append(count)
+                count = count + cols * rows
+            entries = [(0, 0)] * count
+            out.write(_TILE_HEADER.pack(_TILE_MAGIC, _TILE_VERSION, tileSize,
+                                        width, height, len(levels)))
+            out.write(bytes(_TILE_ENTRY.size * count))
+
+            # Each level collects rows until it has a band of tiles to
+            #   write, and hands every other row on to the level below
+            bands = [[] for level in levels]
+            received = [0] * len(levels)
+            def addRow(level, row):
+                w, h, cols, rows = levels[level]
+                band = bands[level]
+                band.append(row)
+                if received[level] % 2 == 0 and level + 1 < len(levels):
+                    addRow(level + 1, _halfRow(row))
+                received[level] = received[level] + 1
+                if len(band) == tileSize or received[level] == h:
+                    tileRow = (received[level] - 1) // tileSize
+                    for col in range(cols):
+                        x1, x2 = col * tileSize * 3, min((col + 1) * tileSize, w) * 3
+                        data = _encodePNG((x2 - x1) // 3, len(band),
+                                          b"".join(r[x1:x2] for r in band))
+                        entries[first[level] + tileRow * cols + col] = (out.tell(), len(data))
+                        out.write(data)
+                    del band[:]
+
+            stride = width * 3
+            for y in range(height):
+                row = src.read(stride)
+                if len(row) < stride:
+                    raise GraphicsError("PPM file is truncated")
+                addRow(0, row)
+            out.seek(_TILE_HEADER.size)
+            out.write(b"".join(_TILE_ENTRY.pack(*entry) for entry in entries))
+        os.replace(path + ".tmp", path)
+    finally:
+        if scratch:
+            os.remove(scratch)
+
+
+class _TileStore:
+
+    """Internal class: a tiled image file, from which tiles are read one
+    at a time as they are needed. The TiledImages of one file share its
+    store, which keeps the file open only while one of them is drawn"""
+
+    # path -> store, for the TiledImages that still exist
+    stores = weakref.WeakValueDictionary()
+
+    @classmethod
+    def get(cls, path):
+        store = cls.stores.get(path)
+        if store is None:
+            store = cls.stores[path] = cls(path)
+        return store
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.drawn = 0  # TiledImages of this file that are drawn
+        with open(path, "rb") as f:
+            header = f.read(_TILE_HEADER.size)
+            if len(header) < _TILE_HEADER.size:
+                raise GraphicsError("not a tiled image file")
+            magic, version, self.tileSize, self.width, self.height, count = \
+                _TILE_HEADER.unpack(header)
+            if magic != _TILE_MAGIC or version != _TILE_VERSION:
+                raise GraphicsError("not a tiled image file")
+            self.levels = _tileLevels(self.width, self.height, self.tileSize)
+            self.first = []
+            tiles = 0
+            for w, h, cols, rows in self.levels:
+                self.first.append(tiles)
+                tiles = tiles + cols * rows
+            self.entries = list(_TILE_ENTRY.iter_unpack(
+                f.read(_TILE_ENTRY.size * tiles)))
+
+    def read(self, level, col, row):
+        """Returns the PNG data of one tile"""
+        if self.file is None:
+            self.file = open(self.path, "rb")
+        offset, length = self.entries[self.first[level] +
+                                      row * self.levels[level][2] + col]
+        self.file.seek(offset)
+        return self.file.read(length)
+
+    def attach(self):
+        """Counts one more TiledImage of the file as drawn"""
+        self.drawn = self.drawn + 1
+
+    def detach(self):
+        """Counts one TiledImage of the file as undrawn, closing the
+        file once none is drawn"""
+        self.drawn = self.drawn - 1
+        if self.drawn == 0:
+            self.close()
+
+    def close(self):
+        """Closes the file; it is opened again if another tile is read"""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class TiledImage(GraphicsObject):
+
+    """An image too big to decode at once, such as a large map, read from
+    a file made by buildTiles. Like Image it is centered on its anchor
+    point and shown pixel for pixel, unless zoomed. Only the tiles that
+    are in the window are decoded, from the mip level that matches the
+    zoom, and moving the image shifts the tiles already shown with one
+    canvas call, decoding only the ones that come into view.
+
+    Decoded tiles are kept in tileCache, shared by all TiledImages.
+    Once the tiles in it take more than cacheLimit bytes, the least
+    recently used ones that are not on screen are dropped, so viewing
+    an image of any size takes a fixed amount of memory."""
+
+    idCount = 0
+    # (file, level, zoom factor, column, row) -> [photoimage, bytes, uses]
+    tileCache = OrderedDict()
+    cacheBytes = 0
+    cacheLimit = 64 * 1024 * 1024
+    maxZoom = 4
+
+    def __init__(self, p, path):
+        GraphicsObject.__init__(self, [])
+        self.anchor = p.clone()
+        self.path = path
+        self.store = _TileStore.get(path)
+        self.zoom = 1
+        self.tag = "tiled{}".format(TiledImage.idCount)
+        TiledImage.idCount = TiledImage.idCount + 1
+        self.tiles = {}     # tileCache key -> canvas id, for the tiles shown
+        self.origin = None  # screen position of the top left corner
+
+    def __repr__(self):
+        return "TiledImage({}, '{}')".format(self.anchor, self.path)
+
+    def draw(self, graphwin):
+        """Draw the image in graphwin, which must be a GraphWin: an
+        OffscreenGraphWin has no way to show images"""
+        if isinstance(graphwin, OffscreenGraphWin):
+            raise GraphicsError("TiledImage can't be drawn in an OffscreenGraphWin")
+        GraphicsObject.draw(self, graphwin)
+        self.store.attach()
+        return self
+
+    def _draw(self, canvas, options):
+        self.tiles = {}
+        self.origin = None
+        self._layout(canvas, None)  # draw() times this as one create
+        return self.tag
+
+    def _redraw(self, canvas):
+        # Lay the tiles out again rather than moving one canvas item
+        self._layout(canvas)
+        canvas._index.update(self, _itemBounds(canvas, self))
+
+    def _coords(self, canvas):
+        return list(canvas.toScreen(self.anchor.x, self.anchor.y))
+
+    def _move(self, dx, dy):
+        self.anchor.move(dx, dy)
+
+    def move(self, dx, dy):
+        """move the image dx units in x direction and dy units in y
+        direction, bringing in the tiles that come into view"""
+        self._move(dx, dy)
+        self._refresh()
+
+    def undraw(self):
+        if not self.canvas: return
+        for key in self.tiles:
+            self.tileCache[key][2] -= 1
+        self.tiles = {}
+        GraphicsObject.undraw(self)
+        self.store.detach()
+
+    def _refresh(self):
+        canvas = self.canvas
+        if canvas and not canvas.isClosed():
+            self._layout(canvas)
+            canvas._index.update(self, _itemBounds(canvas, self))
+            _autoflush(canvas)
+
+    def _layout(self, canvas, stats=False):
+        # Show the tiles that overlap the window, at the current zoom.
+        #   Canvas calls are timed in stats, which defaults to canvas.stats
+        if stats is False:
+            stats = canvas.stats
+        store = self.store
+        if self.zoom < 1:
+            level, factor = round(-math.log2(self.zoom)), 1
+        else:
+            level, factor = 0, int(self.zoom)
+        width, height, cols, rows = store.levels[level]
+        size = store.tileSize * factor  # on screen
+        cx, cy = canvas.toScreen(self.anchor.x, self.anchor.y)
+        ox = int(round(cx - width * factor / 2.0))
+        oy = int(round(cy - height * factor / 2.0))
+        wanted = [(self.path, level, factor, col, row)
+                  for row in range(max(0, -oy // size), min(rows, (canvas.getHeight() - oy - 1) // size + 1))
+                  for col in range(max(0, -ox // size), min(cols, (canvas.getWidth() - ox - 1) // size + 1))]
+
+        if self.tiles and (ox, oy) != self.origin:
+            if stats: start = time.perf_counter()
+            canvas.move(self.tag, ox - self.origin[0], oy - self.origin[1])
+            if stats: stats.record("move", start)
+        self.origin = (ox, oy)
+        shown = self.tiles
+        below = next(iter(shown.values()), None)  # keeps new tiles at the image's depth
+        self.tiles = {}
+        for key in wanted:
+            id = shown.pop(key, None)
+            if id is None:
+                photo = self._acquire(key, canvas.stats)
+                if stats: start = time.perf_counter()
+                id = canvas.create_image(ox + key[3] * size, oy + key[4] * size,
+                                         image=photo, anchor="nw", tags=self.tag)
+                if below is not None:
+                    canvas.tag_raise(id, below)
+                if stats: stats.record("create", start)
+            self.tiles[key] = id
+        for key, id in shown.items():
+            if stats: start = time.perf_counter()
+            canvas.delete(id)
+            if stats: stats.record("delete", start)
+            self.tileCache[key][2] -= 1
+        self._trim()
+
+    def _acquire(self, key, stats=None):
+        # Photoimage for a tile, decoding it if it is not cached
+        cache = self.tileCache
+        entry = cache.get(key)
+        if entry is None:
+            if stats: start = time.perf_counter()
+            path, level, factor, col, row = key
+            photo = tk.PhotoImage(data=self.store.read(level, col, row),
+                                  format="png", master=_get_root())
+            if factor > 1:
+                photo = photo.zoom(factor)
+            if stats: stats.record("decode", start)
+            entry = cache[key] = [photo, photo.width() * photo.height() * 4, 0]
+            TiledImage.cacheBytes = TiledImage.cacheBytes + entry[1]
+        cache.move_to_end(key)
+        entry[2] += 1
+        return entry[0]
+
+    @classmethod
+    def _trim(cls):
+        # Drop least recently used tiles not on screen while over the limit
+        cache = cls.tileCache
+        if cls.cacheBytes <= cls.cacheLimit:
+            return
+        for key, entry in list(cache.items()):
+            if cls.cacheBytes <= cls.cacheLimit:
+                break
+            if entry[2] == 0:
+                del cache[key]
+                cls.cacheBytes = cls.cacheBytes - entry[1]
+
+    def setZoom(self, zoom):
+        """Show the image at zoom times its size. The zoom is rounded to
+        a power of two, from the smallest mip level up to maxZoom."""
+        steps = round(math.log2(zoom))
+        steps = max(1 - len(self.store.levels), min(steps, int(math.log2(self.maxZoom))))
+        self.zoom = 2.0 ** steps if steps < 0 else 2 ** steps
+        self._refresh()
+
+    def getZoom(self):
+        return self.zoom
+
+    def getAnchor(self):
+        return self.anchor.clone()
+
+    def clone(self):
+        other = TiledImage(self.anchor, self.path)
+        other.zoom = self.zoom
+        return other
+
+    def getWidth(self):
+        """Returns the full-size width of the image in pixels"""
+        return self.store.width
+
+    def getHeight(self):
+        """Returns the full-size height of the image in pixels"""
+        return self.store.height
+
+
+class Scene:
+
+    """Retained-mode drawing in a GraphWin (or OffscreenGraphWin).
+    Rather than drawing, moving and undrawing objects itself, the
+    application describes everything that should be on screen each
+    frame and passes it to render. The scene compares it with the
+    previous frame and makes only the canvas calls needed to get from
+    one to the other: create for new shapes, coords and itemconfig for
+    changed ones and delete for the ones that are gone. Shapes that did
+    not change cost no canvas call at all, and the window is updated
+    once per frame.
+
+    Shapes are described with Point, Line, Circle, Oval, Rectangle,
+    Polygon and Text objects, which are never drawn themselves, each
+    under a key chosen by the application that identifies it from one
+    frame to the next. New shapes go on top of the existing ones. The
+    scene's shapes are not among the window's items, so objectsAt and
+    objectsIn do not report them."""
+
+    def __init__(self, win):
+        self.win = win
+        self.shapes = {}  # key -> [canvas id, _draw function, coords, config]
+
+    def render(self, shapes):
+        """Make the window show shapes, a dict (or a sequence of pairs)
+        mapping keys to graphics objects. Returns the number of canvas
+        calls it took."""
+        win = self.win
+        if win.isClosed():
+            raise GraphicsError("window is closed")
+        if hasattr(shapes, "items"):
+            shapes = shapes.items()
+        stats = win.stats
+        old = self.shapes
+        new = {}
+        calls = 0
+        autoflush = win.autoflush
+        win.autoflush = False
+        try:
+            for key, obj in shapes:
+                if key in new:
+                    raise GraphicsError("duplicate scene key {!r}".format(key))
+                draw = type(obj)._draw
+                if draw not in _sceneDraws:
+                    raise GraphicsError(UNSUPPORTED_METHOD)
+                coords = obj._coords(win)
+                config = obj.config
+                shape = old.pop(key, None)
+                if shape is not None and shape[1] is not draw:
+                    # Became a different kind of shape: replace the item
+                    self._delete(shape[0])
+                    calls = calls + 1
+                    shape = None
+                if shape is None:
+                    if stats: start = time.perf_counter()
+                    id = draw(obj, win, config)
+                    if stats: stats.record("create", start)
+                    new[key] = [id, draw, coords, dict(config)]
+                    calls = calls + 1
+                    continue
+                if coords != shape[2]:
+                    if stats: start = time.perf_counter()
+                    win.coords(shape[0], *coords)
+                    if stats: stats.record("coords", start)
+                    shape[2] = coords
+                    calls = calls + 1
+                if config != shape[3]:
+                    previous = shape[3]
+                    changed = {option: value for option, value in config.items()
+                               if previous.get(option) != value}
+                    if stats: start = time.perf_counter()
+                    win.itemconfig(shape[0], changed)
+                    if stats: stats.record("itemconfig", start)
+                    shape[3] = dict(config)
+                    calls = calls + 1
+                new[key] = shape
+            for shape in old.values():
+                self._delete(shape[0])
+                calls = calls + 1
+            old.clear()
+        finally:
+            # After an error, shapes not reached yet stay as they were
+            new.update(old)
+            self.shapes = new
+            win.autoflush = autoflush
+        if calls:
+            _autoflush(win)
+        return calls
+
+    def clear(self):
+        """Delete all of the scene's shapes from the window"""
+        self.render(())
+
+    def _delete(self, id):
+        stats = self.win.stats
+        if stats: start = time.perf_counter()
+        self.win.delete(id)
+        if stats: stats.record("delete", start)
+
+# The kinds of object a Scene can show, by their _draw methods
+_sceneDraws = {Point._draw, Line._draw, Oval._draw, Rectangle._draw,
+               Polygon._draw, Text._draw}
+
+
 def color_rgb(r,g,b):
     """r,g,b are intensities of red, green, and blue in range(256)
     Returns color specifier string for the resulting color"""
@@ -1008,8 +2381,5 @@ def test():
 #MacOS fix 2
 #tk.Toplevel(_root).destroy()
 
-# MacOS fix 1
-update()
-
 if __name__ == "__main__":
     test()
\ No newline at end of file
@@ -0,0 +1,192 @@
+"""Persistent high-score table.
+
+Scores are kept in an SQLite database in WAL mode, so several processes
+can share one file. The best TOP_KEPT games are mirrored in memory, so
+that top() up to that many never touches the disk however long the table
+grows. The best scores of the BEST_KEPT players asked about most recently
+are cached too: best() reads the database only for a player who is not
+in the cache. record() only updates the in-memory index and queues the
+row; a background thread commits queued rows in batches.
+
+Scores written by other processes after this store was opened are not
+seen by top() until the store is reopened, nor by best() for players
+already in its cache.
+"""
+
+import bisect
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_PATH = "highscores.db"
+BATCH_INTERVAL = 1.0  # seconds to gather rows before a commit
+TOP_KEPT = 100  # best games kept in memory
+BEST_KEPT = 1024  # players whose best score is kept in memory
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scores (
+    player TEXT NOT NULL,
+    score INTEGER NOT NULL,
+    level INTEGER NOT NULL,
+    time REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS scores_by_player ON scores (player, score);
+"""
+
+_STOP = object()
+
+
+class HighScoreStore:
+    def __init__(self, path=DEFAULT_PATH, batch_interval=BATCH_INTERVAL, top_kept=TOP_KEPT,
+                 best_kept=BEST_KEPT):
+        self.path = path
+        self.batch_interval = batch_interval
+        self.top_kept = top_kept
+        self.best_kept = best_kept
+        self.errors = []
+        self._lock = threading.Lock()
+        self._ranked = []   # (-score, time, player, level), best first, at most top_kept
+        self._best = OrderedDict()  # player -> best score, least recently asked first
+        self._unsaved = {}  # player -> best score recorded but not yet committed
+        self._reader = None  # connection best() reads misses with, opened by the first
+        self._queue = queue.Queue()
+
+        connection = self._connect()
+        try:
+            for player, score, level, when in connection.execute(
+                    "SELECT player, score, level, time FROM scores "
+                    "ORDER BY score DESC, time, player, level LIMIT ?", (top_kept,)):
+                self._ranked.append((-score, when, player, level))
+        finally:
+            connection.close()
+
+        self._thread = threading.Thread(target=self._run, name="highscore-writer",
+                                        daemon=True)
+        self._thread.start()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(_SCHEMA)
+        return connection
+
+    def _index(self, player, score, level, when):
+        entry = (-score, when, player, level)
+        with self._lock:
+            ranked = self._ranked
+            if len(ranked) < self.top_kept or entry < ranked[-1]:
+                bisect.insort(ranked, entry)
+                del ranked[self.top_kept:]
+            if score > self._unsaved.get(player, -1):
+                self._unsaved[player] = score
+            # A player who is not cached has their best read on demand
+            if player in self._best and score > self._best[player]:
+                self._best[player] = score
+
+    def record(self, player, score, level):
+        """Add a finished game's score. Returns immediately."""
+        score = int(score)
+        when = time.time()
+        self._index(player, score, level, when)
+        self._queue.put((player, score, level, when))
+
+    def top(self, n=10):
+        """Return the n best (player, score, level, time) rows, best first.
+        Beyond top_kept rows this waits for recorded scores to be committed
+        and reads the database."""
+        if n > self.top_kept:
+            self.flush()
+            connection = self._connect()
+            try:
+                return connection.execute(
+                    "SELECT player, score, level, time FROM scores "
+                    "ORDER BY score DESC, time, player, level LIMIT ?", (n,)).fetchall()
+            finally:
+                connection.close()
+        with self._lock:
+            rows = self._ranked[:n]
+        return [(player, -neg_score, level, when) for neg_score, when, player, level in rows]
+
+    def best(self, player):
+        """Return player's best score, or 0 if they have none. Reads the
+        database if the player is not among the best_kept cached."""
+        with self._lock:
+            best = self._best.get(player)
+            if best is not None:
+                self._best.move_to_end(player)
+                return best
+            # Holding the lock keeps the writer from forgetting an unsaved
+            #   score that this read might not see yet
+            if self._reader is None:
+                self._reader = self._connect_reader()
+            saved, = self._reader.execute(
+                "SELECT MAX(score) FROM scores WHERE player = ?", (player,)).fetchone()
+            best = max(saved or 0, self._unsaved.get(player, 0))
+            self._best[player] = best
+            if len(self._best) > self.best_kept:
+                self._best.popitem(last=False)
+            return best
+
+    def _connect_reader(self):
+        # best() may be called from any thread, always under _lock
+        connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        connection.execute("PRAGMA query_only=ON")
+        return connection
+
+    def flush(self):
+        """Wait until every recorded score has been committed."""
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._thread.join()
+        with self._lock:
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+
+    def _saved(self, batch):
+        # The database now holds these scores, so best() can read them there
+        committed = {}
+        for player, score, level, when in batch:
+            committed[player] = max(score, committed.get(player, score))
+        with self._lock:
+            for player, score in committed.items():
+                if self._unsaved.get(player, score) <= score:
+                    self._unsaved.pop(player, None)
+
+    def _run(self):
+        connection = self._connect()
+        try:
+            while True:
+                rows = [self._queue.get()]
+                deadline = time.monotonic() + self.batch_interval
+                while rows[-1] is not _STOP:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        rows.append(self._queue.get(timeout=timeout))
+                    except queue.Empty:
+                        break
+                stop = rows[-1] is _STOP
+                batch = [row for row in rows if row is not _STOP]
+                try:
+                    if batch:
+                        with connection:
+                            connection.executemany(
+                                "INSERT INTO scores (player, score, level, time) VALUES (?, ?, ?, ?)",
+                                batch)
+                        self._saved(batch)
+                except sqlite3.Error as e:
+                    self.errors.append(e)
+                finally:
+                    for _ in rows:
+                        self._queue.task_done()
+                if stop:
+                    return
+        finally:
+            connection.close()
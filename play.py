@@ -0,0 +1,32 @@
+"""Play Bulletstorm Blitz.
+
+The command line entry point for the game. It lives outside Game.py so
+that Game is only ever imported as the Game module: run as a script, the
+file would be the __main__ module, and every helper that imports Game
+(checkpoint.py, assets.py and the rest) would get a second copy of it,
+with its own classes and image cache.
+"""
+
+import argparse
+import logging
+
+import Game
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulletstorm Blitz")
+    parser.add_argument("checkpoint", nargs="?", help="checkpoint to resume from and autosave to")
+    parser.add_argument("--pipelined", action="store_true",
+                        help="simulate the next tick on a second thread while drawing")
+    parser.add_argument("--full-quality", action="store_true",
+                        help="keep every effect on, however long frames take")
+    parser.add_argument("--verbose", action="store_true", help="log quality changes")
+    parser.add_argument("--events", metavar="PATH", help="record gameplay events to this log file")
+    args = parser.parse_args()
+    if args.verbose:
+        logging.basicConfig(level=logging.INFO, format="%(name)s: %(message)s")
+    Game.main(args.checkpoint, args.pipelined, not args.full_quality, args.events)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,457 @@
+"""Rollback netcode for two-player co-op in Bulletstorm Blitz.
+
+Both peers run the same co-op Game.World (players=2, same seed) in ticks of
+1000 / Game.FPS ms. Each tick a peer steps its world straight away with its
+own input and a prediction of the other player's: the last input it has
+from them, without the shot. Inputs are sent to the other peer tagged with
+their tick. When one arrives for a tick already simulated and it differs
+from the prediction, the peer restores the World.capture taken before that
+tick and simulates forward again with what it now knows, so both worlds end
+up the same. Captures are kept only for ticks that may still be rolled
+back; a peer that gets more than max_rollback ticks past the last input it
+has from the other waits for it instead of predicting further.
+
+A peer's own input is applied INPUT_DELAY ticks after it is read, which
+hides that much latency without rolling back at all. Particle effects are
+left out of re-simulated ticks. What a tick records in the world's
+HighScoreStore and EventLog is held back until the tick is confirmed, that
+is, until every input it was simulated with is real; a rollback replaces
+it with what the tick records when simulated again. So the scores and
+events recorded are those of the game as it really went.
+
+Packets (little-endian) carry every input the peer may not have yet, so a
+lost packet is made up for by the next one:
+    first tick (I), acked tick (i), count (B), then count input masks (B)
+    with server.py's INPUT_* bits
+where acked tick is the last tick up to which the sender has all of the
+receiver's inputs, so the receiver can stop sending those.
+
+Transports have send(data) and receive(), which returns the packets that
+have arrived. A loopback_pair delivers within one process after a simulated
+latency, jitter and loss, on a clock the caller controls; UdpTransport
+sends real datagrams.
+
+Run "python rollback.py" to play two bot peers against each other over
+loopback links from clean to lossy, check that both end in the same state
+as a game played without a network, having recorded the same scores and
+events, and time the worst re-simulations.
+Run "python rollback.py --play 0 --port 5000 --peer otherhost:5001" on one
+machine and "--play 1 --port 5001 --peer firsthost:5000" on the other for
+a co-op game.
+"""
+
+import argparse
+import heapq
+import itertools
+import random
+import socket
+import struct
+import time
+
+import Game
+from server import controls_from_mask, mask_from_controls
+
+INPUT_DELAY = 2   # ticks
+MAX_ROLLBACK = 8  # ticks
+TICK_MS = 1000 / Game.FPS
+BUDGET = TICK_MS  # ms a rollback may take, a whole frame
+
+PACKET_HEADER = struct.Struct("<IiB")
+MAX_INPUTS = 255  # per packet
+
+
+class _Deferred:
+    # Stands in for a world's store while the session simulates, keeping
+    # what is recorded in the calls list of the tick being simulated
+    def __init__(self, target):
+        self.target = target
+        self.calls = None
+
+    def record(self, *args, **kwargs):
+        self.calls.append((self.target, args, kwargs))
+
+
+class RollbackSession:
+    """One peer of a two-player game: its world, which of the players it
+    controls, and the transport to the other peer."""
+
+    def __init__(self, world, local, transport, input_delay=INPUT_DELAY,
+                 max_rollback=MAX_ROLLBACK):
+        if len(world.players) != 2:
+            raise ValueError("rollback needs a world with two players")
+        self.world = world
+        self.local = local
+        self.remote = 1 - local
+        self.transport = transport
+        self.input_delay = input_delay
+        self.max_rollback = max_rollback
+        self.start_time = world.time
+        self.tick = 0              # next tick to simulate
+        self.inputs = ({}, {})     # per player, tick -> Controls, as known
+        self.predicted = {}        # tick -> the other player's Controls it was simulated with
+        self.states = {}           # tick -> World.capture() from just before it
+        self.last_input = input_delay - 1  # last tick with local input
+        self.remote_confirmed = -1  # every remote input up to this tick is known
+        self.peer_acked = -1       # the peer has every local input up to this tick
+        self.forgotten = 0         # ticks before this have been dropped
+        self.recorded = {}         # tick -> calls to the world's stores it made
+        self.committed = 0         # ticks before this have had their calls made
+        self.deferred = []
+        for name in ("scores", "events"):
+            if getattr(world, name) is not None:
+                deferred = _Deferred(getattr(world, name))
+                setattr(world, name, deferred)
+                self.deferred.append(deferred)
+        # Stats
+        self.rollbacks = 0
+        self.resimulated = 0       # ticks simulated again
+        self.deepest = 0           # most ticks re-simulated at once
+        self.slowest = 0.0         # ms, longest rollback
+        self.stalls = 0
+        for tick in range(input_delay):
+            self.inputs[local][tick] = Game.NO_INPUT
+
+    def advance(self, controls):
+        """Take in the peer's packets, then simulate one tick, with controls
+        as this player's input INPUT_DELAY ticks from now. Returns False,
+        without simulating or using controls, if the peer is too far behind."""
+        self._receive()
+        if self.tick - self.remote_confirmed > self.max_rollback:
+            self.stalls += 1
+            self._send()
+            return False
+        self.last_input = self.tick + self.input_delay
+        self.inputs[self.local][self.last_input] = controls
+        self._send()
+        self._simulate(self.tick)
+        self.tick += 1
+        self._commit()
+        self._forget()
+        return True
+
+    def poll(self):
+        """Take in the peer's packets and send it what it is missing,
+        without simulating a new tick."""
+        self._receive()
+        self._send()
+        self._commit()
+        self._forget()
+
+    @property
+    def confirmed(self):
+        """Whether every tick simulated so far used only real inputs."""
+        return self.remote_confirmed >= self.tick - 1
+
+    def _receive(self):
+        inputs = self.inputs[self.remote]
+        mispredicted = None
+        for data in self.transport.receive():
+            first, acked, count = PACKET_HEADER.unpack_from(data)
+            self.peer_acked = max(self.peer_acked, acked)
+            masks = data[PACKET_HEADER.size:PACKET_HEADER.size + count]
+            for tick, mask in enumerate(masks, first):
+                if tick <= self.remote_confirmed or tick in inputs:
+                    continue
+                controls = inputs[tick] = controls_from_mask(mask)
+                predicted = self.predicted.pop(tick, None)
+                if predicted is not None and predicted != controls:
+                    if mispredicted is None or tick < mispredicted:
+                        mispredicted = tick
+        while self.remote_confirmed + 1 in inputs:
+            self.remote_confirmed += 1
+        if mispredicted is not None:
+            self._rollback(mispredicted)
+
+    def _send(self):
+        local = self.inputs[self.local]
+        first = self.peer_acked + 1
+        last = min(self.last_input, first + MAX_INPUTS - 1)
+        masks = bytes(mask_from_controls(local[tick]) for tick in range(first, last + 1))
+        self.transport.send(PACKET_HEADER.pack(first, self.remote_confirmed, len(masks)) + masks)
+
+    def _simulate(self, tick):
+        world = self.world
+        self.states[tick] = world.capture()
+        controls = [None, None]
+        controls[self.local] = self.inputs[self.local][tick]
+        remote = self.inputs[self.remote].get(tick)
+        if remote is None:
+            # The other player keeps doing what they last did, bar shooting
+            last = self.inputs[self.remote].get(self.remote_confirmed, Game.NO_INPUT)
+            remote = self.predicted[tick] = last._replace(shoot=False)
+        controls[self.remote] = remote
+        calls = self.recorded[tick] = []
+        for deferred in self.deferred:
+            deferred.calls = calls
+        world.step(controls, self.start_time + (tick + 1) * TICK_MS)
+
+    def _rollback(self, tick):
+        # Go back to just before tick and simulate up to now again
+        start = time.perf_counter()
+        world = self.world
+        particles, world.particles = world.particles, None
+        world.restore(self.states[tick])
+        for t in range(tick, self.tick):
+            self._simulate(t)
+        world.particles = particles
+        depth = self.tick - tick
+        self.rollbacks += 1
+        self.resimulated += depth
+        self.deepest = max(self.deepest, depth)
+        self.slowest = max(self.slowest, (time.perf_counter() - start) * 1000)
+
+    def _commit(self):
+        # Make the calls of ticks that can no longer be rolled back
+        done = min(self.remote_confirmed, self.tick - 1)
+        for tick in range(self.committed, done + 1):
+            for target, args, kwargs in self.recorded.pop(tick, ()):
+                target.record(*args, **kwargs)
+        self.committed = max(self.committed, done + 1)
+
+    def _forget(self):
+        # Captures and inputs are needed only for ticks not yet simulated
+        # or that may still be rolled back, and local inputs until the
+        # peer has them. The last of them is kept for predicting from.
+        done = min(self.remote_confirmed, self.peer_acked, self.tick - 1)
+        for tick in range(self.forgotten, done):
+            self.states.pop(tick, None)
+            self.inputs[0].pop(tick, None)
+            self.inputs[1].pop(tick, None)
+        self.forgotten = max(self.forgotten, done)
+
+
+class LoopbackTransport:
+    """One end of an in-process link, see loopback_pair."""
+
+    def __init__(self, clock, latency, jitter, loss, rng):
+        self.clock = clock
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.rng = rng
+        self.peer = None
+        self.arriving = []  # heap of (arrival time, sequence, data)
+        self.counter = itertools.count()
+        self.sent = 0
+        self.lost = 0
+
+    def send(self, data):
+        self.sent += 1
+        if self.rng.random() < self.loss:
+            self.lost += 1
+            return
+        arrival = self.clock() + self.latency + self.rng.uniform(0, self.jitter)
+        heapq.heappush(self.peer.arriving, (arrival, next(self.counter), bytes(data)))
+
+    def receive(self):
+        now = self.clock()
+        arrived = []
+        while self.arriving and self.arriving[0][0] <= now:
+            arrived.append(heapq.heappop(self.arriving)[2])
+        return arrived
+
+
+def loopback_pair(clock=None, latency=50, jitter=0, loss=0.0, seed=None):
+    """Return two connected LoopbackTransports. Each packet arrives latency
+    plus up to jitter ms (of clock(), wall-clock ms by default) after it is
+    sent, so packets can overtake each other, or is lost with chance loss."""
+    if clock is None:
+        clock = lambda: time.perf_counter() * 1000
+    rng = random.Random(seed)
+    a = LoopbackTransport(clock, latency, jitter, loss, rng)
+    b = LoopbackTransport(clock, latency, jitter, loss, rng)
+    a.peer, b.peer = b, a
+    return a, b
+
+
+class UdpTransport:
+    """Datagrams to and from one peer, without blocking."""
+
+    def __init__(self, port, peer):
+        self.peer = peer
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind(("", port))
+        self.socket.setblocking(False)
+
+    def send(self, data):
+        try:
+            self.socket.sendto(data, self.peer)
+        except OSError:
+            pass  # Nobody there yet; the inputs go again with the next packet
+
+    def receive(self):
+        arrived = []
+        while True:
+            try:
+                data, address = self.socket.recvfrom(PACKET_HEADER.size + MAX_INPUTS)
+            except (BlockingIOError, ConnectionError):
+                return arrived
+            arrived.append(data)
+
+    def close(self):
+        self.socket.close()
+
+
+class _Bot:
+    # Holds a direction for a while, jumps and shoots now and then
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+        self.controls = Game.NO_INPUT
+
+    def __call__(self):
+        rng = self.rng
+        if rng.random() < 0.05:
+            direction = rng.choice(["left", "right", None])
+            self.controls = Game.Controls(direction == "left", direction == "right")
+        return self.controls._replace(jump=rng.random() < 0.03, shoot=rng.random() < 0.2)
+
+
+class _Calls:
+    # A store that lists what is recorded in it
+    def __init__(self):
+        self.calls = []
+
+    def record(self, *args, **kwargs):
+        self.calls.append((args, kwargs))
+
+
+def run_match(ticks=1200, latency=50, jitter=0, loss=0.0, seed=1):
+    """Play two bot peers against each other over a loopback link on a
+    simulated clock, then replay their inputs without a network. Returns
+    both sessions and whether all three worlds ended in the same state,
+    having recorded the same scores and events."""
+    now = 0.0
+    links = loopback_pair(lambda: now, latency, jitter, loss, seed)
+    stores = [(_Calls(), _Calls()) for link in links]
+    sessions = [RollbackSession(Game.World(seed, effects=False, players=2, scores=scores, events=events),
+                                i, link)
+                for i, (link, (scores, events)) in enumerate(zip(links, stores))]
+    bots = [_Bot(seed * 2), _Bot(seed * 2 + 1)]
+    used = ({}, {})  # per player, tick -> the input the game got
+
+    frame = 0
+    while min(s.tick for s in sessions) < ticks:
+        now = frame * TICK_MS
+        for session, bot, inputs in zip(sessions, bots, used):
+            if session.tick < ticks:
+                controls = bot()
+                if session.advance(controls):
+                    inputs[session.last_input] = controls
+            else:
+                session.poll()
+        frame += 1
+    while not all(s.confirmed for s in sessions):
+        frame += 1
+        now = frame * TICK_MS
+        for session in sessions:
+            session.poll()
+
+    reference = Game.World(seed, effects=False, players=2, scores=_Calls(), events=_Calls())
+    for tick in range(ticks):
+        reference.step([inputs.get(tick, Game.NO_INPUT) for inputs in used], (tick + 1) * TICK_MS)
+    expected = reference.capture()
+    return sessions, all(s.world.capture() == expected and scores.calls == reference.scores.calls
+                         and events.calls == reference.events.calls
+                         for s, (scores, events) in zip(sessions, stores))
+
+
+# name, one-way latency ms, jitter ms, loss
+LINKS = [
+    ("lan", 2, 1, 0.0),
+    ("broadband", 30, 10, 0.0),
+    ("long way", 70, 30, 0.02),
+    ("bad wifi", 40, 60, 0.10),
+]
+
+
+def time_rollback(depth=MAX_ROLLBACK, enemies=Game.MAX_WAVE_SIZE, bullets=40, repeats=20):
+    """Time restoring a busy world and simulating depth ticks again. Returns
+    the worst time in ms."""
+    world = Game.World(1, effects=False, players=2)
+    for _ in range(enemies):
+        world.enemies_group.add(Game.Enemy(world.player, world.rng, world.time, timers=world.timers))
+    for _ in range(bullets):
+        world.bullets_group.add(Game.Bullet(world.rng.uniform(0, Game.WORLD_WIDTH),
+                                            world.rng.uniform(0, Game.WORLD_HEIGHT),
+                                            world.enemies_group))
+    controls = [Game.Controls(right=True), Game.Controls(left=True)]
+    worst = 0.0
+    for _ in range(repeats):
+        state = world.capture()
+        start = time.perf_counter()
+        world.restore(state)
+        for tick in range(depth):
+            world.capture()
+            world.step(controls, state.time + (tick + 1) * TICK_MS)
+        worst = max(worst, (time.perf_counter() - start) * 1000)
+        world.restore(state)
+    return worst
+
+
+def benchmark(ticks=1200, seed=1):
+    """Play a bot match over each of LINKS and time a worst-case rollback."""
+    for name, latency, jitter, loss in LINKS:
+        start = time.perf_counter()
+        sessions, in_sync = run_match(ticks, latency, jitter, loss, seed)
+        elapsed = time.perf_counter() - start
+        rollbacks = sum(s.rollbacks for s in sessions)
+        print(f"{name:10} {latency:3} ms +{jitter:3} ms, {loss:4.0%} lost: "
+              f"{'in sync' if in_sync else 'OUT OF SYNC'}, {rollbacks} rollbacks "
+              f"({sum(s.resimulated for s in sessions) / max(rollbacks, 1):.1f} ticks on average, "
+              f"at most {max(s.deepest for s in sessions)}), "
+              f"slowest {max(s.slowest for s in sessions):.2f} ms, "
+              f"{sum(s.stalls for s in sessions)} stalls, {elapsed:.1f}s")
+    worst = time_rollback()
+    print(f"restore and re-simulate {MAX_ROLLBACK} ticks of a full wave: worst {worst:.2f} ms "
+          f"of a {BUDGET:.1f} ms frame")
+
+
+def play(player, port, peer, seed=1):
+    """Play a co-op game as player (0 or 1) with the peer at (host, port)."""
+    import pygame
+
+    screen, font = Game.startup()
+    hud = Game.Hud(font)
+    world = Game.World(seed, players=2)
+    transport = UdpTransport(port, peer)
+    session = RollbackSession(world, player, transport)
+    clock = pygame.time.Clock()
+    shoot = False  # Kept until a tick takes it
+    running = True
+    while running:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
+                shoot = True
+        keys = pygame.key.get_pressed()
+        controls = Game.Controls(keys[pygame.K_LEFT], keys[pygame.K_RIGHT], keys[pygame.K_UP], shoot)
+        if session.advance(controls):
+            shoot = False
+        Game.render(screen, hud, world.render_state(view=player))
+        if session.tick - session.remote_confirmed > session.max_rollback:
+            waiting = font.render(f"Waiting for player {2 - player}", True, Game.BLACK)
+            screen.blit(waiting, waiting.get_rect(center=screen.get_rect().center))
+        pygame.display.flip()
+        clock.tick(Game.FPS)
+    transport.close()
+    pygame.quit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ticks", type=int, default=1200, help="ticks per benchmark match")
+    parser.add_argument("--play", type=int, choices=(0, 1), help="play as this player")
+    parser.add_argument("--port", type=int, default=5000, help="UDP port to listen on")
+    parser.add_argument("--peer", default="127.0.0.1:5001", help="the other player's host:port")
+    parser.add_argument("--seed", type=int, default=1, help="world seed, the same on both sides")
+    args = parser.parse_args()
+    if args.play is None:
+        benchmark(args.ticks, args.seed)
+    else:
+        host, port = args.peer.rsplit(":", 1)
+        play(args.play, args.port, (host, int(port)), args.seed)
+
+
+if __name__ == "__main__":
+    main()
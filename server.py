@@ -0,0 +1,243 @@
+"""Headless multi-session server for Bulletstorm Blitz.
+
+Every connection to the server gets its own Game.World. A single asyncio
+scheduler steps all worlds at a fixed tick rate and, after each tick,
+sends every client a snapshot of its world.
+
+Wire protocol (TCP, localhost by default):
+    client -> server: one byte per input change, a bitmask of the
+                      INPUT_* flags below. SHOOT is latched until the next
+                      tick; the other flags stay held until changed.
+    server -> client: frames of a 4-byte big-endian length followed by
+                      a snapshot.py frame (a keyframe first, then deltas).
+
+Run "python server.py" to serve, or "python server.py --bench" to measure
+how many sessions one core can tick at the target rate.
+"""
+
+import argparse
+import asyncio
+import os
+import struct
+import time
+
+import Game
+from highscores import HighScoreStore
+from snapshot import SnapshotEncoder, SnapshotDecoder
+
+INPUT_LEFT = 1
+INPUT_RIGHT = 2
+INPUT_JUMP = 4
+INPUT_SHOOT = 8
+
+TICK_RATE = Game.FPS
+MAX_BUFFERED = 64 * 1024  # skip snapshots for clients this far behind
+
+_FRAME_HEADER = struct.Struct(">I")
+
+
+def controls_from_mask(mask):
+    return Game.Controls(bool(mask & INPUT_LEFT), bool(mask & INPUT_RIGHT),
+                         bool(mask & INPUT_JUMP), bool(mask & INPUT_SHOOT))
+
+
+def mask_from_controls(controls):
+    return ((INPUT_LEFT if controls.left else 0) |
+            (INPUT_RIGHT if controls.right else 0) |
+            (INPUT_JUMP if controls.jump else 0) |
+            (INPUT_SHOOT if controls.shoot else 0))
+
+
+class Session:
+    """One player's isolated world plus the input it is currently giving."""
+
+    def __init__(self, session_id, seed=None, scores=None):
+        self.id = session_id
+        self.world = Game.World(seed, scores, "session-%d" % session_id, effects=False)
+        self.mask = 0
+        self.writer = None
+        self.encoder = SnapshotEncoder()
+
+    def set_input(self, mask):
+        # Keep a shot pending until the tick that consumes it
+        self.mask = mask | (self.mask & INPUT_SHOOT)
+
+    def step(self, tick_ms):
+        controls = controls_from_mask(self.mask)
+        self.mask &= ~INPUT_SHOOT
+        self.world.step(controls, self.world.time + tick_ms)
+
+
+class GameServer:
+    def __init__(self, tick_rate=TICK_RATE, scores=None):
+        self.tick_rate = tick_rate
+        self.scores = scores  # HighScoreStore shared by all sessions
+        self.tick_ms = 1000 / tick_rate
+        self.sessions = {}
+        self.next_id = 1
+        self.running = False
+        self.ticks = 0
+
+    def add_session(self, seed=None):
+        session = Session(self.next_id, seed, self.scores)
+        self.next_id += 1
+        self.sessions[session.id] = session
+        return session
+
+    def remove_session(self, session):
+        session.world.record_score()
+        self.sessions.pop(session.id, None)
+
+    def tick(self):
+        """Step every session once and send out the new snapshots."""
+        for session in list(self.sessions.values()):
+            session.step(self.tick_ms)
+            writer = session.writer
+            if writer is None or writer.is_closing():
+                continue
+            if writer.transport.get_write_buffer_size() > MAX_BUFFERED:
+                continue
+            payload = session.encoder.encode(session.world)
+            writer.write(_FRAME_HEADER.pack(len(payload)) + payload)
+        self.ticks += 1
+
+    async def run(self):
+        """Tick at a fixed rate until stop() is called. If a tick overruns,
+        the schedule restarts from now rather than trying to catch up."""
+        loop = asyncio.get_running_loop()
+        interval = 1 / self.tick_rate
+        next_tick = loop.time()
+        self.running = True
+        while self.running:
+            self.tick()
+            next_tick += interval
+            delay = next_tick - loop.time()
+            if delay < 0:
+                next_tick = loop.time()
+                delay = 0
+            await asyncio.sleep(delay)
+
+    def stop(self):
+        self.running = False
+
+    async def handle_client(self, reader, writer):
+        session = self.add_session()
+        session.writer = writer
+        try:
+            while True:
+                data = await reader.read(64)
+                if not data:
+                    break
+                for mask in data:
+                    session.set_input(mask)
+        except ConnectionError:
+            pass
+        finally:
+            self.remove_session(session)
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        server = await asyncio.start_server(self.handle_client, host, port)
+        async with server:
+            await self.run()
+
+
+class LoopbackClient:
+    """Minimal client for tests: sends inputs and reads snapshots."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.decoder = SnapshotDecoder()
+
+    @classmethod
+    async def connect(cls, host="127.0.0.1", port=8765):
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def send(self, controls):
+        self.writer.write(bytes([mask_from_controls(controls)]))
+        await self.writer.drain()
+
+    async def snapshot(self):
+        header = await self.reader.readexactly(_FRAME_HEADER.size)
+        (length,) = _FRAME_HEADER.unpack(header)
+        return self.decoder.decode(await self.reader.readexactly(length))
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+def benchmark(sessions=200, ticks=300):
+    """Tick sessions with random input and report how many sessions one
+    core could keep at TICK_RATE. Prints and returns that number."""
+    server = GameServer()
+    for i in range(sessions):
+        server.add_session(seed=i)
+    start = time.perf_counter()
+    for t in range(ticks):
+        for session in server.sessions.values():
+            session.set_input(session.world.rng.randrange(16))
+        server.tick()
+    elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    size = 0
+    for session in server.sessions.values():
+        size += len(session.encoder.encode(session.world))
+    encode_time = time.perf_counter() - start
+
+    per_session_tick = elapsed / (sessions * ticks)
+    per_core = int(1 / (per_session_tick * TICK_RATE))
+    print(f"{sessions} sessions x {ticks} ticks in {elapsed:.2f}s: "
+          f"{per_session_tick * 1e6:.1f} us per session-tick")
+    print(f"snapshot encode {encode_time / sessions * 1e6:.1f} us, "
+          f"{size / sessions:.0f} bytes per session")
+    print(f"~{per_core} sessions per core at {TICK_RATE} ticks/s")
+    return per_core
+
+
+async def _loopback_demo(port):
+    server = GameServer()
+    serving = asyncio.ensure_future(server.serve(port=port))
+    await asyncio.sleep(0.1)
+    client = await LoopbackClient.connect(port=port)
+    await client.send(Game.Controls(right=True, shoot=True))
+    for _ in range(10):
+        state = await client.snapshot()
+    player = state["player"]
+    print(f"session ticked to t={state['time']}ms, level {player['level']}, "
+          f"{len(state['enemies'])} enemies, player at ({player['x']}, {player['y']})")
+    await client.close()
+    server.stop()
+    await serving
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rate", type=int, default=TICK_RATE, help="ticks per second")
+    parser.add_argument("--bench", action="store_true", help="run the sessions-per-core benchmark")
+    parser.add_argument("--sessions", type=int, default=200, help="sessions for --bench")
+    parser.add_argument("--loopback", action="store_true", help="serve and connect a test client")
+    parser.add_argument("--scores", help="high-score database shared by all sessions")
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark(args.sessions)
+    elif args.loopback:
+        asyncio.run(_loopback_demo(args.port))
+    else:
+        scores = HighScoreStore(args.scores) if args.scores else None
+        try:
+            asyncio.run(GameServer(args.rate, scores).serve(args.host, args.port))
+        finally:
+            if scores:
+                scores.close()
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    main()
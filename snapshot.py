@@ -0,0 +1,361 @@
+"""Compact binary snapshots of a Game.World.
+
+A frame is either a keyframe, holding the whole world, or a delta against
+the previous frame from the same encoder. Entities are identified by a
+16-bit id, stored on the sprite as net_id the first time it is encoded.
+Each world has its own ids, handed out in turn and skipping those in use,
+so a freed id comes round again only after 65535 others. Positions are
+quantized to 1/POSITION_SCALE of a pixel and clamped to +-8191 pixels;
+times are sent as milliseconds modulo 65536. The score and the multiplier
+saturate at the largest value their fields hold.
+
+Layout (little-endian):
+    header   kind (B), time (I), base time (I)
+    player   one fixed record, see PLAYER_FORMAT
+    sections enemies, bullets and powerups, in that order
+
+A keyframe section is a count (H) followed by column arrays: the ids and
+then one array per field. A delta section has three parts, each a count
+and columns: removed ids; ids that only moved a little, with int8 x/y
+deltas; and ids that are new or changed otherwise, with all fields.
+
+Encoding and decoding are plain Python: a frame costs about a microsecond
+per entity to encode and half that to decode. That is well under a
+millisecond for a few hundred entities, but a world of 4000 takes about
+4 ms to encode and 2 ms to decode. Run "python snapshot.py" for encode/decode benchmarks.
+"""
+
+import struct
+import sys
+import time
+import weakref
+from array import array
+
+import Game
+
+KEYFRAME = 0
+DELTA = 1
+
+POSITION_SCALE = 4
+VELOCITY_SCALE = 256
+SPEED_SCALE = 4
+
+HEADER_FORMAT = struct.Struct("<BII")
+# x, y, vel_y, jumps, flags, score, high score, level, multiplier * 2,
+# and the time left on rapid fire, shield and the combo, in ms
+PLAYER_FORMAT = struct.Struct("<hhhBBIIHHHHH")
+COUNT_FORMAT = struct.Struct("<H")
+
+FLAG_RAPID_FIRE = 1
+FLAG_SHIELD = 2
+FLAG_ON_GROUND = 4
+
+# Typecodes of each entity kind's fields. The first two are always x, y.
+SECTIONS = [
+    ("enemies", "hhBBH"),   # x, y, speed, behavior, behavior timer
+    ("bullets", "hhhh"),    # x, y, velocity x, velocity y
+    ("powerups", "hhB"),    # x, y, type
+]
+
+_BEHAVIOR_INDEX = {name: i for i, name in enumerate(Game.BEHAVIORS)}
+_POWERUP_INDEX = {name: i for i, name in enumerate(Game.POWERUP_TYPES)}
+_SWAP = sys.byteorder != "little"
+MAX_ENTITIES = 65536
+_MIN_POSITION = -32768 / POSITION_SCALE  # Pixels, the range of a quantized position
+_MAX_POSITION = 32767 / POSITION_SCALE
+
+
+def _q(value, scale):
+    # Quantize to a scaled int16
+    return max(-32768, min(32767, int(round(value * scale))))
+
+
+def _remaining(deadline, now):
+    return max(0, min(65535, int(deadline - now)))
+
+
+def _u(value, limit):
+    # Clamp to an unsigned field; the score and the team multiplier have no cap
+    return max(0, min(limit, int(value)))
+
+
+def _unwrap(time16, now):
+    # Latest time at or before now whose low 16 bits are time16
+    return now - ((now - time16) & 0xFFFF)
+
+
+class _NetIds:
+    # The entity ids of one world: live holds those seen in use by the
+    # last world_records, plus any handed out since
+    def __init__(self):
+        self.next = 0
+        self.live = set()
+
+    def of(self, sprite):
+        try:
+            return sprite.net_id
+        except AttributeError:
+            pass
+        live = self.live
+        if len(live) >= MAX_ENTITIES:
+            raise ValueError("more than %d entities in the world" % MAX_ENTITIES)
+        uid = self.next
+        while uid in live:
+            uid = (uid + 1) & 0xFFFF
+        self.next = (uid + 1) & 0xFFFF
+        live.add(uid)
+        sprite.net_id = uid
+        return uid
+
+
+_world_ids = weakref.WeakKeyDictionary()  # World -> _NetIds
+
+
+def _column(typecode, values):
+    column = array(typecode, values)
+    if _SWAP:
+        column.byteswap()
+    return column.tobytes()
+
+
+class _Reader:
+    def __init__(self, data):
+        self.data = memoryview(data)
+        self.offset = 0
+
+    def unpack(self, fmt):
+        values = fmt.unpack_from(self.data, self.offset)
+        self.offset += fmt.size
+        return values
+
+    def column(self, typecode, count):
+        column = array(typecode)
+        end = self.offset + count * column.itemsize
+        column.frombytes(self.data[self.offset:end])
+        if _SWAP:
+            column.byteswap()
+        self.offset = end
+        return column
+
+
+def _player_record(player, now):
+    flags = ((FLAG_RAPID_FIRE if player.rapid_fire else 0) |
+             (FLAG_SHIELD if player.shield else 0) |
+             (FLAG_ON_GROUND if player.on_ground else 0))
+    return (_q(player.x, POSITION_SCALE), _q(player.y, POSITION_SCALE),
+            _q(player.vel_y, POSITION_SCALE), player.jumps, flags,
+            _u(player.score, 0xFFFFFFFF), _u(player.high_score, 0xFFFFFFFF),
+            _u(player.level, 0xFFFF), _u(player.multiplier * 2, 0xFFFF),
+            _remaining(player.rapid_fire_timer, now),
+            _remaining(player.shield_timer, now),
+            _remaining(player.combo_timer, now))
+
+
+def world_records(world):
+    """Quantize the world into {section: {id: record}}. The comprehensions
+    are written out per section because this is the encoder's hot path;
+    positions are clamped only when out of range, which is rare. (Converting
+    a column at a time with chains of map() is slower still in CPython,
+    as every stage makes a call per entity.)"""
+    P, V, S = POSITION_SCALE, VELOCITY_SCALE, SPEED_SCALE
+    lo, hi = _MIN_POSITION, _MAX_POSITION
+    behaviors, types = _BEHAVIOR_INDEX, _POWERUP_INDEX
+    ids = _world_ids.get(world)
+    if ids is None:
+        ids = _world_ids[world] = _NetIds()
+    uid = ids.of
+    records = {
+        "enemies": {uid(e): (round(x * P) if lo <= (x := e.x) <= hi else _q(x, P),
+                             round(y * P) if lo <= (y := e.y) <= hi else _q(y, P),
+                             int(e.speed * S), behaviors[e.behavior],
+                             int(e.behavior_timer) & 0xFFFF)
+                    for e in world.enemies_group},
+        "bullets": {uid(b): (round(x * P) if lo <= (x := b.x) <= hi else _q(x, P),
+                             round(y * P) if lo <= (y := b.y) <= hi else _q(y, P),
+                             round(b.velocity_x * V), round(b.velocity_y * V))
+                    for b in world.bullets_group},
+        "powerups": {uid(p): (_q(p.rect.x, P), _q(p.rect.y, P), types[p.type])
+                     for p in world.powerups_group},
+    }
+    ids.live = records["enemies"].keys() | records["bullets"].keys() | records["powerups"].keys()
+    return records
+
+
+class SnapshotEncoder:
+    """Encodes successive ticks of one world for one receiver."""
+
+    def __init__(self, keyframe_interval=120):
+        self.keyframe_interval = keyframe_interval
+        self._previous = None
+        self._previous_time = 0
+        self._since_keyframe = 0
+
+    def force_keyframe(self):
+        """Make the next frame a keyframe, e.g. for a receiver that lost sync."""
+        self._previous = None
+
+    def encode(self, world, records=None):
+        """Encode the next frame of world. records, if given, is what
+        world_records(world) returned this tick, perhaps cut down to the
+        entities the receiver is interested in."""
+        if records is None:
+            records = world_records(world)
+        now = int(world.time)
+        keyframe = (self._previous is None or
+                    self._since_keyframe >= self.keyframe_interval)
+        out = [HEADER_FORMAT.pack(KEYFRAME if keyframe else DELTA, now, self._previous_time),
+               PLAYER_FORMAT.pack(*_player_record(world.player, now))]
+        for name, typecodes in SECTIONS:
+            if keyframe:
+                self._encode_full(out, typecodes, records[name])
+            else:
+                self._encode_delta(out, typecodes, records[name], self._previous[name])
+        self._since_keyframe = 0 if keyframe else self._since_keyframe + 1
+        self._previous = records
+        self._previous_time = now
+        return b"".join(out)
+
+    def _encode_full(self, out, typecodes, rows):
+        ids = list(rows)
+        out.append(COUNT_FORMAT.pack(len(ids)))
+        out.append(_column("H", ids))
+        values = list(rows.values())
+        for i, typecode in enumerate(typecodes):
+            out.append(_column(typecode, [row[i] for row in values]))
+
+    def _encode_delta(self, out, typecodes, rows, previous):
+        removed = [uid for uid in previous if uid not in rows]
+        moved = []
+        changed = {}
+        for uid, row in rows.items():
+            old = previous.get(uid)
+            if old == row:
+                continue
+            if old is not None and old[2:] == row[2:]:
+                dx, dy = row[0] - old[0], row[1] - old[1]
+                if -128 <= dx <= 127 and -128 <= dy <= 127:
+                    moved.append((uid, dx, dy))
+                    continue
+            changed[uid] = row
+        out.append(COUNT_FORMAT.pack(len(removed)))
+        out.append(_column("H", removed))
+        out.append(COUNT_FORMAT.pack(len(moved)))
+        out.append(_column("H", [m[0] for m in moved]))
+        out.append(_column("b", [m[1] for m in moved]))
+        out.append(_column("b", [m[2] for m in moved]))
+        self._encode_full(out, typecodes, changed)
+
+
+class SnapshotDecoder:
+    """Rebuilds the world state from the frames of one SnapshotEncoder."""
+
+    def __init__(self):
+        self.time = None
+        self.records = None
+
+    def decode(self, data):
+        """Apply a frame and return the resulting state, see state()."""
+        reader = _Reader(data)
+        kind, now, base = reader.unpack(HEADER_FORMAT)
+        if kind == DELTA and (self.records is None or base != self.time):
+            raise ValueError("delta frame for base time %d, have %r" % (base, self.time))
+        player = reader.unpack(PLAYER_FORMAT)
+        records = {}
+        for name, typecodes in SECTIONS:
+            if kind == KEYFRAME:
+                records[name] = self._decode_full(reader, typecodes)
+            else:
+                rows = dict(self.records[name])
+                for uid in reader.column("H", reader.unpack(COUNT_FORMAT)[0]):
+                    del rows[uid]
+                count = reader.unpack(COUNT_FORMAT)[0]
+                ids = reader.column("H", count)
+                dxs = reader.column("b", count)
+                dys = reader.column("b", count)
+                for uid, dx, dy in zip(ids, dxs, dys):
+                    row = rows[uid]
+                    rows[uid] = (row[0] + dx, row[1] + dy) + row[2:]
+                rows.update(self._decode_full(reader, typecodes))
+                records[name] = rows
+        self.time = now
+        self.player = player
+        self.records = records
+        return self.state()
+
+    def _decode_full(self, reader, typecodes):
+        count = reader.unpack(COUNT_FORMAT)[0]
+        ids = reader.column("H", count)
+        columns = [reader.column(typecode, count) for typecode in typecodes]
+        return dict(zip(ids, zip(*columns)))
+
+    def state(self):
+        """Return the current state as plain data, dequantized."""
+        (x, y, vel_y, jumps, flags, score, high_score, level, multiplier,
+         rapid_fire_left, shield_left, combo_left) = self.player
+        s = float(POSITION_SCALE)
+        return {
+            "time": self.time,
+            "player": {
+                "x": x / s, "y": y / s, "vel_y": vel_y / s, "jumps": jumps,
+                "on_ground": bool(flags & FLAG_ON_GROUND),
+                "rapid_fire": bool(flags & FLAG_RAPID_FIRE),
+                "shield": bool(flags & FLAG_SHIELD),
+                "score": score, "high_score": high_score, "level": level,
+                "multiplier": multiplier / 2.0,
+                "rapid_fire_left": rapid_fire_left, "shield_left": shield_left,
+                "combo_left": combo_left,
+            },
+            "enemies": {uid: (r[0] / s, r[1] / s, r[2] / float(SPEED_SCALE), Game.BEHAVIORS[r[3]],
+                              _unwrap(r[4], self.time))
+                        for uid, r in self.records["enemies"].items()},
+            "bullets": {uid: (r[0] / s, r[1] / s, r[2] / float(VELOCITY_SCALE),
+                              r[3] / float(VELOCITY_SCALE))
+                        for uid, r in self.records["bullets"].items()},
+            "powerups": {uid: (r[0] / s, r[1] / s, Game.POWERUP_TYPES[r[2]])
+                         for uid, r in self.records["powerups"].items()},
+        }
+
+
+def benchmark(enemies=2000, bullets=2000, ticks=100):
+    """Time encode and decode of a crowded world, keyframes and deltas."""
+    world = Game.World(seed=1)
+    world.new_level()
+    for _ in range(enemies):
+        world.enemies_group.add(Game.Enemy(world.player, world.rng, world.time,
+                                           timers=world.timers))
+    for _ in range(bullets):
+        x = world.rng.randint(0, Game.SCREEN_WIDTH)
+        y = world.rng.randint(0, Game.SCREEN_HEIGHT)
+        world.bullets_group.add(Game.Bullet(x, y, ()))
+    encoder = SnapshotEncoder(keyframe_interval=ticks)
+    decoder = SnapshotDecoder()
+
+    frames = []
+    encode_time = decode_time = 0.0
+    for tick in range(ticks):
+        # Move things without the game rules, so the entity count holds
+        world.time += 1000 / Game.FPS
+        world.enemies_group.update(world.time)
+        for bullet in world.bullets_group:
+            bullet.x += bullet.velocity_x
+            bullet.y += bullet.velocity_y
+        start = time.perf_counter()
+        frame = encoder.encode(world)
+        encode_time += time.perf_counter() - start
+        start = time.perf_counter()
+        decoder.decode(frame)
+        decode_time += time.perf_counter() - start
+        frames.append(len(frame))
+
+    entities = enemies + bullets
+    print(f"{entities} entities: keyframe {frames[0]} bytes, "
+          f"delta {sum(frames[1:]) / (ticks - 1):.0f} bytes on average")
+    print(f"encode {encode_time / ticks * 1e3:.2f} ms, decode {decode_time / ticks * 1e3:.2f} ms per frame, "
+          f"{(encode_time + decode_time) / ticks / entities * 1e6:.2f} us per entity")
+
+
+if __name__ == "__main__":
+    import os
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    benchmark()
+    benchmark(enemies=200, bullets=100)
@@ -0,0 +1,459 @@
+"""Spectator streaming for Bulletstorm Blitz watch-along sessions.
+
+A Broadcaster streams one running Game.World to any number of passive
+viewers as snapshot.py frames, each viewer seeing only a region of the
+arena and getting frames as fast as its connection keeps up with.
+
+Interest management: the arena is split into columns Game.CHUNK_SIZE wide
+(it is one screen tall). A viewer's view, widened by MARGIN on each side,
+is rounded out to whole columns, and only the enemies, bullets and
+power-ups in those columns are sent to it, along with the player.
+
+Fan-out: viewers watching the same columns at the same rate share a
+Channel, which encodes each frame once, with its own SnapshotEncoder, and
+sends the same bytes to all of them. The world is quantized once per tick
+(snapshot.world_records) and bucketed by column for all channels, so the
+encoding work per tick depends on how many distinct channels there are,
+not on how many viewers.
+
+Adaptive rate: a viewer starts at a frame every tick. When more than
+SLOW_BYTES are waiting to go out to it, it drops to the next of RATES (a
+frame every 2, 3 or 6 ticks); after RECOVER frames in a row with less
+than FAST_BYTES waiting it climbs back one step. A viewer with more than
+MAX_BUFFERED waiting misses frames altogether. Either way it has lost the
+base the next delta needs, so it is sent a keyframe instead; those too
+are encoded once per channel and tick, for everyone who needs one.
+
+Transports need send(message) and buffered, the bytes not yet sent, like
+a browser WebSocket's bufferedAmount. LocalWebSocket stands in for the
+server end of a viewer's WebSocket: it wraps each message in an RFC 6455
+binary frame and lets the frames out at a set bandwidth on a clock the
+caller controls, optionally decoding what arrives as the viewer would.
+
+Run "python spectate.py" for the load test, which streams a busy world to
+viewers on a mix of connections, checks what sampled viewers see against
+the world, and reports how many viewers one core could serve.
+"""
+
+import argparse
+import os
+import random
+import struct
+import time
+from collections import deque
+
+import pygame
+
+import Game
+from snapshot import KEYFRAME, POSITION_SCALE, SnapshotDecoder, SnapshotEncoder, world_records
+
+RATES = (1, 2, 3, 6)   # ticks per frame
+MARGIN = 100           # px round the view
+COLUMN_WIDTH = Game.CHUNK_SIZE
+COLUMNS = -(-Game.WORLD_WIDTH // COLUMN_WIDTH)
+SLOW_BYTES = 16 * 1024
+FAST_BYTES = 2 * 1024
+RECOVER = 120          # frames
+HOLD = 10              # frames after slowing down before slowing again
+MAX_BUFFERED = 64 * 1024  # As server.MAX_BUFFERED
+TICK_MS = 1000 / Game.FPS
+
+SECTION_NAMES = ("enemies", "bullets", "powerups")
+
+
+def view_columns(view):
+    """The first and last arena columns a view (a Rect in the world) needs."""
+    first = max(0, (view.left - MARGIN) // COLUMN_WIDTH)
+    last = min(COLUMNS - 1, (view.right + MARGIN - 1) // COLUMN_WIDTH)
+    return first, last
+
+
+def bucket_records(records):
+    """Split world_records output into one {section: {id: record}} per column."""
+    width = COLUMN_WIDTH * POSITION_SCALE
+    top = COLUMNS - 1
+    buckets = [{name: {} for name in SECTION_NAMES} for _ in range(COLUMNS)]
+    for name in SECTION_NAMES:
+        for uid, record in records[name].items():
+            column = min(max(record[0] // width, 0), top)
+            buckets[column][name][uid] = record
+    return buckets
+
+
+class Viewer:
+    """One spectator: its transport, what it is watching and how often."""
+
+    def __init__(self, transport, view):
+        self.transport = transport
+        self.view = pygame.Rect(view)
+        self.rate_index = 0
+        self.channel = None
+        self.synced = False     # has the channel's last frame, so its deltas apply
+        self.calm = 0           # frames in a row with little waiting
+        self.since_change = 0   # frames since the rate changed
+        self.frames = 0
+        self.keyframes = 0
+        self.skipped = 0
+
+    @property
+    def rate(self):
+        return RATES[self.rate_index]
+
+    def adapt(self):
+        # Choose the rate for the frames to come; True if it changed
+        buffered = self.transport.buffered
+        self.since_change += 1
+        if buffered > SLOW_BYTES:
+            self.calm = 0
+            if self.rate_index < len(RATES) - 1 and self.since_change > HOLD:
+                self.rate_index += 1
+                self.since_change = 0
+                return True
+        elif buffered < FAST_BYTES:
+            self.calm += 1
+            if self.rate_index > 0 and self.calm >= RECOVER:
+                self.rate_index -= 1
+                self.calm = self.since_change = 0
+                return True
+        else:
+            self.calm = 0
+        return False
+
+
+class Channel:
+    """The viewers that watch the same columns at the same rate."""
+
+    def __init__(self, columns, rate):
+        self.columns = columns
+        self.rate = rate
+        self.encoder = SnapshotEncoder()
+        self.viewers = []
+
+    def records(self, buckets):
+        first, last = self.columns
+        if first == last:
+            return buckets[first]
+        region = {name: {} for name in SECTION_NAMES}
+        for column in buckets[first:last + 1]:
+            for name in SECTION_NAMES:
+                region[name].update(column[name])
+        return region
+
+
+class Broadcaster:
+    """Streams one world to its viewers; call tick() after every World.step."""
+
+    def __init__(self, world):
+        self.world = world
+        self.viewers = []
+        self.channels = {}  # (columns, rate) -> Channel
+        self.ticks = 0
+        # Stats
+        self.encodes = 0
+        self.frames_sent = 0
+        self.bytes_sent = 0
+
+    def add_viewer(self, transport, view):
+        """Start streaming to transport what is in view, a Rect in the world."""
+        viewer = Viewer(transport, view)
+        self.viewers.append(viewer)
+        self._assign(viewer)
+        return viewer
+
+    def remove_viewer(self, viewer):
+        self.viewers.remove(viewer)
+        self._leave(viewer)
+
+    def watch(self, viewer, view):
+        """Point viewer at another part of the arena."""
+        viewer.view = pygame.Rect(view)
+        if view_columns(viewer.view) != viewer.channel.columns:
+            self._assign(viewer)
+
+    def _assign(self, viewer):
+        # Move viewer to the channel for its view and rate
+        if viewer.channel is not None:
+            self._leave(viewer)
+        key = (view_columns(viewer.view), viewer.rate)
+        channel = self.channels.get(key)
+        if channel is None:
+            channel = self.channels[key] = Channel(*key)
+        channel.viewers.append(viewer)
+        viewer.channel = channel
+        viewer.synced = False
+
+    def _leave(self, viewer):
+        channel = viewer.channel
+        channel.viewers.remove(viewer)
+        if not channel.viewers:
+            del self.channels[channel.columns, channel.rate]
+        viewer.channel = None
+
+    def tick(self):
+        """Send the frames due this tick."""
+        self.ticks += 1
+        due = [channel for channel in self.channels.values() if self.ticks % channel.rate == 0]
+        if not due:
+            return
+        world = self.world
+        buckets = bucket_records(world_records(world))
+        changed = []
+        for channel in due:
+            records = channel.records(buckets)
+            frame = channel.encoder.encode(world, records)
+            keyframe = frame if frame[0] == KEYFRAME else None
+            self.encodes += 1
+            for viewer in channel.viewers:
+                transport = viewer.transport
+                if transport.buffered > MAX_BUFFERED:
+                    viewer.synced = False
+                    viewer.skipped += 1
+                elif viewer.synced:
+                    transport.send(frame)
+                    viewer.frames += 1
+                    self.frames_sent += 1
+                    self.bytes_sent += len(frame)
+                else:
+                    if keyframe is None:
+                        keyframe = SnapshotEncoder().encode(world, records)
+                        self.encodes += 1
+                    transport.send(keyframe)
+                    viewer.synced = True
+                    viewer.frames += 1
+                    viewer.keyframes += 1
+                    self.frames_sent += 1
+                    self.bytes_sent += len(keyframe)
+                if viewer.adapt():
+                    changed.append(viewer)
+        for viewer in changed:
+            self._assign(viewer)
+
+
+_WS_SHORT = struct.Struct(">BBH")
+_WS_LONG = struct.Struct(">BBQ")
+
+
+def ws_frame(payload):
+    """payload as one unmasked binary WebSocket frame, as a server sends it."""
+    n = len(payload)
+    if n < 126:
+        return bytes((0x82, n)) + payload
+    if n < 65536:
+        return _WS_SHORT.pack(0x82, 126, n) + payload
+    return _WS_LONG.pack(0x82, 127, n) + payload
+
+
+def ws_payload(frame):
+    """The payload of a frame made by ws_frame."""
+    n = frame[1]
+    if n < 126:
+        return frame[2:]
+    if n == 126:
+        return frame[_WS_SHORT.size:]
+    return frame[_WS_LONG.size:]
+
+
+class LocalWebSocket:
+    """Stands in for the server end of one viewer's WebSocket. Frames go
+    out at bandwidth bytes per second of clock() (in ms). With decode, the
+    ones that get through are kept, and receive() decodes them as the
+    viewer would."""
+
+    def __init__(self, bandwidth, clock, decode=False):
+        self.bandwidth = bandwidth
+        self.clock = clock
+        self.queue = deque()
+        self.queued = 0       # bytes in queue
+        self.partial = 0      # bytes of the first frame already sent
+        self.last = clock()
+        self.delivered = 0    # frames
+        self.decoder = SnapshotDecoder() if decode else None
+        self.arrived = []     # frames not yet decoded
+
+    @property
+    def buffered(self):
+        self._drain()
+        return self.queued - self.partial
+
+    def send(self, message):
+        self._drain()
+        frame = ws_frame(message)
+        self.queue.append(frame)
+        self.queued += len(frame)
+
+    def _drain(self):
+        now = self.clock()
+        allowance = (now - self.last) * self.bandwidth / 1000
+        self.last = now
+        queue = self.queue
+        while queue:
+            needed = len(queue[0]) - self.partial
+            if allowance < needed:
+                self.partial += int(allowance)
+                return
+            allowance -= needed
+            frame = queue.popleft()
+            self.queued -= len(frame)
+            self.partial = 0
+            self.delivered += 1
+            if self.decoder:
+                self.arrived.append(frame)
+
+    def receive(self):
+        """Decode the frames that have arrived, returning the states they
+        give, oldest first."""
+        self._drain()
+        states = [self.decoder.decode(ws_payload(frame)) for frame in self.arrived]
+        self.arrived = []
+        return states
+
+
+# Connection mix for the load test: share of viewers, bytes per second
+CONNECTIONS = [
+    (0.70, 2000000),   # broadband
+    (0.20, 250000),    # mobile
+    (0.10, 40000),     # poor
+]
+
+
+def _busy_world(enemies, seed=1):
+    # Enemies all over the arena and a player shooting into them
+    world = Game.World(seed, effects=False)
+    world.player.shield = True  # Without a timer, so it lasts the whole run
+    for _ in range(enemies):
+        enemy = Game.Enemy(world.player, world.rng, world.time, timers=world.timers)
+        enemy.x = world.rng.uniform(0, Game.WORLD_WIDTH - Game.ENEMY_WIDTH)
+        enemy.y = world.rng.uniform(0, Game.WORLD_HEIGHT - 100)
+        enemy.rect.topleft = (round(enemy.x), round(enemy.y))
+        world.enemies_group.add(enemy)
+    return world
+
+
+def _in_view(world, columns):
+    # Ids of the entities a viewer of columns should have, worked out from
+    # the sprites rather than from world_records
+    first, last = columns
+    width = COLUMN_WIDTH * POSITION_SCALE
+    def inside(x):
+        return first <= min(max(round(x * POSITION_SCALE) // width, 0), COLUMNS - 1) <= last
+    return {
+        "enemies": {e.net_id for e in world.enemies_group if inside(e.x)},
+        "bullets": {b.net_id for b in world.bullets_group if inside(b.x)},
+        "powerups": {p.net_id for p in world.powerups_group if inside(p.rect.x)},
+    }
+
+
+def load_test(viewers=1000, ticks=600, enemies=300, sample=20, seed=1):
+    """Stream a busy world to viewers for ticks and return
+    (broadcast ms per tick, world step ms per tick, broadcaster)."""
+    rng = random.Random(seed)
+    now = 0.0
+    clock = lambda: now
+    world = _busy_world(enemies, seed)
+    broadcaster = Broadcaster(world)
+    sampled = []
+    for i in range(viewers):
+        pick, bandwidth = rng.random(), CONNECTIONS[-1][1]
+        for share, speed in CONNECTIONS:
+            if pick < share:
+                bandwidth = speed
+                break
+            pick -= share
+        transport = LocalWebSocket(bandwidth, clock, decode=i < sample)
+        # Most viewers follow the player; the rest watch somewhere else
+        x = rng.uniform(0, Game.WORLD_WIDTH - Game.SCREEN_WIDTH) if rng.random() < 0.3 else None
+        viewer = broadcaster.add_viewer(transport, (x or 0, 0, Game.SCREEN_WIDTH, Game.SCREEN_HEIGHT))
+        viewer.follows = x is None
+        if i < sample:
+            sampled.append(viewer)
+
+    controls = Game.Controls(shoot=True)
+    step_time = broadcast_time = 0.0
+    expected = {}  # (sampled viewer, frame time) -> what its frame should hold
+    checked = 0
+    for tick in range(ticks):
+        now = (tick + 1) * TICK_MS
+        start = time.perf_counter()
+        world.step(controls, now)
+        step_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        view = Game.view_rect(world.player.rect.center)
+        for viewer in broadcaster.viewers:
+            if viewer.follows and view.x != viewer.view.x:
+                broadcaster.watch(viewer, view)
+        broadcaster.tick()
+        broadcast_time += time.perf_counter() - start
+
+        # Whatever sampled viewers have received by now must match the
+        # world as it was when it was sent
+        for viewer in sampled:
+            for state in viewer.transport.receive():
+                in_view = expected.pop((viewer, state["time"]), None)
+                if in_view is None:
+                    continue  # Sent before the viewer was synced
+                for name in SECTION_NAMES:
+                    if set(state[name]) != in_view[name]:
+                        raise AssertionError("viewer has %d %s, the world had %d in view"
+                                             % (len(state[name]), name, len(in_view[name])))
+                    checked += len(in_view[name])
+            if viewer.synced and broadcaster.ticks % viewer.rate == 0:
+                expected[viewer, int(now)] = _in_view(world, viewer.channel.columns)
+    broadcaster.checked = checked
+    return broadcast_time / ticks * 1000, step_time / ticks * 1000, broadcaster
+
+
+def naive_encode_ms(enemies=300, ticks=120, seed=1):
+    """ms per tick for one viewer with its own encoder of the whole world,
+    as server.py does for players."""
+    world = _busy_world(enemies, seed)
+    encoder = SnapshotEncoder()
+    controls = Game.Controls(shoot=True)
+    elapsed = 0.0
+    for tick in range(ticks):
+        world.step(controls, (tick + 1) * TICK_MS)
+        start = time.perf_counter()
+        encoder.encode(world)
+        elapsed += time.perf_counter() - start
+    return elapsed / ticks * 1000
+
+
+def benchmark(sizes=(200, 2000), ticks=600, enemies=300):
+    """Run the load test at two sizes and work out viewers per core."""
+    results = []
+    for viewers in sizes:
+        broadcast, step, broadcaster = load_test(viewers, ticks, enemies)
+        rates = {}
+        for viewer in broadcaster.viewers:
+            rates[viewer.rate] = rates.get(viewer.rate, 0) + 1
+        print(f"{viewers:5} viewers: broadcast {broadcast:.2f} ms per tick (world step {step:.2f} ms), "
+              f"{len(broadcaster.channels)} channels, "
+              f"{broadcaster.encodes / ticks:.1f} encodes and "
+              f"{broadcaster.bytes_sent / ticks / 1024:.0f} KiB sent per tick; "
+              f"viewers at 1/2/3/6 ticks a frame: {'/'.join(str(rates.get(r, 0)) for r in RATES)}; "
+              f"{broadcaster.checked} entities checked")
+        results.append((viewers, broadcast))
+    # Fixed cost per tick plus a cost per viewer, fitted to the two runs
+    (n1, t1), (n2, t2) = results
+    per_viewer = (t2 - t1) / (n2 - n1)
+    fixed = t1 - per_viewer * n1
+    per_core = int((TICK_MS - fixed) / per_viewer)
+    naive = naive_encode_ms(enemies)
+    print(f"{per_viewer * 1e3:.2f} us per viewer and {fixed:.2f} ms per tick: "
+          f"~{per_core} viewers per core at {Game.FPS} ticks a second, "
+          f"against ~{int(TICK_MS / naive)} encoding the whole world for each ({naive:.2f} ms each)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ticks", type=int, default=600)
+    parser.add_argument("--enemies", type=int, default=300)
+    parser.add_argument("--viewers", type=int, nargs=2, default=(200, 2000),
+                        help="the two load test sizes")
+    args = parser.parse_args()
+    benchmark(args.viewers, args.ticks, args.enemies)
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    main()
@@ -0,0 +1,59 @@
+import os
+import tempfile
+
+import pytest
+
+import Game
+import checkpoint
+
+
+def played_world(seed=1, ticks=200, players=1):
+    world = Game.World(seed, effects=False, players=players)
+    for tick in range(ticks):
+        controls = Game.Controls(shoot=True, left=tick % 60 < 30, jump=tick % 45 == 0)
+        world.step([controls] * players if players > 1 else controls,
+                   (tick + 1) * 1000 / Game.FPS)
+    return world
+
+
+def test_pack_unpack_restore_keeps_the_state():
+    world = played_world()
+    state = world.capture()
+    unpacked = checkpoint.unpack(checkpoint.pack(state))
+    assert unpacked == state._replace(net_ids=())
+    restored = Game.World(effects=False)
+    restored.restore(unpacked)
+    assert restored.capture()._replace(net_ids=()) == unpacked
+
+    # The restored world plays on exactly as the original does
+    for tick in range(200, 300):
+        now = (tick + 1) * 1000 / Game.FPS
+        world.step(Game.Controls(shoot=True), now)
+        restored.step(Game.Controls(shoot=True), now)
+    assert restored.capture()._replace(net_ids=()) == world.capture()._replace(net_ids=())
+
+
+def test_save_and_load_through_a_file():
+    world = played_world(seed=2)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "world.ckpt")
+        checkpoint.save(world, path)
+        loaded = checkpoint.load(Game.World(effects=False), path)
+    assert loaded.capture()._replace(net_ids=()) == world.capture()._replace(net_ids=())
+
+
+def test_co_op_worlds_are_refused():
+    with pytest.raises(ValueError):
+        checkpoint.pack(played_world(ticks=10, players=2).capture())
+
+
+def test_other_files_are_refused():
+    with pytest.raises(ValueError):
+        checkpoint.unpack(b"not a checkpoint at all, but long enough to hold a header")
+
+
+if __name__ == "__main__":
+    test_pack_unpack_restore_keeps_the_state()
+    test_save_and_load_through_a_file()
+    test_co_op_worlds_are_refused()
+    test_other_files_are_refused()
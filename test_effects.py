@@ -0,0 +1,43 @@
+import pygame
+
+from governor import FULL_QUALITY, QUALITY_LEVELS, WINDOW, QualityGovernor
+from particles import GRAVITY, ParticleSystem
+
+
+def test_governor_drops_quality_over_budget_and_restores_it():
+    governor = QualityGovernor(10.0)
+    for _ in range(WINDOW * 3):
+        quality = governor.record(25.0)
+    assert governor.level == 3 and quality == QUALITY_LEVELS[3]
+    for _ in range(2000):
+        quality = governor.record(1.0)
+    assert quality == FULL_QUALITY
+    assert [change[1:3] for change in governor.changes[:3]] == [(0, 1), (1, 2), (2, 3)]
+
+
+def test_particles_expire_after_their_lifetime():
+    system = ParticleSystem(capacity=100, lifetime=600, seed=1)
+    system.emit(10, 10, (255, 0, 0), 0, 30)
+    system.emit(10, 10, (0, 255, 0), 300, 30)
+    system.update(500)
+    assert len(system) == 60
+    system.update(650)
+    assert len(system) == 30
+    system.emit(10, 10, (0, 0, 255), 700, 500)  # More than the ring holds
+    assert len(system) == 100
+
+
+def test_particles_draw_up_to_the_end_of_their_lifetime():
+    surface = pygame.Surface((200, 200))
+    system = ParticleSystem(lifetime=600, seed=1)
+    system.emit(50, 50, (255, 0, 0), 0, 20, speed=0)
+    # Drawn without expiring first, at the very end of the lifetime
+    system.snapshot(0).draw(surface, 600)
+    fallen = GRAVITY / 2 * 600 ** 2
+    assert surface.get_at((50, round(50 + fallen)))[:3] == (255, 0, 0)
+
+
+if __name__ == "__main__":
+    test_governor_drops_quality_over_budget_and_restores_it()
+    test_particles_expire_after_their_lifetime()
+    test_particles_draw_up_to_the_end_of_their_lifetime()
@@ -0,0 +1,58 @@
+import os
+import tempfile
+
+from events import DEATH, EVENT_TYPES, KILL, LEVEL_UP, PICKUP, Event, EventLog, read_events
+
+
+def logged(directory, count, **options):
+    path = os.path.join(directory, "events.log")
+    options.setdefault("batch", 10 ** 6)  # By default only flush() writes
+    log = EventLog(path, interval=60, **options)
+    expected = []
+    for i in range(count):
+        kind = (KILL, PICKUP, DEATH, LEVEL_UP)[i % 4]
+        now, player, x, y, value = i * 16.5, i % 2, float(i % 800), i % 600 + 0.5, i * 100.25
+        log.record(kind, now, player, x, y, value)
+        expected.append(Event(now, EVENT_TYPES[kind], player, x, y, value))
+        if i % 1000 == 999:
+            log.flush()
+    log.close()
+    return path, log, expected
+
+
+def read_all(path, backups):
+    # Oldest backup first, then the live file
+    paths = ["%s.%d" % (path, n) for n in range(backups, 0, -1)] + [path]
+    return [event for p in paths if os.path.exists(p) for event in read_events(p)]
+
+
+def test_read_events_returns_what_was_recorded():
+    with tempfile.TemporaryDirectory() as directory:
+        path, log, expected = logged(directory, 5000, batch=512)
+        assert log.dropped == 0 and log.written == 5000 and not log.errors
+        assert list(read_events(path)) == expected
+
+
+def test_rotation_keeps_every_event_in_order():
+    with tempfile.TemporaryDirectory() as directory:
+        # Each flush writes 1000 events, about 30 KB, and so starts a new file
+        path, log, expected = logged(directory, 4000, max_bytes=20000, backups=5)
+        assert os.path.exists(path + ".3") and not os.path.exists(path + ".5")
+        assert read_all(path, 5) == expected
+
+
+def test_a_full_ring_drops_instead_of_waiting():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "events.log")
+        log = EventLog(path, capacity=64, batch=10 ** 6, interval=60)
+        for i in range(100):
+            log.record(KILL, float(i))
+        assert log.dropped == 36
+        log.close()
+        assert [e.time for e in read_events(path)] == [float(i) for i in range(64)]
+
+
+if __name__ == "__main__":
+    test_read_events_returns_what_was_recorded()
+    test_rotation_keeps_every_event_in_order()
+    test_a_full_ring_drops_instead_of_waiting()
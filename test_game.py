@@ -0,0 +1,119 @@
+import random
+
+import pygame
+
+import Game
+
+
+class Dot(pygame.sprite.Sprite):
+    def __init__(self, x):
+        super().__init__()
+        self.rect = pygame.Rect(x, 0, 10, 10)
+
+
+def test_array_group_behaves_like_a_sprite_group():
+    rng = random.Random(1)
+    dots = [Dot(rng.randrange(Game.WORLD_WIDTH)) for _ in range(200)]
+    for group_type in (Game.ArrayGroup, Game.ChunkedGroup):
+        group, reference = group_type(), pygame.sprite.Group()
+        for step in range(2000):
+            dot = rng.choice(dots)
+            action = rng.randrange(4)
+            if action == 0:
+                group.add(dot)
+                reference.add(dot)
+            elif action == 1:
+                dot.kill()
+            elif action == 2:
+                group.remove(dot)
+                reference.remove(dot)
+            else:
+                # Killing while iterating is allowed, and skips no one
+                seen = []
+                for member in group:
+                    seen.append(member)
+                    if rng.random() < 0.1:
+                        member.kill()
+                assert len(seen) == len(set(seen))
+            assert len(group) == len(reference)
+            assert set(group) == set(reference)
+            assert all((d in group) == (d in reference) for d in dots)
+        # Kills keep the order the survivors joined in
+        survivors = group.sprites()
+        for dot in survivors[::3]:
+            dot.kill()
+        assert group.sprites() == [d for i, d in enumerate(survivors) if i % 3]
+        group.empty()
+        assert not group and not any(group in d.groups() for d in dots)
+
+
+def test_chunked_group_finds_what_is_near():
+    rng = random.Random(2)
+    group = Game.ChunkedGroup(*[Dot(rng.randrange(Game.WORLD_WIDTH)) for _ in range(300)])
+    for dot in group.sprites()[:100]:
+        dot.rect.x = rng.randrange(Game.WORLD_WIDTH)
+    group.moved(group.sprites())
+    for dot in group.sprites()[::5]:
+        dot.kill()
+    view = pygame.Rect(700, 0, 800, 600)
+    near = group.sprites_near(view, 10)
+    assert {d for d in group if d.rect.colliderect(view)} <= set(near)
+    assert near == [d for d in group if d in set(near)]  # In group order
+
+
+def test_timers_run_in_deadline_then_schedule_order():
+    timers = Game.Timers()
+    ran = []
+    timers.schedule(30, ran.append, "c")
+    timers.schedule(10, ran.append, "a")
+    timers.schedule(10, ran.append, "b")
+    cancelled = timers.schedule(20, ran.append, "x")
+    timers.schedule(50, ran.append, "d")
+    timers.cancel(cancelled)
+    timers.run(10)
+    assert ran == []  # Due only once the deadline has passed
+    timers.run(40)
+    assert ran == ["a", "b", "c"]
+    timers.run(100)
+    assert ran == ["a", "b", "c", "d"] and len(timers) == 0
+
+
+def test_sweep_finds_the_first_overlap():
+    rect = pygame.Rect(100, 0, 20, 20)
+    # Straight through: the box touches the rect a quarter of the way
+    assert Game.sweep_rect(0, 10, 400, 10, 4, 4, rect) == (100 - 4) / 400
+    assert Game.sweep_rect(0, 50, 400, 50, 4, 4, rect) is None  # Passes below
+    assert Game.sweep_rect(0, 10, 50, 10, 4, 4, rect) is None   # Stops short
+
+
+def test_fast_bullets_hit_what_they_pass_through():
+    world = Game.World(1, effects=False)
+    near, far = (Game.Enemy(world.player, world.rng, 0) for _ in range(2))
+    for enemy, x in ((near, 200), (far, 100)):
+        enemy.x, enemy.y = x, 300
+        enemy.rect.topleft = (x, 300)
+    enemies = Game.ArrayGroup(near, far)  # Only living sprites are hit
+    bullet = Game.Bullet(50, 315, ())
+    bullet.velocity_x, bullet.velocity_y = 400, 0  # Past both in one tick
+    bullet.update()
+    assert bullet.first_hit(Game.CollisionGrid(enemies)) is far
+
+
+def test_difficulty_keeps_the_old_early_levels_and_stays_bounded():
+    for level in range(1, Game.WAVE_SIZE_KNEE):
+        assert Game.wave_size(level) == Game.MAX_ENEMIES + (level - 1) * Game.ENEMIES_PER_LEVEL
+    for level in range(1, Game.WAVE_SPEED_KNEE):
+        assert Game.wave_speed(level) == Game.ENEMY_SPEED + (level - 1) * Game.SPEED_PER_LEVEL
+    sizes = [Game.wave_size(level) for level in range(1, 200)]
+    speeds = [Game.wave_speed(level) for level in range(1, 200)]
+    assert sizes == sorted(sizes) and sizes[-1] <= Game.MAX_WAVE_SIZE
+    assert speeds == sorted(speeds) and speeds[-1] <= Game.MAX_WAVE_SPEED
+
+
+if __name__ == "__main__":
+    test_array_group_behaves_like_a_sprite_group()
+    test_chunked_group_finds_what_is_near()
+    test_timers_run_in_deadline_then_schedule_order()
+    test_sweep_finds_the_first_overlap()
+    test_fast_bullets_hit_what_they_pass_through()
+    test_difficulty_keeps_the_old_early_levels_and_stays_bounded()
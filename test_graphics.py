@@ -0,0 +1,27 @@
+from graphics import GraphicsObject, OffscreenGraphWin, Point, Rectangle
+
+
+class Cross(GraphicsObject):
+    # A user-defined object with a _draw method but no _coords
+    def __init__(self, center):
+        GraphicsObject.__init__(self, ["outline", "width"])
+        self.center = center
+
+    def _draw(self, canvas, options):
+        x, y = canvas.toScreen(self.center.x, self.center.y)
+        return canvas.create_line(x - 5, y - 5, x + 5, y + 5, options)
+
+
+def test_setCoords_redraws_objects_without_coords():
+    win = OffscreenGraphWin("test", 100, 100)
+    cross = Cross(Point(50, 50)).draw(win)
+    box = Rectangle(Point(10, 10), Point(20, 20)).draw(win)
+    win.setCoords(0, 0, 200, 200)
+    assert cross.canvas is win and cross in win.items
+    assert win.objectsAt(Point(50, 50)) == [cross]
+    assert win.objectsAt(Point(15, 15)) == [box]
+    win.close()
+
+
+if __name__ == "__main__":
+    test_setCoords_redraws_objects_without_coords()
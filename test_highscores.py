@@ -0,0 +1,51 @@
+import os
+import random
+import tempfile
+
+from highscores import HighScoreStore
+
+
+def test_top_matches_the_database():
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "scores.db")
+        store = HighScoreStore(path, batch_interval=0.01, top_kept=20)
+        for i in range(500):
+            store.record("p%d" % rng.randrange(50), rng.randrange(100000), rng.randrange(1, 30))
+        kept = store.top(20)
+        assert len(kept) == 20
+        assert [row[1] for row in kept] == sorted((row[1] for row in kept), reverse=True)
+        assert store.top(50)[:20] == kept  # Past top_kept, read from the database
+        store.close()
+
+        reopened = HighScoreStore(path, top_kept=20)
+        assert reopened.top(20) == kept
+        reopened.close()
+
+
+def test_best_is_right_for_cached_and_evicted_players():
+    rng = random.Random(2)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "scores.db")
+        store = HighScoreStore(path, batch_interval=0.01, best_kept=8)
+        best = {}
+        for i in range(2000):
+            player = "p%d" % rng.randrange(40)
+            score = rng.randrange(100000)
+            store.record(player, score, 1)
+            best[player] = max(score, best.get(player, 0))
+            if i == 1000:
+                store.flush()
+            if i % 50 == 0:
+                # Whether or not the writer has committed the scores yet
+                asked = "p%d" % rng.randrange(40)
+                assert store.best(asked) == best.get(asked, 0)
+        assert len(store._best) <= 8
+        assert all(store.best(player) == score for player, score in best.items())
+        assert store.best("nobody") == 0
+        store.close()
+
+
+if __name__ == "__main__":
+    test_top_matches_the_database()
+    test_best_is_right_for_cached_and_evicted_players()
@@ -0,0 +1,22 @@
+import Game
+from rollback import run_match
+from server import controls_from_mask, mask_from_controls
+
+
+def test_sessions_agree_over_a_lossy_link():
+    sessions, in_sync = run_match(ticks=300, latency=40, jitter=60, loss=0.1, seed=3)
+    assert in_sync
+    assert sessions[0].world.capture() == sessions[1].world.capture()
+    assert sum(s.rollbacks for s in sessions) > 0
+
+
+def test_input_masks_round_trip():
+    for mask in range(16):
+        controls = controls_from_mask(mask)
+        assert isinstance(controls, Game.Controls)
+        assert mask_from_controls(controls) == mask
+
+
+if __name__ == "__main__":
+    test_sessions_agree_over_a_lossy_link()
+    test_input_masks_round_trip()
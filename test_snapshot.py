@@ -0,0 +1,54 @@
+import Game
+from snapshot import DELTA, KEYFRAME, SnapshotDecoder, SnapshotEncoder, world_records
+
+
+def busy_world(seed=1, enemies=50):
+    world = Game.World(seed, effects=False)
+    world.new_level()
+    for _ in range(enemies):
+        world.enemies_group.add(Game.Enemy(world.player, world.rng, world.time,
+                                           timers=world.timers))
+    return world
+
+
+def test_frames_decode_to_the_world_records():
+    world = busy_world()
+    encoder = SnapshotEncoder(keyframe_interval=30)
+    decoder = SnapshotDecoder()
+    kinds = set()
+    for tick in range(90):
+        controls = Game.Controls(shoot=True, right=tick % 40 < 20, jump=tick % 25 == 0)
+        world.step(controls, (tick + 1) * 1000 / Game.FPS)
+        records = world_records(world)
+        frame = encoder.encode(world, records)
+        kinds.add(frame[0])
+        decoder.decode(frame)
+        assert decoder.records == records
+        assert decoder.time == int(world.time)
+    assert kinds == {KEYFRAME, DELTA}
+
+
+def test_entity_ids_are_unique_and_kept():
+    world = busy_world()
+    records = world_records(world)
+    ids = [uid for name in records for uid in records[name]]
+    assert len(ids) == len(set(ids))
+    assert world_records(world) == records
+
+
+def test_out_of_range_values_saturate():
+    world = busy_world(enemies=1)
+    enemy = next(iter(world.enemies_group))
+    enemy.x = 1e6
+    world.player.multiplier = 2.0 ** 20
+    world.player.score = 1e12
+    state = SnapshotDecoder().decode(SnapshotEncoder().encode(world))
+    assert state["enemies"][enemy.net_id][0] == 32767 / 4
+    assert state["player"]["multiplier"] == 65535 / 2
+    assert state["player"]["score"] == 0xFFFFFFFF
+
+
+if __name__ == "__main__":
+    test_frames_decode_to_the_world_records()
+    test_entity_ids_are_unique_and_kept()
+    test_out_of_range_values_saturate()